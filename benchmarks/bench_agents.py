@@ -0,0 +1,66 @@
+"""
+Compares the time taken by each Agent implementation to rename every file
+in a synthetic tree of deeply nested directories.
+
+Run from the project root with:
+
+    python -m benchmarks.bench_agents [--files N] [--dirs N] [--depth N]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from pathsub.agents import Agent, DirFdExecutive, Executive, RenameatExecutive
+
+
+def make_tree(root: str, dir_count: int, depth: int, file_count: int) -> list[str]:
+    paths = []
+    for d in range(dir_count):
+        parent = os.path.join(root, *(f"level{n}" for n in range(depth)), f"d{d}")
+        os.makedirs(parent)
+        for f in range(file_count // dir_count):
+            path = os.path.join(parent, f"file{f}.txt")
+            with open(path, "xb"):
+                pass
+            paths.append(path)
+    return paths
+
+
+def time_agent(agent: Agent, paths: list[str]) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        agent.move(path, path + ".renamed")
+    for path in paths:
+        agent.move(path + ".renamed", path)
+    return time.perf_counter() - start
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--files", type=int, default=20000)
+    p.add_argument("--dirs", type=int, default=100)
+    p.add_argument("--depth", type=int, default=12)
+    p.add_argument("--max-open-fds", type=int, default=64)
+    p.add_argument("--dir", default=None, help="Where to create the tree.")
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        paths = make_tree(root, args.dirs, args.depth, args.files)
+        op_count = 2 * len(paths)
+
+        with DirFdExecutive(args.max_open_fds) as dir_fd_executive:
+            agents = [
+                ("Executive", Executive()),
+                ("RenameatExecutive", RenameatExecutive()),
+                ("DirFdExecutive", dir_fd_executive),
+            ]
+            print(f"{op_count} moves, {args.dirs} dirs at depth {args.depth}")
+            for name, agent in agents:
+                elapsed = time_agent(agent, paths)
+                print(f"  {name:<20} {elapsed:8.3f}s  {op_count / elapsed:10.0f} ops/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Measures the per-operation overhead of journaling in HistoryAgent, using an
+Agent that does nothing so only the bookkeeping is timed.
+
+Run from the project root with:
+
+    python -m benchmarks.bench_journal [--ops N] [--dir DIR]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from pathsub.agents import Agent, HistoryAgent
+from pathsub.journal import Journal
+
+
+class NullAgent(Agent):
+    def move(self, src, dest) -> None:
+        pass
+
+    def mkdir(self, path) -> None:
+        pass
+
+    def rmdir(self, path) -> None:
+        pass
+
+
+def time_history(history: HistoryAgent, op_count: int) -> float:
+    src = os.path.join("some", "fairly", "typical", "directory", "file_0001.jpg")
+    dest = os.path.join("some", "fairly", "typical", "directory", "file_0002.jpg")
+
+    start = time.perf_counter()
+    for _ in range(op_count):
+        history.move(src, dest)
+    return time.perf_counter() - start
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--ops", type=int, default=200000)
+    p.add_argument(
+        "--dir",
+        default=None,
+        help="Where to write journals. Use a real disk to include fsync costs.",
+    )
+    args = p.parse_args()
+
+    baseline = time_history(HistoryAgent(NullAgent()), args.ops)
+    print(f"{args.ops} moves")
+    print(f"  {'no journal':<26} {baseline / args.ops * 1e6:8.2f} µs/op")
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as journal_dir:
+        for sync_interval in (1, 100, 1000, 10000):
+            # fsyncing every op is orders of magnitude slower, so time fewer
+            op_count = args.ops if sync_interval > 1 else args.ops // 100
+            journal_path = os.path.join(journal_dir, f"journal{sync_interval}")
+            with Journal(journal_path, sync_interval) as journal:
+                elapsed = time_history(
+                    HistoryAgent(NullAgent(), journal=journal), op_count
+                )
+
+            per_op = elapsed / op_count
+            overhead = per_op - baseline / args.ops
+            label = f"journal, sync every {sync_interval}"
+            print(
+                f"  {label:<26} {per_op * 1e6:8.2f} µs/op"
+                f"  (+{overhead * 1e6:.2f} µs,"
+                f" {os.path.getsize(journal_path) / op_count:.0f} bytes/op)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compares literal substitution through the regex engine with the str-based
+literal fast path, over a synthetic list of paths.
+
+Run from the project root with:
+
+    python -m benchmarks.bench_literal [--paths N] [--hit-ratio R]
+"""
+
+import argparse
+import random
+import time
+
+from pathsub.rules import make_literal_sub, make_pattern, resub_path
+
+
+def make_paths(count: int, hit_ratio: float, needle: str) -> list[str]:
+    rng = random.Random(0)
+    paths = []
+    for n in range(count):
+        name = f"IMG_{n:07}"
+        if rng.random() < hit_ratio:
+            name += needle
+        paths.append(f"photos/{2000 + n % 25}/{n % 12 + 1:02}/{name}.jpg")
+    return paths
+
+
+def time_mapper(map_path, paths: list[str]) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        map_path(path)
+    return time.perf_counter() - start
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--paths", type=int, default=1_000_000)
+    p.add_argument(
+        "--hit-ratio",
+        type=float,
+        default=0.01,
+        help="The fraction of paths that contain the search string.",
+    )
+    args = p.parse_args()
+
+    needle = " (copy)"
+    replacement = ""
+    paths = make_paths(args.paths, args.hit_ratio, needle)
+    print(f"{args.paths} paths, {args.hit_ratio:.0%} containing {needle!r}")
+
+    for ignore_case in (False, True):
+        pattern = make_pattern(needle, True, ignore_case)
+        regex = time_mapper(lambda s: resub_path(pattern, replacement, s), paths)
+        literal = time_mapper(make_literal_sub(needle, replacement, ignore_case), paths)
+
+        label = "ignoring case" if ignore_case else "matching case"
+        print(f"  {label}")
+        print(f"    {'regex':<8} {regex / args.paths * 1e9:8.0f} ns/path")
+        print(
+            f"    {'literal':<8} {literal / args.paths * 1e9:8.0f} ns/path"
+            f"  ({regex / literal:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Measures the peak memory and time taken to build a plan with make_plan and
+with make_compact_plan, over a synthetic list of paths.
+
+Run from the project root with:
+
+    python -m benchmarks.bench_plan [--paths N]
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from collections.abc import Iterator
+
+from pathsub.cli import make_plan
+from pathsub.compactplan import make_compact_plan
+
+
+def iter_paths(count: int) -> Iterator[str]:
+    # Generated as they're needed, like paths read from a file, so the plan
+    # is what holds on to the source paths
+    for n in range(count):
+        yield f"archive/{2000 + n % 25}/{n // 1000 % 100:02}/IMG_{n:08}.jpeg"
+
+
+def map_path(path: str) -> str | None:
+    return path[:-5] + ".jpg" if path.endswith(".jpeg") else None
+
+
+def measure(plan_func, count: int) -> tuple[float, int, int]:
+    # Timed separately, because tracing allocations slows everything down
+    start = time.perf_counter()
+    plan_func(map_path, iter_paths(count))
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    plan = plan_func(map_path, iter_paths(count))
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert not plan.has_conflicts
+    return elapsed, retained, peak
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--paths", type=int, default=1_000_000)
+    args = p.parse_args()
+
+    print(f"{args.paths} moves")
+    for label, plan_func in (
+        ("make_plan", make_plan),
+        ("make_compact_plan", make_compact_plan),
+    ):
+        elapsed, retained, peak = measure(plan_func, args.paths)
+        print(
+            f"  {label:<18} {elapsed:6.2f} s"
+            f"  {retained / args.paths:6.0f} bytes/move retained"
+            f"  {peak / args.paths:6.0f} bytes/move peak"
+        )
+
+
+if __name__ == "__main__":
+    main()
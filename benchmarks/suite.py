@@ -0,0 +1,287 @@
+"""
+Times planning, directory creation, moving and rollback separately, over
+synthetic trees of several shapes, on tmpfs and on disk, and saves the
+results as JSON.
+
+Each scenario runs in a fresh process, so its peak RSS isn't inflated by the
+ones before it. Run from the project root with:
+
+    python -m benchmarks.suite [--files N] [--output FILE] [--baseline FILE]
+
+Pass the JSON from an earlier run as --baseline to see how each phase's
+throughput has changed since.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from pathsub.agents import HistoryAgent, RenameatExecutive
+from pathsub.cli import __version__, make_plan, perform_moves
+from pathsub.fs import DirectoryCache, ensure_dir_for
+from pathsub.output import QuietReporter
+from pathsub.schedule import schedule_moves
+
+# Throughput drops bigger than this, compared to the baseline, are flagged
+REGRESSION_THRESHOLD = 0.1
+
+
+@dataclass(slots=True)
+class Scenario:
+    # Creates the tree's files under a root and returns their paths
+    make_tree: Callable[[str, int, int], list[str]]
+    map_path: Callable[[str], str | None]
+    # Scenarios full of conflicts can be planned but not committed
+    commits: bool = True
+
+
+def _create(path: str):
+    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+
+
+def _create_in(parent: str, names) -> list[str]:
+    os.makedirs(parent, exist_ok=True)
+    paths = [os.path.join(parent, name) for name in names]
+    for path in paths:
+        _create(path)
+    return paths
+
+
+def _rename_suffix(path: str) -> str | None:
+    return path[:-4] + ".txt" if path.endswith(".dat") else None
+
+
+def make_flat(root: str, files: int, depth: int) -> list[str]:
+    return _create_in(root, (f"file{n:08}.dat" for n in range(files)))
+
+
+def make_deep(root: str, files: int, depth: int) -> list[str]:
+    paths = []
+    per_dir = 100
+    for d in range((files + per_dir - 1) // per_dir):
+        parent = os.path.join(root, *(f"level{n}" for n in range(depth)), f"d{d}")
+        count = min(per_dir, files - d * per_dir)
+        paths += _create_in(parent, (f"file{n:04}.dat" for n in range(count)))
+    return paths
+
+
+def make_numbered(root: str, files: int, depth: int) -> list[str]:
+    return _create_in(root, (f"{n:08}.dat" for n in range(files)))
+
+
+def map_collide(path: str) -> str | None:
+    # Every ten files share a target
+    parent, leaf = os.path.split(path)
+    return os.path.join(parent, f"{int(leaf[:8]) // 10:08}.txt")
+
+
+# Files are renamed in cycles of this length, so every move waits on another
+CYCLE_LENGTH = 16
+
+
+def map_cycle(path: str) -> str | None:
+    parent, leaf = os.path.split(path)
+    n = int(leaf[:8])
+    start = n - n % CYCLE_LENGTH
+    return os.path.join(parent, f"{start + (n + 1) % CYCLE_LENGTH:08}.dat")
+
+
+def make_cross_dir(root: str, files: int, depth: int) -> list[str]:
+    paths = []
+    per_dir = 500
+    for d in range((files + per_dir - 1) // per_dir):
+        count = min(per_dir, files - d * per_dir)
+        paths += _create_in(
+            os.path.join(root, "src", f"d{d}"),
+            (f"file{n:04}.dat" for n in range(count)),
+        )
+    return paths
+
+
+def map_cross_dir(path: str) -> str | None:
+    # src/dN/fileM.dat -> dest/dN/M%10/fileM.dat, so new directories are
+    # needed
+    src_dir, leaf = os.path.split(path)
+    root = os.path.dirname(os.path.dirname(src_dir))
+    return os.path.join(root, "dest", os.path.basename(src_dir), leaf[-5], leaf)
+
+
+SCENARIOS = {
+    "flat": Scenario(make_flat, _rename_suffix),
+    "deep": Scenario(make_deep, _rename_suffix),
+    "collisions": Scenario(make_numbered, map_collide, commits=False),
+    "cycles": Scenario(make_numbered, map_cycle),
+    "cross-dir": Scenario(make_cross_dir, map_cross_dir),
+}
+
+
+def _phase(ops: int, elapsed: float) -> dict:
+    return {
+        "ops": ops,
+        "seconds": elapsed,
+        "ops_per_sec": ops / elapsed if elapsed > 0 else None,
+    }
+
+
+def _peak_rss_bytes() -> int | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_scenario(name: str, base_dir: str, files: int, depth: int, jobs: int) -> dict:
+    scenario = SCENARIOS[name]
+    phases = {}
+
+    with tempfile.TemporaryDirectory(dir=base_dir) as root:
+        paths = scenario.make_tree(root, files, depth)
+
+        start = time.perf_counter()
+        plan = make_plan(scenario.map_path, paths)
+        phases["make_plan"] = _phase(len(paths), time.perf_counter() - start)
+
+        if scenario.commits:
+            start = time.perf_counter()
+            schedule = schedule_moves(plan.valid_moves)
+            phases["schedule_moves"] = _phase(
+                len(plan.valid_moves), time.perf_counter() - start
+            )
+
+            dir_cache = DirectoryCache()
+            history = HistoryAgent(RenameatExecutive(copy_jobs=jobs), dir_cache)
+
+            start = time.perf_counter()
+            for _, target_path in schedule.moves:
+                ensure_dir_for(target_path, history, dir_cache)
+            phases["ensure_dir_for"] = _phase(
+                len(schedule.moves), time.perf_counter() - start
+            )
+
+            # The directories now exist and are cached, so this times the
+            # moves themselves
+            start = time.perf_counter()
+            perform_moves(schedule.moves, history, dir_cache, jobs, QuietReporter())
+            phases["perform_moves"] = _phase(
+                len(schedule.moves), time.perf_counter() - start
+            )
+
+            undo_count = history.undo_count
+            start = time.perf_counter()
+            history.rollback(jobs)
+            phases["rollback"] = _phase(undo_count, time.perf_counter() - start)
+
+    return {
+        "moves": len(plan.valid_moves),
+        "conflicts": len(plan.conflicts),
+        "phases": phases,
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+
+
+def default_locations(disk_dir: str) -> dict[str, str]:
+    locations = {}
+    if os.path.isdir("/dev/shm"):
+        locations["tmpfs"] = "/dev/shm"
+    locations["disk"] = disk_dir
+    return locations
+
+
+def compare(results: list[dict], baseline: dict):
+    baseline_ops = {
+        (r["scenario"], r["location"], phase): values["ops_per_sec"]
+        for r in baseline["results"]
+        for phase, values in r["phases"].items()
+    }
+
+    print(f"\nCompared with {baseline['version']} at {baseline['timestamp']}:")
+    for result in results:
+        for phase, values in result["phases"].items():
+            old = baseline_ops.get((result["scenario"], result["location"], phase))
+            new = values["ops_per_sec"]
+            if not old or not new:
+                continue
+            change = new / old - 1
+            flag = "  REGRESSION" if change < -REGRESSION_THRESHOLD else ""
+            label = f"{result['scenario']}/{result['location']}/{phase}"
+            print(f"  {label:<36} {change:+7.1%}{flag}")
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--files", type=int, default=20000)
+    p.add_argument("--depth", type=int, default=8)
+    p.add_argument("--jobs", type=int, default=1)
+    p.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=list(SCENARIOS),
+        default=list(SCENARIOS),
+    )
+    p.add_argument(
+        "--disk-dir",
+        default=os.curdir,
+        help="""
+            Where to create trees for the on-disk runs. The default is the
+            current directory.
+        """,
+    )
+    p.add_argument("--no-tmpfs", action="store_true")
+    p.add_argument("--output", default="benchmark-results.json")
+    p.add_argument("--baseline", help="Results from an earlier run to compare to.")
+    args = p.parse_args()
+
+    locations = default_locations(args.disk_dir)
+    if args.no_tmpfs:
+        locations.pop("tmpfs", None)
+
+    results = []
+    for location, base_dir in locations.items():
+        for name in args.scenarios:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(
+                    run_scenario, name, base_dir, args.files, args.depth, args.jobs
+                ).result()
+            result.update(scenario=name, location=location)
+            results.append(result)
+
+            rss = result["peak_rss_bytes"]
+            rss_text = "" if rss is None else f", peak RSS {rss / (1 << 20):.0f} MiB"
+            print(f"{name} on {location}: {result['moves']} moves{rss_text}")
+            for phase, values in result["phases"].items():
+                print(
+                    f"  {phase:<16} {values['seconds']:8.3f}s"
+                    f"  {values['ops_per_sec'] or 0:10.0f} ops/s"
+                )
+
+    output = {
+        "version": __version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "files": args.files,
+        "depth": args.depth,
+        "jobs": args.jobs,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as writer:
+        json.dump(output, writer, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as reader:
+            compare(results, json.load(reader))
+
+
+if __name__ == "__main__":
+    main()
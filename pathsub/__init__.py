@@ -0,0 +1,25 @@
+# Names are imported from their modules when first used, so that running
+# submv doesn't pay for importing the API
+_EXPORTS = {
+    "CommitResult": "cli",
+    "rename_many": "api",
+    "RenameResult": "api",
+    "Rule": "rules",
+    "__version__": "cli",
+}
+
+__all__ = ["CommitResult", "rename_many", "RenameResult", "Rule", "__version__"]
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+
+    value = getattr(import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
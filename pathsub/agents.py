@@ -1,9 +1,22 @@
+import errno
+import functools
+import heapq
 import os
 import shlex
-import shutil
+import sys
+import threading
 from abc import ABC, abstractmethod
-from collections import deque
+from collections import Counter, deque, OrderedDict
+from collections.abc import Callable, Iterable, Sequence
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from .fs import DirectoryCache, self_and_ancestors
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from .journal import Journal
 
 
 def _q(value):
@@ -22,9 +35,30 @@ class Agent(ABC):
 
 
 class Executive(Agent):
+    """
+    Performs operations for real. Moves to another file system are done by
+    copying, with up to copy_jobs files copied at once when moving a
+    directory.
+    """
+
+    def __init__(self, copy_jobs: int = 1):
+        self.copy_jobs = copy_jobs
+
     def move(self, src, dest) -> None:
         open(dest, "x").close()
-        shutil.move(src, dest)
+        try:
+            os.rename(src, dest)
+        except OSError as os_error:
+            if os_error.errno != errno.EXDEV:
+                import shutil
+
+                shutil.move(src, dest)
+                return
+            os.unlink(dest)
+
+            from .copy import move_across_devices
+
+            move_across_devices(src, dest, self.copy_jobs)
 
     def mkdir(self, path) -> None:
         os.mkdir(path)
@@ -33,6 +67,203 @@ class Executive(Agent):
         os.rmdir(path)
 
 
+_AT_FDCWD = -100
+_RENAME_NOREPLACE = 1
+
+
+@functools.cache
+def _load_renameat2():
+    # Returns the libc renameat2 function, or None if this platform doesn't
+    # have one. Only glibc >= 2.28 and musl >= 1.2.3 export it.
+    if not sys.platform.startswith("linux"):
+        return None
+
+    import ctypes
+
+    try:
+        func = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return None
+
+    func.argtypes = [
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_uint,
+    ]
+    func.restype = ctypes.c_int
+    return func
+
+
+def renameat2_noreplace(
+    src, dest, src_dir_fd: int = _AT_FDCWD, dest_dir_fd: int = _AT_FDCWD
+) -> bool:
+    """
+    Atomically renames src to dest, failing with FileExistsError if dest
+    exists. Returns False without doing anything if renameat2 or
+    RENAME_NOREPLACE isn't supported by the platform, kernel or file system,
+    in which case the caller should fall back to some other method.
+    """
+    renameat2 = _load_renameat2()
+    if renameat2 is None:
+        return False
+
+    import ctypes
+
+    result = renameat2(
+        src_dir_fd,
+        os.fsencode(src),
+        dest_dir_fd,
+        os.fsencode(dest),
+        _RENAME_NOREPLACE,
+    )
+    if result == 0:
+        return True
+
+    err = ctypes.get_errno()
+    if err in (errno.EINVAL, errno.ENOSYS):
+        # ENOSYS: kernel older than 3.15. EINVAL: the file system doesn't
+        # support RENAME_NOREPLACE (or src is an ancestor of dest, which
+        # the fallback will also reject).
+        return False
+
+    raise OSError(err, os.strerror(err), os.fspath(src), None, os.fspath(dest))
+
+
+class RenameatExecutive(Executive):
+    """
+    Moves each file with a single renameat2(RENAME_NOREPLACE) call, which
+    refuses to overwrite an existing target without the placeholder file
+    Executive has to create. Falls back to Executive's behavior where
+    renameat2 isn't available, and copies moves across file systems.
+    """
+
+    def move(self, src, dest) -> None:
+        try:
+            if renameat2_noreplace(src, dest):
+                return
+        except OSError as os_error:
+            if os_error.errno != errno.EXDEV:
+                raise
+
+            from .copy import move_across_devices
+
+            move_across_devices(src, dest, self.copy_jobs)
+            return
+        super().move(src, dest)
+
+
+class DirFdExecutive(Agent):
+    """
+    Performs operations relative to open directory file descriptors, so
+    the kernel only resolves the full path of each parent directory once,
+    rather than once per operation. Descriptors are kept in an LRU cache
+    holding at most max_open_fds entries.
+
+    Call close(), or use this as a context manager, to release the
+    descriptors when finished.
+    """
+
+    def __init__(self, max_open_fds: int = 64):
+        if max_open_fds < 2:
+            # A move can need two directories open at once
+            raise ValueError("max_open_fds must be at least 2")
+        self._max_open_fds = max_open_fds
+        self._dir_fds: OrderedDict[str, int] = OrderedDict()
+        # How many cached descriptors are at or beneath each path, so
+        # moves can tell cheaply whether any need evicting
+        self._covered: Counter[str] = Counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        while self._dir_fds:
+            path, fd = self._dir_fds.popitem()
+            self._release(path, fd)
+
+    @property
+    def open_fd_count(self) -> int:
+        return len(self._dir_fds)
+
+    def move(self, src, dest) -> None:
+        src = os.fspath(src)
+        dest = os.fspath(dest)
+        src_fd, src_leaf = self._resolve(src)
+        dest_fd, dest_leaf = self._resolve(dest)
+
+        try:
+            if not renameat2_noreplace(src_leaf, dest_leaf, src_fd, dest_fd):
+                self._move_with_placeholder(src_fd, src_leaf, dest_fd, dest_leaf)
+        except OSError as os_error:
+            if os_error.errno != errno.EXDEV:
+                # Report the full paths rather than the leaves
+                raise OSError(os_error.errno, os_error.strerror, src, None, dest)
+            Executive().move(src, dest)
+
+        # If src was a directory, any descriptors cached for it or its
+        # descendants are now keyed by the wrong path
+        self._evict_tree(src)
+
+    def mkdir(self, path) -> None:
+        dir_fd, leaf = self._resolve(os.fspath(path))
+        os.mkdir(leaf, dir_fd=dir_fd)
+
+    def rmdir(self, path) -> None:
+        path = os.fspath(path)
+        self._evict_tree(path)
+        dir_fd, leaf = self._resolve(path)
+        os.rmdir(leaf, dir_fd=dir_fd)
+
+    @staticmethod
+    def _move_with_placeholder(src_fd, src_leaf, dest_fd, dest_leaf):
+        # Same approach as Executive: claim the target name first so an
+        # existing file can't be overwritten
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL
+        os.close(os.open(dest_leaf, flags, 0o666, dir_fd=dest_fd))
+        os.rename(src_leaf, dest_leaf, src_dir_fd=src_fd, dst_dir_fd=dest_fd)
+
+    def _resolve(self, path: str) -> tuple[int, str]:
+        parent, leaf = os.path.split(path.rstrip(os.sep) or os.sep)
+        return self._get_dir_fd(parent or os.curdir), leaf
+
+    def _get_dir_fd(self, parent: str) -> int:
+        fd = self._dir_fds.get(parent)
+        if fd is not None:
+            self._dir_fds.move_to_end(parent)
+            return fd
+
+        fd = os.open(parent, os.O_RDONLY | os.O_DIRECTORY)
+        self._dir_fds[parent] = fd
+        self._covered.update(self_and_ancestors(parent))
+        while len(self._dir_fds) > self._max_open_fds:
+            evicted_path, evicted_fd = self._dir_fds.popitem(last=False)
+            self._release(evicted_path, evicted_fd)
+        return fd
+
+    def _release(self, path: str, fd: int):
+        os.close(fd)
+        self._covered.subtract(self_and_ancestors(path))
+        for ancestor in self_and_ancestors(path):
+            if self._covered[ancestor] <= 0:
+                del self._covered[ancestor]
+
+    def _evict_tree(self, path: str):
+        path = path.rstrip(os.sep)
+        if path not in self._covered:
+            # Cheap check for the common case: no cached descriptor is
+            # this path or beneath it
+            return
+        prefix = path + os.sep
+        stale = [key for key in self._dir_fds if key == path or key.startswith(prefix)]
+        for key in stale:
+            self._release(key, self._dir_fds.pop(key))
+
+
 class Operation(ABC):
     @abstractmethod
     def execute(self, agent: Agent) -> None: ...
@@ -40,6 +271,13 @@ class Operation(ABC):
     @abstractmethod
     def get_undo(self) -> "Operation": ...
 
+    @abstractmethod
+    def changed_paths(self) -> tuple[str, ...]:
+        """
+        The paths this operation creates, removes or replaces. The operation
+        also depends on the ancestors of these paths existing.
+        """
+
 
 @dataclass(slots=True)
 class Move(Operation):
@@ -58,6 +296,9 @@ class Move(Operation):
     def get_undo(self):
         return Move(self.dest, self.src)
 
+    def changed_paths(self):
+        return (self.src, self.dest)
+
 
 @dataclass(slots=True)
 class Mkdir(Operation):
@@ -72,6 +313,9 @@ class Mkdir(Operation):
     def get_undo(self):
         return Rmdir(self.path)
 
+    def changed_paths(self):
+        return (self.path,)
+
 
 @dataclass(slots=True)
 class Rmdir(Operation):
@@ -86,6 +330,124 @@ class Rmdir(Operation):
     def get_undo(self):
         return Mkdir(self.path)
 
+    def changed_paths(self):
+        return (self.path,)
+
+
+def find_dependents(ops: Sequence[Operation]) -> list[list[int]]:
+    """
+    Works out which operations must wait for which, if they are to have the
+    same effect as performing them one at a time in order. Returns, for each
+    operation, the indices of the later operations that must wait for it.
+
+    An operation must wait for an earlier one if either changes a path the
+    other changes, or changes one of the other's ancestors - for example a
+    move into a directory must wait for the mkdir that creates it, and an
+    rmdir must wait for all moves out of the directory.
+    """
+    dependents: list[list[int]] = [[] for _ in ops]
+    last_changer: dict[str, int] = {}
+    dependers_since_change: dict[str, list[int]] = {}
+
+    for index, op in enumerate(ops):
+        waits_for = set()
+
+        for path in op.changed_paths():
+            if path in last_changer:
+                waits_for.add(last_changer[path])
+            waits_for.update(dependers_since_change.pop(path, ()))
+            last_changer[path] = index
+
+        for path in op.changed_paths():
+            for ancestor in self_and_ancestors(os.path.dirname(path)):
+                if ancestor in last_changer:
+                    waits_for.add(last_changer[ancestor])
+                dependers_since_change.setdefault(ancestor, []).append(index)
+
+        waits_for.discard(index)
+        for earlier in waits_for:
+            dependents[earlier].append(index)
+
+    return dependents
+
+
+@dataclass(slots=True)
+class ConcurrentOutcome:
+    completed: list[bool]
+    non_critical_errors: list[tuple[str, Exception]]
+    failed_index: int | None = None
+    error: Exception | None = None
+
+
+def execute_concurrently(
+    ops: Sequence[Operation],
+    execute: Callable[[Operation], None],
+    jobs: int,
+) -> ConcurrentOutcome:
+    """
+    Calls execute for each operation using up to jobs threads, starting an
+    operation only once everything it depends on (see find_dependents) is
+    finished. Among operations that are ready, earlier ones start first.
+
+    As in a rollback, an OSError from an Rmdir is collected as non-critical.
+    Any other error stops any more operations from starting, and once those
+    already started finish, is reported in the outcome.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    dependents = find_dependents(ops)
+    waiting_on = [0] * len(ops)
+    for later_indices in dependents:
+        for later in later_indices:
+            waiting_on[later] += 1
+
+    ready = [index for index, count in enumerate(waiting_on) if count == 0]
+    heapq.heapify(ready)
+    outcome = ConcurrentOutcome([False] * len(ops), [])
+    in_flight: dict[Future, int] = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while ready or in_flight:
+            while ready and outcome.error is None and len(in_flight) < jobs:
+                index = heapq.heappop(ready)
+                in_flight[executor.submit(execute, ops[index])] = index
+
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = in_flight.pop(future)
+                error = future.exception()
+                if error is not None:
+                    op = ops[index]
+                    if isinstance(op, Rmdir) and isinstance(error, OSError):
+                        outcome.non_critical_errors.append((op.path, error))
+                    else:
+                        if outcome.error is None:
+                            outcome.failed_index = index
+                            outcome.error = error
+                        continue
+
+                outcome.completed[index] = True
+                for later in dependents[index]:
+                    waiting_on[later] -= 1
+                    if waiting_on[later] == 0:
+                        heapq.heappush(ready, later)
+
+    return outcome
+
+
+def update_dir_cache(dir_cache: DirectoryCache, op: Operation):
+    # Keeps dir_cache in step with an operation that has just been performed
+    if isinstance(op, Mkdir):
+        dir_cache.add(op.path)
+    elif isinstance(op, Rmdir):
+        dir_cache.discard_tree(op.path)
+    elif isinstance(op, Move):
+        # Only does anything if src was a known directory
+        dir_cache.discard_tree(op.src)
+
 
 class RollbackError(Exception):
     def __init__(self, message, remaining_operations: list[Operation]):
@@ -94,9 +456,18 @@ class RollbackError(Exception):
 
 
 class HistoryAgent(Agent):
-    def __init__(self, delegate: Agent):
+    def __init__(
+        self,
+        delegate: Agent,
+        dir_cache: DirectoryCache | None = None,
+        journal: "Journal | None" = None,
+    ):
         self._delegate = delegate
+        self._dir_cache = dir_cache
+        self._journal = journal
         self._undo: deque[Operation] = deque()
+        # Operations can be performed from multiple threads
+        self._lock = threading.Lock()
 
     def move(self, src, dest):
         self._execute_log(Move(src, dest))
@@ -107,15 +478,33 @@ class HistoryAgent(Agent):
     def rmdir(self, path):
         self._execute_log(Rmdir(path))
 
+    @property
+    def undo_count(self) -> int:
+        return len(self._undo)
+
+    def extend_undo(self, undo_ops: Iterable[Operation]):
+        # Adds operations to be performed by rollback, for resuming an
+        # earlier run's rollback. The last one is performed first.
+        self._undo.extend(undo_ops)
+
     def _execute_log(self, op: Operation):
         undo_op = op.get_undo()
+        if self._journal is not None:
+            with self._lock:
+                self._journal.record(op)
         self._execute(op)
-        self._undo.append(undo_op)
+        with self._lock:
+            self._undo.append(undo_op)
 
     def _execute(self, op: Operation):
         op.execute(self._delegate)
+        if self._dir_cache is not None:
+            update_dir_cache(self._dir_cache, op)
+
+    def rollback(self, jobs: int = 1) -> list[tuple[str, Exception]]:
+        if jobs > 1:
+            return self._rollback_concurrently(jobs)
 
-    def rollback(self) -> list[tuple[str, Exception]]:
         non_critical_errors: list[tuple[str, Exception]] = []
 
         while self._undo:
@@ -135,3 +524,22 @@ class HistoryAgent(Agent):
                     ) from os_error
 
         return non_critical_errors
+
+    def _rollback_concurrently(self, jobs: int) -> list[tuple[str, Exception]]:
+        ops = list(reversed(self._undo))
+        outcome = execute_concurrently(ops, self._execute, jobs)
+
+        # Whatever didn't complete stays on the stack, so rollback can be
+        # tried again, exactly as when rolling back one at a time
+        remaining = [op for op, done in zip(ops, outcome.completed) if not done]
+        self._undo = deque(reversed(remaining))
+
+        if outcome.error is not None:
+            if not isinstance(outcome.error, OSError):
+                raise outcome.error
+            raise RollbackError(
+                "Rollback failed",
+                remaining_operations=remaining,
+            ) from outcome.error
+
+        return outcome.non_critical_errors
@@ -0,0 +1,359 @@
+import asyncio
+import heapq
+import os
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Awaitable, Callable, Iterable, Sequence
+from typing import TYPE_CHECKING
+
+from .agents import (
+    Agent,
+    ConcurrentOutcome,
+    find_dependents,
+    Mkdir,
+    Move,
+    Operation,
+    RenameatExecutive,
+    Rmdir,
+    RollbackError,
+    update_dir_cache,
+)
+from .cli import CommitError
+from .fs import DirectoryCache, self_and_ancestors
+from .output import Reporter, VerboseReporter
+
+if TYPE_CHECKING:
+    from .journal import Journal
+
+
+class AsyncAgent(ABC):
+    """
+    An Agent whose operations are coroutines, so that many can be waiting
+    at once on a file system where each one takes a round trip, such as NFS
+    or SMB.
+    """
+
+    @abstractmethod
+    async def move(self, src, dest) -> None: ...
+
+    @abstractmethod
+    async def mkdir(self, path) -> None: ...
+
+    @abstractmethod
+    async def rmdir(self, path) -> None: ...
+
+
+def _dispatch(op: Operation, agent: AsyncAgent) -> Awaitable[None]:
+    # The async equivalent of op.execute(agent)
+    if isinstance(op, Move):
+        return agent.move(op.src, op.dest)
+    if isinstance(op, Mkdir):
+        return agent.mkdir(op.path)
+    if isinstance(op, Rmdir):
+        return agent.rmdir(op.path)
+    raise TypeError(f"Unknown operation {op!r}")
+
+
+class AsyncExecutive(AsyncAgent):
+    """
+    Performs operations with a synchronous agent, a RenameatExecutive unless
+    another is given, on a pool of up to max_workers threads.
+    """
+
+    def __init__(self, delegate: Agent | None = None, max_workers: int = 32):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._delegate = RenameatExecutive() if delegate is None else delegate
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    async def move(self, src, dest) -> None:
+        await self._run(self._delegate.move, src, dest)
+
+    async def mkdir(self, path) -> None:
+        await self._run(self._delegate.mkdir, path)
+
+    async def rmdir(self, path) -> None:
+        await self._run(self._delegate.rmdir, path)
+
+    async def _run(self, func: Callable, *args):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, func, *args)
+
+
+async def execute_concurrently_async(
+    ops: Sequence[Operation],
+    execute: Callable[[Operation], Awaitable[None]],
+    max_in_flight: int,
+) -> ConcurrentOutcome:
+    """
+    As execute_concurrently, but awaits up to max_in_flight operations at
+    once rather than running them on threads.
+    """
+    dependents = find_dependents(ops)
+    waiting_on = [0] * len(ops)
+    for later_indices in dependents:
+        for later in later_indices:
+            waiting_on[later] += 1
+
+    ready = [index for index, count in enumerate(waiting_on) if count == 0]
+    heapq.heapify(ready)
+    outcome = ConcurrentOutcome([False] * len(ops), [])
+    in_flight: dict[asyncio.Future, int] = {}
+
+    while ready or in_flight:
+        while ready and outcome.error is None and len(in_flight) < max_in_flight:
+            index = heapq.heappop(ready)
+            in_flight[asyncio.ensure_future(execute(ops[index]))] = index
+
+        if not in_flight:
+            break
+
+        done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            index = in_flight.pop(future)
+            error = future.exception()
+            if error is not None:
+                op = ops[index]
+                if isinstance(op, Rmdir) and isinstance(error, OSError):
+                    outcome.non_critical_errors.append((op.path, error))
+                else:
+                    if outcome.error is None:
+                        outcome.failed_index = index
+                        outcome.error = error
+                    continue
+
+            outcome.completed[index] = True
+            for later in dependents[index]:
+                waiting_on[later] -= 1
+                if waiting_on[later] == 0:
+                    heapq.heappush(ready, later)
+
+    return outcome
+
+
+class AsyncHistoryAgent(AsyncAgent):
+    """
+    Records how to undo each operation, as HistoryAgent does, for agents
+    whose operations are coroutines.
+    """
+
+    def __init__(
+        self,
+        delegate: AsyncAgent,
+        dir_cache: DirectoryCache | None = None,
+        journal: "Journal | None" = None,
+    ):
+        self._delegate = delegate
+        self._dir_cache = dir_cache
+        self._journal = journal
+        self._undo: deque[Operation] = deque()
+
+    async def move(self, src, dest):
+        await self._execute_log(Move(src, dest))
+
+    async def mkdir(self, path):
+        await self._execute_log(Mkdir(path))
+
+    async def rmdir(self, path):
+        await self._execute_log(Rmdir(path))
+
+    @property
+    def undo_count(self) -> int:
+        return len(self._undo)
+
+    def extend_undo(self, undo_ops: Iterable[Operation]):
+        self._undo.extend(undo_ops)
+
+    async def _execute_log(self, op: Operation):
+        undo_op = op.get_undo()
+        if self._journal is not None:
+            self._journal.record(op)
+        await self._execute(op)
+        # Operations that depend on this one can't finish before it does, so
+        # they are undone before it
+        self._undo.append(undo_op)
+
+    async def _execute(self, op: Operation):
+        await _dispatch(op, self._delegate)
+        if self._dir_cache is not None:
+            update_dir_cache(self._dir_cache, op)
+
+    async def rollback(self, max_in_flight: int = 32) -> list[tuple[str, Exception]]:
+        ops = list(reversed(self._undo))
+        outcome = await execute_concurrently_async(ops, self._execute, max_in_flight)
+
+        remaining = [op for op, done in zip(ops, outcome.completed) if not done]
+        self._undo = deque(reversed(remaining))
+
+        if outcome.error is not None:
+            if not isinstance(outcome.error, OSError):
+                raise outcome.error
+            raise RollbackError(
+                "Rollback failed",
+                remaining_operations=remaining,
+            ) from outcome.error
+
+        return outcome.non_critical_errors
+
+
+class _PlannedNode:
+    # exists is None if the path is as it was before planning. Otherwise it
+    # says whether the path exists once the planned operations so far are
+    # done, and origin is where its contents were before planning, or None
+    # if it's a new, empty directory.
+    __slots__ = ("children", "exists", "origin")
+
+    def __init__(self, exists: bool | None = None, origin: str | None = None):
+        self.children: dict[str, _PlannedNode] = {}
+        self.exists = exists
+        self.origin = origin
+
+
+class _PlannedTree:
+    # Tracks which directories will exist as planned operations are done,
+    # without touching the file system except to check original paths
+    # through dir_cache.
+
+    def __init__(self, dir_cache: DirectoryCache):
+        self._dir_cache = dir_cache
+        self._root = _PlannedNode()
+
+    def exists(self, path: str) -> bool:
+        possible, origin = self._locate(path)
+        if not possible:
+            return False
+        return origin is None or self._dir_cache.exists(origin)
+
+    def mkdir(self, path: str):
+        parent, name = self._parent_of(path)
+        parent.children[name] = _PlannedNode(True)
+
+    def move(self, src: str, dest: str):
+        possible, origin = self._locate(src)
+        parent, name = self._parent_of(src)
+        node = parent.children.get(name) or _PlannedNode()
+        parent.children[name] = _PlannedNode(False)
+        node.exists = possible
+        node.origin = origin
+        parent, name = self._parent_of(dest)
+        parent.children[name] = node
+
+    def _locate(self, path: str) -> tuple[bool, str | None]:
+        # Returns whether path can exist, and if so, the path it had before
+        # planning, or None if it's a new directory
+        parts = path.split(os.sep)
+        node = self._root
+        nearest = None
+        for index, name in enumerate(parts):
+            node = node.children.get(name)
+            if node is None:
+                break
+            if node.exists is not None:
+                nearest = (index, node)
+
+        if nearest is None:
+            return True, path
+        index, node = nearest
+        rest = parts[index + 1 :]
+        if not node.exists:
+            return False, None
+        if node.origin is None:
+            return not rest, None
+        return True, os.path.join(node.origin, *rest)
+
+    def _parent_of(self, path: str) -> tuple[_PlannedNode, str]:
+        *parent_parts, name = path.split(os.sep)
+        node = self._root
+        for part in parent_parts:
+            node = node.children.setdefault(part, _PlannedNode())
+        return node, name
+
+
+def plan_operations(
+    moves: Iterable[tuple[str, str]], dir_cache: DirectoryCache
+) -> list[Operation]:
+    """
+    Turns scheduled moves into the operations that perform them, with a
+    Mkdir before the first move into each directory that doesn't exist yet.
+
+    Directories are checked for up front, once each, rather than as each
+    move is made, so that find_dependents can tell which operations have to
+    wait for which. Earlier moves are taken into account: a directory moved
+    away no longer exists, and one moved into place brings its
+    subdirectories with it.
+    """
+    ops: list[Operation] = []
+    planned = _PlannedTree(dir_cache)
+
+    for src, dest in moves:
+        parent = os.path.dirname(dest)
+        to_make = []
+        if parent:
+            for ancestor in self_and_ancestors(parent):
+                if planned.exists(ancestor):
+                    break
+                to_make.append(ancestor)
+
+        for ancestor in reversed(to_make):
+            ops.append(Mkdir(ancestor))
+            planned.mkdir(ancestor)
+        ops.append(Move(src, dest))
+        planned.move(src, dest)
+
+    return ops
+
+
+async def perform_moves_async(
+    moves: Iterable[tuple[str, str]],
+    agent: AsyncAgent,
+    dir_cache: DirectoryCache | None = None,
+    max_in_flight: int = 32,
+    reporter: Reporter | None = None,
+):
+    """
+    Performs moves, ordered as by schedule_moves, keeping up to
+    max_in_flight operations waiting at once. Each operation starts as soon
+    as the ones it depends on have finished, so moves into a new directory
+    wait only for its Mkdir, and a chain of moves still happens in order.
+
+    Raises CommitError if an operation fails, once the others already
+    started have finished. Use an AsyncHistoryAgent as agent to be able to
+    roll back.
+    """
+    if dir_cache is None:
+        dir_cache = DirectoryCache()
+    # A reporter that's passed in is closed by the caller
+    own_reporter = reporter is None
+    if reporter is None:
+        reporter = VerboseReporter()
+
+    ops = plan_operations(moves, dir_cache)
+
+    async def execute(op: Operation):
+        await _dispatch(op, agent)
+        if isinstance(op, Move):
+            reporter.move(op.src, op.dest)
+
+    try:
+        outcome = await execute_concurrently_async(ops, execute, max_in_flight)
+    finally:
+        if own_reporter:
+            reporter.close()
+
+    if outcome.error is not None:
+        assert outcome.failed_index is not None
+        failed_op = ops[outcome.failed_index]
+        if isinstance(failed_op, Move):
+            raise CommitError.from_failed_move(
+                failed_op.src, failed_op.dest
+            ) from outcome.error
+        raise CommitError(f"Error performing {failed_op}") from outcome.error
@@ -0,0 +1,177 @@
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from .agents import HistoryAgent, Operation, RenameatExecutive, RollbackError
+from .cli import CommitError, CommitResult, make_plan, perform_moves, Plan
+from .fs import DirectoryCache
+from .output import QuietReporter, Reporter
+from .rules import compile_rules, Rule
+from .schedule import schedule_moves
+
+if TYPE_CHECKING:
+    from .preflight import Problem
+
+MapPath = Callable[[str], str | None]
+
+
+@dataclass(slots=True)
+class RenameResult:
+    """
+    What rename_many did. status is None if nothing was attempted, because
+    it was a dry run or the plan has conflicts.
+
+    moves are the moves in the order they were, or would have been,
+    performed, including any renames to temporary names needed to break
+    cycles. If a move failed, error is what it raised and failed_move is the
+    move, and the moves made before it were rolled back. If that rollback
+    failed too, rollback_error is what it raised, and remaining_operations
+    are the operations that would finish restoring the original state. If
+    the journal couldn't be created, nothing was moved, and error is what
+    creating it raised.
+    """
+
+    status: CommitResult | None
+    plan: Plan
+    moves: list[tuple[str, str]]
+    problems: "list[Problem]" = field(default_factory=list)
+    error: BaseException | None = None
+    failed_move: tuple[str, str] | None = None
+    rollback_error: BaseException | None = None
+    rollback_errors: list[tuple[str, Exception]] = field(default_factory=list)
+    remaining_operations: list[Operation] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        if self.plan.has_conflicts:
+            return False
+        return self.status is None or self.status == CommitResult.SUCCESS
+
+
+def _make_map_path(mapping_or_rules) -> MapPath:
+    if isinstance(mapping_or_rules, Mapping):
+        return mapping_or_rules.get
+    if isinstance(mapping_or_rules, Rule):
+        return compile_rules([mapping_or_rules])
+    if callable(mapping_or_rules):
+        return mapping_or_rules
+    if isinstance(mapping_or_rules, Iterable) and not isinstance(mapping_or_rules, str):
+        rules = list(mapping_or_rules)
+        if all(isinstance(rule, Rule) for rule in rules):
+            return compile_rules(rules)
+    raise TypeError(
+        "Expected a mapping of paths, a function, a Rule or a sequence of"
+        f" Rules, not {type(mapping_or_rules).__name__}"
+    )
+
+
+def rename_many(
+    mapping_or_rules: Mapping[str, str] | MapPath | Rule | Iterable[Rule],
+    paths: Iterable[str] | None = None,
+    *,
+    dry_run: bool = False,
+    jobs: int = 1,
+    journal: str | None = None,
+    journal_sync: int = 1000,
+    preflight: bool = False,
+    check_fs: bool = False,
+    dir_cache: DirectoryCache | None = None,
+    reporter: Reporter | None = None,
+) -> RenameResult:
+    """
+    Renames paths as submv would, without printing anything, and returns
+    what happened.
+
+    mapping_or_rules says where each path goes: a mapping from old paths to
+    new ones, a function that returns a path's new path or None to leave it,
+    a Rule, or a sequence of Rules applied in turn as with --rules. paths
+    can be omitted if it's a mapping, in which case its keys are renamed.
+
+    The remaining arguments match the command-line options of the same
+    names. A DirectoryCache passed as dir_cache is kept up to date, so it
+    can be passed to later calls to save checking the same directories
+    again, as long as nothing else changes them in between. reporter is
+    told of each move, and defaults to reporting nothing.
+    """
+    map_path = _make_map_path(mapping_or_rules)
+    if paths is None:
+        if not isinstance(mapping_or_rules, Mapping):
+            raise TypeError("paths is required unless a mapping is given")
+        paths = list(mapping_or_rules)
+
+    fs_names = None
+    if check_fs:
+        from .fsnames import FileSystemNames
+
+        fs_names = FileSystemNames()
+    plan = make_plan(map_path, paths, fs_names)
+    if plan.has_conflicts:
+        return RenameResult(None, plan, [])
+
+    schedule = schedule_moves(plan.valid_moves)
+    result = RenameResult(None, plan, schedule.moves)
+    if dry_run:
+        return result
+
+    if preflight:
+        from .preflight import check_moves
+
+        result.problems = check_moves(schedule.moves)
+        if result.problems:
+            result.status = CommitResult.PREFLIGHT_FAILED
+            return result
+
+    if dir_cache is None:
+        dir_cache = DirectoryCache()
+    journal_file = None
+    if journal is not None:
+        from .journal import Journal
+
+        try:
+            journal_file = Journal(journal, journal_sync)
+        except OSError as journal_error:
+            result.error = journal_error
+            result.status = CommitResult.JOURNAL_FAILED
+            return result
+    history = HistoryAgent(RenameatExecutive(copy_jobs=jobs), dir_cache, journal_file)
+
+    try:
+        try:
+            perform_moves(
+                schedule.moves, history, dir_cache, jobs, reporter or QuietReporter()
+            )
+        except CommitError as commit_error:
+            result.error = commit_error.__cause__
+            result.failed_move = commit_error.failed_move
+            result.status = _roll_back(history, jobs, result)
+            if (
+                journal_file is not None
+                and result.status != CommitResult.FAILED_WITH_FAILED_ROLLBACK
+            ):
+                journal_file.mark_rolled_back()
+            return result
+
+        if journal_file is not None:
+            journal_file.mark_committed()
+        result.status = CommitResult.SUCCESS
+        return result
+    finally:
+        if reporter is not None:
+            reporter.close()
+        if journal_file is not None:
+            journal_file.close()
+
+
+def _roll_back(history: HistoryAgent, jobs: int, result: RenameResult) -> CommitResult:
+    # As cli.roll_back, but records what happened in result instead of
+    # printing it
+    try:
+        result.rollback_errors = history.rollback(jobs)
+    except RollbackError as rollback_error:
+        result.rollback_error = rollback_error.__cause__
+        result.remaining_operations = rollback_error.remaining_operations
+        return CommitResult.FAILED_WITH_FAILED_ROLLBACK
+
+    if result.rollback_errors:
+        return CommitResult.FAILED_WITH_NONCRITICAL_ROLLBACK
+    return CommitResult.FAILED_WITH_SUCCESSFUL_ROLLBACK
@@ -1,21 +1,43 @@
-import argparse
-import base64
+import contextlib
 import enum
 import functools
 import os
-import random
 import re
 import sys
-import traceback
-from collections.abc import Callable, Sequence
-from dataclasses import dataclass
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
 from shlex import quote
+from typing import BinaryIO, ContextManager, TYPE_CHECKING
 
-from .agents import Agent, Executive, HistoryAgent, RollbackError
+from .agents import Agent, HistoryAgent, RenameatExecutive, RollbackError
 
 __version__ = "0.0.6"
 
-from .fs import ensure_dir_for
+from .fs import compile_globs, DirectoryCache, ensure_dir_for, walk_bottom_up
+from .output import (
+    BufferedWriter,
+    ProgressReporter,
+    QuietReporter,
+    Reporter,
+    VerboseReporter,
+)
+from .planio import PLAN_FORMATS, PlanFormatError, read_plan, write_plan
+from .rules import compile_rules, load_rules, Rule, RulesError
+from .schedule import partition_moves, Schedule, schedule_moves, ScheduleError
+from .stats import InstrumentedAgent, phase, Stats
+
+# Modules only needed by some options are imported where they're used, to
+# keep the start-up time of short runs down
+if TYPE_CHECKING:
+    import argparse
+
+    from .compactplan import CompactPlan
+    from .fsnames import DirectoryListing, FileSystemNames
+    from .journal import JournalContents
+
+# More problems than this are summarized as a count
+PREFLIGHT_REPORT_LIMIT = 50
 
 HELP_PUNCT = {
     "/": "slash",
@@ -25,16 +47,39 @@ HELP_PUNCT = {
 
 @dataclass
 class CliArgs:
-    search: str
-    replace: str
+    search: str | None
+    replace: str | None
     paths: list[str]
     basename: bool
     literal: bool
     ignore_case: bool
     dry_run: bool
+    from_file: str | None = None
+    null: bool = False
+    recursive: bool = False
+    include: list[str] | None = None
+    exclude: list[str] | None = None
+    journal: str | None = None
+    journal_sync: int = 1000
+    recover: str | None = None
+    jobs: int = 1
+    quiet: bool = False
+    progress: bool = False
+    emit_plan: str | None = None
+    apply_plan: str | None = None
+    plan_format: str = "jsonl"
+    low_memory: bool = False
+    preflight: bool = False
+    check_fs: bool = False
+    rules: str | None = None
+    save_undo: bool = False
+    undo: str | None = None
+    stats: bool = False
+
+
+def make_arg_parser() -> "argparse.ArgumentParser":
+    import argparse
 
-
-def make_arg_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(
         description="""
             Rename or move files by performing find-replace operations
@@ -45,6 +90,7 @@ def make_arg_parser() -> argparse.ArgumentParser:
     p.add_argument(
         "search",
         metavar="SEARCH",
+        nargs="?",
         help="""
             The regular expression to match, unless -l/--literal is
             specified, in which case this is interpreted as the
@@ -55,6 +101,7 @@ def make_arg_parser() -> argparse.ArgumentParser:
     p.add_argument(
         "replace",
         metavar="REPLACE",
+        nargs="?",
         help="""
             The replacement string. If SEARCH is a regular expression
             (that is, if -l/--literal is not specified), capturing
@@ -68,8 +115,11 @@ def make_arg_parser() -> argparse.ArgumentParser:
     p.add_argument(
         "paths",
         metavar="PATH",
-        nargs="+",
-        help="The files or directories to rename or move.",
+        nargs="*",
+        help="""
+            The files or directories to rename or move. Can be omitted if
+            --from-file is specified.
+        """,
     )
 
     punct_name = HELP_PUNCT.get(os.sep, "path separator")
@@ -114,11 +164,262 @@ def make_arg_parser() -> argparse.ArgumentParser:
             exactly identical paths count as conflicts - your OS and
             file system may apply further restrictions such as case
             insensitivity or Unicode normalization. Such conflicts are
-            only detected when trying to actually rename the files.
+            only detected when trying to actually rename the files, unless
+            --check-fs is specified.
+        """,
+    )
+
+    p.add_argument(
+        "--preflight",
+        action="store_true",
+        help="""
+            Before moving anything, check that every source exists, that no
+            target is taken by a file that isn't being moved, and that every
+            directory involved can be written to, and make no changes if
+            any check fails. This lists each directory involved once, which
+            is much cheaper than a failure and rollback late in a large
+            batch. Unlike --check-fs, this doesn't check for conflicts
+            between the moves themselves.
+        """,
+    )
+
+    p.add_argument(
+        "--check-fs",
+        action="store_true",
+        help="""
+            Before making any changes, also report conflicts that depend on
+            the file system: targets whose names differ only in case or
+            Unicode normalization on a file system that treats them as the
+            same, and targets that are taken by files that aren't being
+            moved. Each file system's behavior is worked out from existing
+            files without changing anything, and each target directory is
+            listed once. Can't be combined with --low-memory.
+        """,
+    )
+
+    p.add_argument(
+        "--rules",
+        metavar="FILE",
+        help="""
+            Read a list of search-replace rules from FILE instead of
+            taking a single SEARCH and REPLACE from the command line. All
+            rules are applied to each path in order, each to the result of
+            the previous one, so each file is renamed once to its final
+            name. FILE is a JSON list of objects with the keys "search"
+            and "replace", and optionally "flags", a string containing l
+            for literal matching and/or i for case-insensitive matching,
+            and "scope", which is "path" (the default) or "basename".
+        """,
+    )
+
+    p.add_argument(
+        "--from-file",
+        metavar="FILE",
+        help="""
+            Read the paths of files or directories to rename or move from
+            FILE, one per line, in addition to any PATH arguments. Specify
+            - to read from standard input. All paths are committed or
+            rolled back together, regardless of how many there are.
+        """,
+    )
+
+    p.add_argument(
+        "-0",
+        "--null",
+        action="store_true",
+        help="""
+            Paths read with --from-file are separated by NUL characters
+            rather than newlines, as output by find -print0.
+        """,
+    )
+
+    p.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="""
+            Rename or move the contents of any directories specified in
+            PATH, and their subdirectories. The contents of a directory
+            are always renamed before the directory itself. This is
+            usually combined with -b/--basename, because without it,
+            renaming a directory's contents can create the directory's
+            new name before the directory itself is moved there.
         """,
     )
 
-    # TODO: recursion?
+    p.add_argument(
+        "--include",
+        metavar="GLOB",
+        action="append",
+        help="""
+            With -r/--recursive, only rename or move files and
+            directories whose names match the shell-style wildcard GLOB.
+            Directories that don't match are still searched. Can be
+            specified more than once.
+        """,
+    )
+
+    p.add_argument(
+        "--exclude",
+        metavar="GLOB",
+        action="append",
+        help="""
+            With -r/--recursive, skip files and directories whose names
+            match the shell-style wildcard GLOB, and don't search inside
+            matching directories. Can be specified more than once.
+        """,
+    )
+
+    verbosity = p.add_mutually_exclusive_group()
+    verbosity.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="Don't list each move as it's performed.",
+    )
+
+    verbosity.add_argument(
+        "--progress",
+        action="store_true",
+        help="""
+            Instead of listing each move, show a count of moves performed
+            so far, and their rate.
+        """,
+    )
+
+    p.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=int,
+        default=1,
+        help="""
+            Perform up to N moves at the same time. Moves are only
+            performed at the same time if they don't share a source or
+            target directory. Rollbacks are also performed N operations
+            at a time, where the operations don't depend on each other.
+            This can be much faster on network file systems and fast
+            SSDs. The default is %(default)s.
+        """,
+    )
+
+    p.add_argument(
+        "--emit-plan",
+        metavar="FILE",
+        help="""
+            Write the planned moves to FILE, or standard output if FILE is
+            -, instead of performing them. The plan can be reviewed, then
+            performed later with --apply-plan, without searching and
+            replacing again. If any moves conflict, they are reported
+            and no plan is written.
+        """,
+    )
+
+    p.add_argument(
+        "--apply-plan",
+        metavar="FILE",
+        help="""
+            Perform the moves in a plan written by --emit-plan, read from
+            FILE, or standard input if FILE is -. SEARCH, REPLACE and PATH
+            are not required.
+        """,
+    )
+
+    p.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="""
+            Hold the plan in a compact form that uses much less memory,
+            which is worthwhile for batches of millions of paths, at the
+            cost of some speed. Only for use with -n/--dry-run or
+            --emit-plan: performing the moves needs every path in full, to
+            order the moves and to be able to roll them back, so it would
+            save nothing. With -n/--dry-run, the temporary renames needed
+            to break cycles aren't counted, for the same reason.
+        """,
+    )
+
+    p.add_argument(
+        "--plan-format",
+        choices=PLAN_FORMATS,
+        default="jsonl",
+        help="""
+            The format of plans written by --emit-plan or read by
+            --apply-plan. jsonl is one JSON object per line. nul is the
+            source and target path of each move, each followed by a NUL
+            character. The default is %(default)s.
+        """,
+    )
+
+    p.add_argument(
+        "--journal",
+        metavar="FILE",
+        help="""
+            Record each operation in FILE before performing it, so that
+            if submv is interrupted before it can roll back, such as by
+            being killed or a power failure, the changes can be undone
+            with --recover. FILE must not already exist.
+        """,
+    )
+
+    p.add_argument(
+        "--journal-sync",
+        metavar="N",
+        type=int,
+        default=1000,
+        help="""
+            Flush the journal to disk after every N operations. Smaller
+            values are slower, but fewer operations can be lost from the
+            journal in a power failure or operating system crash. A killed
+            process loses no operations regardless of this setting. The
+            default is %(default)s.
+        """,
+    )
+
+    p.add_argument(
+        "--recover",
+        metavar="JOURNAL",
+        help="""
+            Undo the operations recorded in JOURNAL by an interrupted run
+            with --journal, instead of renaming anything. SEARCH, REPLACE
+            and PATH are not required.
+        """,
+    )
+
+    p.add_argument(
+        "--save-undo",
+        action="store_true",
+        help="""
+            Keep a log of the run in the state directory
+            ($XDG_STATE_HOME/pathsub, or ~/.local/state/pathsub), so that
+            it can be undone later with --undo. The run's ID is printed
+            when it finishes. Can't be combined with --journal.
+        """,
+    )
+
+    p.add_argument(
+        "--undo",
+        metavar="RUN_ID",
+        nargs="?",
+        const="",
+        help="""
+            Undo a run that was made with --save-undo, instead of renaming
+            anything, by performing its operations in reverse. Without
+            RUN_ID, undoes the most recent run that hasn't been undone
+            yet. SEARCH, REPLACE and PATH are not required.
+        """,
+    )
+
+    p.add_argument(
+        "--stats",
+        action="store_true",
+        help="""
+            When finished, print statistics about the run to standard error
+            as JSON: the time taken by each phase, the number of each kind
+            of file system operation performed, and a histogram of how long
+            each kind took.
+        """,
+    )
 
     p.add_argument(
         "--version",
@@ -129,43 +430,93 @@ def make_arg_parser() -> argparse.ArgumentParser:
     return p
 
 
-def make_pattern(expr: str, literal: bool, ignore_case: bool) -> re.Pattern:
-    pattern = re.escape(expr) if literal else expr
-    return re.compile(pattern, flags=re.IGNORECASE if ignore_case else 0)
+def read_paths(reader: BinaryIO, null: bool, chunk_size: int = 1 << 16):
+    # Yields paths one at a time, so a long list needn't be held in memory
+    separator = b"\0" if null else b"\n"
+    pending = b""
+    while chunk := reader.read(chunk_size):
+        pieces = (pending + chunk).split(separator)
+        pending = pieces.pop()
+        for piece in pieces:
+            if piece:
+                yield os.fsdecode(piece)
+    if pending:
+        yield os.fsdecode(pending)
+
+
+def iter_specified_paths(args: CliArgs) -> Iterator[str]:
+    yield from args.paths
 
+    if args.from_file is None:
+        return
+    if args.from_file == "-":
+        yield from read_paths(sys.stdin.buffer, args.null)
+    else:
+        with open(args.from_file, "rb") as reader:
+            yield from read_paths(reader, args.null)
 
-def resub_basename(pattern: re.Pattern, repl: str, subject: str) -> str:
-    parent, leaf = os.path.split(subject)
-    new_leaf = pattern.sub(repl, leaf)
-    return os.path.join(parent, new_leaf)
 
+def iter_input_paths(args: CliArgs) -> Iterator[str]:
+    if not args.recursive:
+        yield from iter_specified_paths(args)
+        return
 
-def resub_path(pattern: re.Pattern, repl: str, subject: str) -> str:
-    return pattern.sub(repl, subject)
+    include = compile_globs(args.include or ())
+    exclude = compile_globs(args.exclude or ())
+    for root in iter_specified_paths(args):
+        yield from walk_bottom_up(root, include, exclude)
 
 
 @dataclass(slots=True)
 class TargetNameRecord:
     target_path: str
     src_paths: list[str]
+    # The position of the first source among the paths given to make_plan
+    index: int
+    existing: str | None = None
 
 
 @dataclass(slots=True)
 class Plan:
     valid_moves: list[tuple[str, str]]
     conflicts: list[tuple[list[str], str]]
+    matched: int = 0
+    unmatched: int = 0
+    # Moves whose targets are taken by files that aren't being moved away,
+    # as (src, dest, existing path)
+    occupied: list[tuple[str, str, str]] = field(default_factory=list)
 
     @property
     def has_conflicts(self):
-        return len(self.conflicts) > 0
-
-
-def make_plan(map_path: Callable[[str], str], paths: Sequence[str]) -> Plan:
+        return len(self.conflicts) > 0 or len(self.occupied) > 0
+
+
+def make_plan(
+    map_path: Callable[[str], str | None],
+    paths: Iterable[str],
+    fs_names: "FileSystemNames | None" = None,
+) -> Plan:
+    """
+    map_path returns a path's new name, or None if the search didn't match
+    it. Paths that don't match are only counted, so the plan's size depends
+    only on the number of paths that do. valid_moves are in the order their
+    sources were given, so contents listed before their directories, as by
+    find -depth, are moved first.
+
+    If fs_names is given, targets also conflict if their file system would
+    treat their names as the same, and moves are checked against files that
+    already exist in the target directories.
+    """
     namespaces: dict[str, dict[str, TargetNameRecord]] = {}
+    moving_away: dict[str, set[str]] = {}
     plan = Plan([], [])
 
-    for src_path in paths:
+    for index, src_path in enumerate(paths):
         target_path = map_path(src_path)
+        if target_path is None:
+            plan.unmatched += 1
+            continue
+        plan.matched += 1
         if target_path == src_path:
             continue
 
@@ -174,51 +525,142 @@ def make_plan(map_path: Callable[[str], str], paths: Sequence[str]) -> Plan:
 
         tnr = namespace.get(target_leaf)
         if tnr is None:
-            namespace[target_leaf] = TargetNameRecord(target_path, [src_path])
+            namespace[target_leaf] = TargetNameRecord(target_path, [src_path], index)
         else:
             tnr.src_paths.append(src_path)
 
+        if fs_names is not None:
+            src_parent, src_leaf = os.path.split(src_path)
+            moving_away.setdefault(src_parent, set()).add(src_leaf)
+
+    if fs_names is not None:
+        namespaces = _regroup_by_file_system(namespaces, moving_away, fs_names)
+
+    valid: list[TargetNameRecord] = []
     for namespace in namespaces.values():
         for tnr in namespace.values():
-            if len(tnr.src_paths) == 1:
-                plan.valid_moves.append((tnr.src_paths[0], tnr.target_path))
+            if tnr.existing is not None:
+                for src_path in tnr.src_paths:
+                    plan.occupied.append((src_path, tnr.target_path, tnr.existing))
+            elif len(tnr.src_paths) == 1:
+                valid.append(tnr)
             else:
                 plan.conflicts.append((tnr.src_paths, tnr.target_path))
 
+    # Records are grouped by target directory above, so this restores the
+    # input order
+    valid.sort(key=lambda tnr: tnr.index)
+    plan.valid_moves = [(tnr.src_paths[0], tnr.target_path) for tnr in valid]
     return plan
 
 
-def print_plan(plan: Plan):
-    for src, dest in plan.valid_moves:
-        print(f"  {quote(src)} → {quote(dest)}")
-
-    if plan.has_conflicts:
+def _regroup_by_file_system(
+    namespaces: dict[str, dict[str, TargetNameRecord]],
+    moving_away: dict[str, set[str]],
+    fs_names: "FileSystemNames",
+) -> dict:
+    # Merges namespaces that are the same directory spelled differently, and
+    # records whose names the file system treats as the same, then marks
+    # records whose names are taken by existing files. Each target directory
+    # is listed once.
+    merged: dict[tuple, dict[str, TargetNameRecord]] = {}
+    on_disk: "list[tuple[str, DirectoryListing]]" = []
+
+    for parent, namespace in namespaces.items():
+        listing = fs_names.list_dir(parent)
+        if listing is None:
+            key = fs_names.key_for_missing(parent)
+            identity = ("missing", key(os.path.abspath(parent)))
+        else:
+            key = listing.key
+            identity = listing.identity
+            on_disk.append((parent, listing))
+
+        merged_namespace = merged.setdefault(identity, {})
+        for leaf, tnr in namespace.items():
+            other = merged_namespace.setdefault(key(leaf), tnr)
+            if other is not tnr:
+                other.src_paths.extend(tnr.src_paths)
+
+    for parent, listing in on_disk:
+        merged_namespace = merged[listing.identity]
+        leaving = {listing.key(leaf) for leaf in moving_away.get(parent, ())}
+        for name in listing.names:
+            name_key = listing.key(name)
+            tnr = merged_namespace.get(name_key)
+            if tnr is not None and name_key not in leaving:
+                tnr.existing = os.path.join(parent, name)
+
+    return merged
+
+
+def print_conflicts(plan: "Plan | CompactPlan", file=None):
+    if plan.conflicts:
         print(
-            "\nThe following operations conflict because they share the same target name:"
+            "The following operations conflict because they share the same"
+            " target name:",
+            file=file,
         )
         for srcs, dest in plan.conflicts:
-            print(f" {quote(dest)}")
+            print(f" {quote(dest)}", file=file)
             for src in srcs:
-                print(f"  {quote(src)} → {quote(dest)}")
+                print(f"  {quote(src)} → {quote(dest)}", file=file)
 
-    if len(plan.valid_moves) == 0 and not plan.has_conflicts:
+    if plan.occupied:
+        if plan.conflicts:
+            print(file=file)
         print(
-            "Nothing to do - either nothing matched, or all replacements resulted in no change."
+            "The following operations conflict with files that already exist:",
+            file=file,
         )
+        for src, dest, existing in plan.occupied:
+            print(
+                f"  {quote(src)} → {quote(dest)} (exists as {quote(existing)})",
+                file=file,
+            )
 
 
-def generate_temp_name(path: str):
-    stem, suffix = os.path.splitext(path)
-    some_bytes = random.randbytes(5)
-    some_text = base64.b32encode(some_bytes).decode("ascii")
-    return f"{stem}__submv{some_text}{suffix}"
+def print_summary(plan: "Plan | CompactPlan", file=None):
+    print(
+        f"{plan.matched} path(s) matched, {plan.unmatched} didn't match.",
+        file=file,
+    )
+    from .copy import summarize_cross_device
 
+    cross_device = summarize_cross_device(plan.valid_moves)
+    if cross_device.moves > 0:
+        print(
+            f"{cross_device.moves} move(s) are to another file system, and will"
+            f" copy {cross_device.bytes:,} bytes.",
+            file=file,
+        )
 
-@dataclass(slots=True)
-class DeferredMove:
-    src_path: str
-    temp_path: str
-    target_path: str
+
+def print_extra_renames(schedule: Schedule, file=None):
+    if schedule.extra_renames > 0:
+        print(
+            f"{schedule.extra_renames} extra temporary rename(s) will be"
+            " needed to break cycles.",
+            file=file,
+        )
+
+
+def print_plan(plan: "Plan | CompactPlan", writer: BufferedWriter | None = None):
+    if writer is None:
+        writer = BufferedWriter(sys.stdout)
+
+    for src, dest in plan.valid_moves:
+        writer.write_line(f"  {quote(src)} → {quote(dest)}")
+    writer.flush()
+
+    if plan.has_conflicts:
+        print()
+        print_conflicts(plan)
+
+    if len(plan.valid_moves) == 0 and not plan.has_conflicts:
+        print(
+            "Nothing to do - either nothing matched, or all replacements resulted in no change."
+        )
 
 
 class CommitError(Exception):
@@ -231,31 +673,81 @@ class CommitError(Exception):
         return cls(f"Error moving {src!r} to {dest!r}", (src, dest))
 
 
-def perform_moves(map_path: Callable[[str], str], paths: Sequence[str], agent: Agent):
-    defer: list[DeferredMove] = []
+def perform_move(
+    src_path: str,
+    target_path: str,
+    agent: Agent,
+    dir_cache: DirectoryCache,
+    reporter: Reporter,
+):
+    try:
+        ensure_dir_for(target_path, agent, dir_cache)
+        agent.move(src_path, target_path)
+    except Exception as other_error:
+        raise CommitError.from_failed_move(src_path, target_path) from other_error
+    reporter.move(src_path, target_path)
+
+
+def perform_moves(
+    moves: Iterable[tuple[str, str]],
+    agent: Agent,
+    dir_cache: DirectoryCache | None = None,
+    jobs: int = 1,
+    reporter: Reporter | None = None,
+):
+    # moves must already be ordered so that no move's target is the source
+    # of a later move - see schedule_moves
+    if dir_cache is None:
+        dir_cache = DirectoryCache()
+    # A reporter that's passed in is closed by the caller
+    own_reporter = reporter is None
+    if reporter is None:
+        reporter = VerboseReporter()
 
-    for src_path in paths:
-        target_path = map_path(src_path)
-        ensure_dir_for(target_path, agent)
-        try:
-            print(
-                "mv {src} {dest}".format(src=quote(src_path), dest=quote(target_path))
-            )
-            agent.move(src_path, target_path)
-        except (FileExistsError, IsADirectoryError):
-            temp_path = generate_temp_name(src_path)
-            agent.move(src_path, temp_path)
-            defer.append(DeferredMove(src_path, temp_path, target_path))
-        except Exception as other_error:
-            raise CommitError.from_failed_move(src_path, target_path) from other_error
-
-    for deferred in defer:
-        try:
-            agent.move(deferred.temp_path, deferred.target_path)
-        except Exception as other_error:
-            raise CommitError.from_failed_move(
-                deferred.src_path, deferred.target_path
-            ) from other_error
+    try:
+        if jobs > 1:
+            perform_moves_parallel(list(moves), agent, dir_cache, jobs, reporter)
+        else:
+            for src_path, target_path in moves:
+                perform_move(src_path, target_path, agent, dir_cache, reporter)
+    finally:
+        if own_reporter:
+            reporter.close()
+
+
+def perform_moves_parallel(
+    moves: list[tuple[str, str]],
+    agent: Agent,
+    dir_cache: DirectoryCache,
+    jobs: int,
+    reporter: Reporter,
+):
+    # Each group is performed in order on one thread, while groups that
+    # touch different directories run on different threads. agent must be
+    # safe to use from multiple threads, as HistoryAgent is.
+    failed = threading.Event()
+
+    def perform_group(group: list[tuple[str, str]]):
+        for src_path, target_path in group:
+            if failed.is_set():
+                return
+            try:
+                perform_move(src_path, target_path, agent, dir_cache, reporter)
+            except CommitError:
+                failed.set()
+                raise
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(perform_group, group) for group in partition_moves(moves)
+        ]
+
+    for future in futures:
+        error = future.exception()
+        if error is not None:
+            raise error
 
 
 def print_exception(some_error: Exception, file):
@@ -264,6 +756,8 @@ def print_exception(some_error: Exception, file):
         print(some_error, file=file)
     else:
         # Something more serious or obscure
+        import traceback
+
         traceback.print_exception(some_error, file=file)
 
 
@@ -272,40 +766,25 @@ class CommitResult(enum.Enum):
     FAILED_WITH_SUCCESSFUL_ROLLBACK = 1
     FAILED_WITH_NONCRITICAL_ROLLBACK = 2
     FAILED_WITH_FAILED_ROLLBACK = 3
+    INVALID_PLAN = 4
+    PREFLIGHT_FAILED = 5
+    JOURNAL_FAILED = 6
 
 
-def commit(
-    map_path: Callable[[str], str],
-    paths: Sequence[str],
-) -> CommitResult:
-    agent = Executive()
-    history = HistoryAgent(agent)
-
+def roll_back(history: HistoryAgent, jobs: int = 1) -> CommitResult:
     perror = functools.partial(print, file=sys.stderr)
     perror_exc = functools.partial(print_exception, file=sys.stderr)
 
     try:
-        perform_moves(map_path, paths, history)
-        return CommitResult.SUCCESS
-    except CommitError as commit_error:
-        perror("\nError during move:")
-        if commit_error.failed_move is not None:
-            failed_src, failed_dest = commit_error.failed_move
-            perror(f"  mv {quote(failed_src)} {quote(failed_dest)}\n")
-
-        perror_exc(commit_error.__cause__)
-        perror("\nRolling back...")
-
-        try:
-            non_critical_errors = history.rollback()
-        except RollbackError as rollback_error:
-            perror("Error during rollback:")
-            perror_exc(rollback_error.__cause__)
-            perror("\nRollback failed.")
-            perror("Perform the following operations to restore the original state:")
-            for op in rollback_error.remaining_operations:
-                perror(f"  {op}")
-            return CommitResult.FAILED_WITH_FAILED_ROLLBACK
+        non_critical_errors = history.rollback(jobs)
+    except RollbackError as rollback_error:
+        perror("Error during rollback:")
+        perror_exc(rollback_error.__cause__)
+        perror("\nRollback failed.")
+        perror("Perform the following operations to restore the original state:")
+        for op in rollback_error.remaining_operations:
+            perror(f"  {op}")
+        return CommitResult.FAILED_WITH_FAILED_ROLLBACK
 
     perror("Rollback complete.")
     if len(non_critical_errors) > 0:
@@ -317,29 +796,351 @@ def commit(
     return CommitResult.FAILED_WITH_SUCCESSFUL_ROLLBACK
 
 
+def commit(
+    moves: Iterable[tuple[str, str]],
+    journal_path: str | None = None,
+    journal_sync: int = 1000,
+    jobs: int = 1,
+    reporter: Reporter | None = None,
+    preflight: bool = False,
+    stats: Stats | None = None,
+    summarize: bool = False,
+) -> CommitResult:
+    perror = functools.partial(print, file=sys.stderr)
+    perror_exc = functools.partial(print_exception, file=sys.stderr)
+
+    try:
+        with phase(stats, "schedule_moves"):
+            schedule = schedule_moves(moves)
+    except (ScheduleError, PlanFormatError) as invalid_plan_error:
+        perror(f"Invalid plan: {invalid_plan_error}")
+        perror("No changes were made.")
+        return CommitResult.INVALID_PLAN
+    if summarize:
+        # Completes the summary that run prints before committing
+        print_extra_renames(schedule, file=sys.stderr)
+
+    if preflight:
+        from .preflight import check_moves
+
+        with phase(stats, "preflight"):
+            problems = check_moves(schedule.moves)
+        if problems:
+            perror("The following problems were found before moving anything:")
+            for problem in problems[:PREFLIGHT_REPORT_LIMIT]:
+                perror(f"  {quote(problem.path)} {problem.reason}")
+            if len(problems) > PREFLIGHT_REPORT_LIMIT:
+                perror(f"  ...and {len(problems) - PREFLIGHT_REPORT_LIMIT} more")
+            perror("\nNo changes were made.")
+            return CommitResult.PREFLIGHT_FAILED
+
+    agent: Agent = RenameatExecutive(copy_jobs=jobs)
+    if stats is not None:
+        agent = InstrumentedAgent(agent, stats)
+    dir_cache = DirectoryCache()
+    journal = None
+    if journal_path is not None:
+        from .journal import Journal
+
+        try:
+            journal = Journal(journal_path, journal_sync)
+        except OSError as journal_error:
+            perror(f"Couldn't create the journal: {journal_error}")
+            perror("No changes were made.")
+            return CommitResult.JOURNAL_FAILED
+    history = HistoryAgent(agent, dir_cache, journal)
+    if reporter is None:
+        reporter = VerboseReporter()
+
+    try:
+        try:
+            with phase(stats, "perform_moves"):
+                perform_moves(schedule.moves, history, dir_cache, jobs, reporter)
+        except CommitError as commit_error:
+            reporter.close()
+            perror("\nError during move:")
+            if commit_error.failed_move is not None:
+                failed_src, failed_dest = commit_error.failed_move
+                perror(f"  mv {quote(failed_src)} {quote(failed_dest)}\n")
+
+            perror_exc(commit_error.__cause__)
+            perror("\nRolling back...")
+
+            with phase(stats, "rollback"):
+                result = roll_back(history, jobs)
+            if (
+                journal is not None
+                and result != CommitResult.FAILED_WITH_FAILED_ROLLBACK
+            ):
+                journal.mark_rolled_back()
+            return result
+
+        if journal is not None:
+            journal.mark_committed()
+        return CommitResult.SUCCESS
+    finally:
+        reporter.close()
+        if journal is not None:
+            journal.close()
+        if stats is not None:
+            stats.count("stat", dir_cache.stat_count)
+
+
+def replay_undo(
+    journal_path: str,
+    contents: "JournalContents",
+    jobs: int = 1,
+    stats: Stats | None = None,
+) -> int:
+    # Undoes the journal's operations, newest first, and marks it rolled back
+    # if that worked
+    from .journal import mark_journal_rolled_back, RecoveryAgent
+
+    agent: Agent = RenameatExecutive(copy_jobs=jobs)
+    if stats is not None:
+        agent = InstrumentedAgent(agent, stats)
+    history = HistoryAgent(RecoveryAgent(agent))
+    history.extend_undo(op.get_undo() for op in contents.operations)
+
+    print(f"Rolling back {len(contents.operations)} operation(s)...", file=sys.stderr)
+    with phase(stats, "rollback"):
+        result = roll_back(history, jobs)
+    if result == CommitResult.FAILED_WITH_FAILED_ROLLBACK:
+        return result.value
+
+    mark_journal_rolled_back(journal_path)
+    if result == CommitResult.FAILED_WITH_NONCRITICAL_ROLLBACK:
+        return result.value
+    return 0
+
+
+def recover(journal_path: str, jobs: int = 1, stats: Stats | None = None) -> int:
+    from .journal import read_journal
+
+    contents = read_journal(journal_path)
+    if contents.finished:
+        print(
+            "Nothing to recover - the journal's run was already committed or"
+            " rolled back.",
+            file=sys.stderr,
+        )
+        return 0
+    return replay_undo(journal_path, contents, jobs, stats)
+
+
+def undo(run_id: str | None = None, jobs: int = 1, stats: Stats | None = None) -> int:
+    from .undo import find_undo_log, state_dir, UndoError
+
+    try:
+        undo_log = find_undo_log(state_dir(), run_id)
+    except UndoError as undo_error:
+        print(undo_error, file=sys.stderr)
+        return 1
+
+    print(f"Undoing run {undo_log.run_id}", file=sys.stderr)
+    return replay_undo(undo_log.path, undo_log.contents, jobs, stats)
+
+
+def commit_with_args(
+    moves: Iterable[tuple[str, str]], args: CliArgs, stats: Stats | None = None
+) -> int:
+    run_id = None
+    journal_path = args.journal
+    if args.save_undo:
+        from .undo import new_undo_log_path, state_dir
+
+        run_id, journal_path = new_undo_log_path(state_dir())
+
+    status = commit(
+        moves,
+        journal_path,
+        args.journal_sync,
+        args.jobs,
+        make_reporter(args),
+        args.preflight,
+        stats,
+        summarize=not args.quiet,
+    )
+
+    if run_id is not None:
+        assert journal_path is not None
+        if status == CommitResult.SUCCESS:
+            print(
+                f"Saved as run {run_id}. Undo it with: submv --undo {run_id}",
+                file=sys.stderr,
+            )
+        elif status == CommitResult.FAILED_WITH_FAILED_ROLLBACK:
+            print(
+                f"The run's journal was kept at {quote(journal_path)} for use"
+                " with --recover.",
+                file=sys.stderr,
+            )
+        else:
+            # Nothing was changed, or it was all put back, so there's
+            # nothing left to undo
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(journal_path)
+    return status.value
+
+
+def make_reporter(args: CliArgs) -> Reporter:
+    if args.quiet:
+        return QuietReporter()
+    if args.progress:
+        return ProgressReporter()
+    return VerboseReporter()
+
+
+def open_binary(path: str, mode: str) -> ContextManager[BinaryIO]:
+    # Treats - as standard input or output, which isn't closed afterwards
+    if path == "-":
+        std_stream = sys.stdin if "r" in mode else sys.stdout
+        return contextlib.nullcontext(std_stream.buffer)
+    return open(path, mode + "b")
+
+
+def apply_plan(args: CliArgs, stats: Stats | None = None) -> int:
+    assert args.apply_plan is not None
+    with open_binary(args.apply_plan, "r") as reader:
+        return commit_with_args(read_plan(reader, args.plan_format), args, stats)
+
+
 def run(args: CliArgs) -> int:
-    pattern = make_pattern(args.search, args.literal, args.ignore_case)
-    apply_func = resub_basename if args.basename else resub_path
+    if not args.stats:
+        return run_with_stats(args, None)
+
+    stats = Stats()
+    try:
+        with stats.phase("total"):
+            return run_with_stats(args, stats)
+    finally:
+        import json
+
+        print(json.dumps(stats.to_dict()), file=sys.stderr)
 
-    def map_path(src_path: str) -> str:
-        return apply_func(pattern, args.replace, src_path)
+
+def run_with_stats(args: CliArgs, stats: Stats | None) -> int:
+    if args.recover is not None:
+        return recover(args.recover, args.jobs, stats)
+    if args.undo is not None:
+        return undo(args.undo or None, args.jobs, stats)
+    if args.apply_plan is not None:
+        return apply_plan(args, stats)
+
+    if args.rules is not None:
+        try:
+            rules = load_rules(args.rules)
+            map_path = compile_rules(rules)
+        except (OSError, RulesError, re.error) as error:
+            print(f"Couldn't load rules: {error}", file=sys.stderr)
+            return 1
+    else:
+        assert args.search is not None and args.replace is not None
+        rule = Rule(
+            args.search,
+            args.replace,
+            literal=args.literal,
+            ignore_case=args.ignore_case,
+            basename=args.basename,
+        )
+        map_path = compile_rules([rule])
+    if stats is not None:
+        map_path = stats.time_calls("map_path", map_path)
+
+    fs_names = None
+    try:
+        with phase(stats, "make_plan"):
+            if args.low_memory:
+                from .compactplan import make_compact_plan
+
+                plan = make_compact_plan(map_path, iter_input_paths(args))
+            else:
+                if args.check_fs:
+                    from .fsnames import FileSystemNames
+
+                    fs_names = FileSystemNames()
+                plan = make_plan(map_path, iter_input_paths(args), fs_names)
+    except OSError as search_error:
+        # Such as a directory that -r can't list. Renaming the rest could
+        # move a directory without the contents that should go with it.
+        print(f"Couldn't find the paths to rename: {search_error}", file=sys.stderr)
+        print("No changes were made.", file=sys.stderr)
+        return 1
+    if stats is not None:
+        stats.count("matched", plan.matched)
+        stats.count("unmatched", plan.unmatched)
+        if fs_names is not None:
+            stats.count("scandir", fs_names.scandir_count)
+    if not args.dry_run and not args.quiet:
+        print_summary(plan, file=sys.stderr)
+
+    if args.emit_plan is not None:
+        if plan.has_conflicts:
+            print_conflicts(plan, file=sys.stderr)
+            print("\nNo plan was written.", file=sys.stderr)
+            return 1
+        with open_binary(args.emit_plan, "w") as writer:
+            write_plan(plan.valid_moves, writer, args.plan_format)
+        return 0
 
     if args.dry_run:
         print(
             "Showing plan because --dry-run was specified.\n"
             "No changes will be made.\n"
         )
-        plan = make_plan(map_path, args.paths)
         print_plan(plan)
-        return 1 if plan.has_conflicts else 0
+        print()
+        print_summary(plan)
+        if plan.has_conflicts:
+            return 1
 
-    status = commit(map_path, args.paths)
-    return status.value
+        if not args.low_memory:
+            # Scheduling holds every path in full, which would undo the
+            # savings of a compact plan
+            print_extra_renames(schedule_moves(plan.valid_moves))
+        return 0
+
+    if plan.has_conflicts:
+        print_conflicts(plan, file=sys.stderr)
+        print("\nNo changes were made.", file=sys.stderr)
+        return 1
+
+    return commit_with_args(plan.valid_moves, args, stats)
 
 
 def main() -> int:
     p = make_arg_parser()
     args = CliArgs(**vars(p.parse_args()))
+    # Options shared by several modes are checked before any mode returns
+    if args.jobs < 1:
+        p.error("--jobs must be at least 1")
+    if args.journal_sync < 1:
+        p.error("--journal-sync must be at least 1")
+    if args.save_undo and args.journal is not None:
+        p.error("--save-undo can't be combined with --journal")
+    if args.recover is not None or args.undo is not None:
+        return run(args)
+    if args.apply_plan is not None:
+        if args.dry_run or args.emit_plan is not None:
+            p.error("--apply-plan can't be combined with --dry-run or --emit-plan")
+        return run(args)
+    if args.rules is not None:
+        if args.basename or args.literal or args.ignore_case:
+            p.error("-b, -l and -i can't be used with --rules - set them per rule")
+        # There's no SEARCH or REPLACE, so argparse will have put the first
+        # paths there
+        args.paths[:0] = [a for a in (args.search, args.replace) if a is not None]
+        args.search = args.replace = None
+    elif args.search is None or args.replace is None:
+        p.error("SEARCH and REPLACE are required")
+    if not args.paths and args.from_file is None:
+        p.error("at least one PATH or --from-file is required")
+    if args.check_fs and args.low_memory:
+        p.error("--check-fs can't be combined with --low-memory")
+    if args.low_memory and not args.dry_run and args.emit_plan is None:
+        p.error("--low-memory requires -n/--dry-run or --emit-plan")
+    if (args.include or args.exclude) and not args.recursive:
+        p.error("--include and --exclude require -r/--recursive")
     return run(args)
 
 
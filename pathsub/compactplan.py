@@ -0,0 +1,169 @@
+import os
+from array import array
+from collections.abc import Callable, Iterable, Iterator, Sequence
+
+# Leaves are stored as UTF-8 with lone surrogates passed through, so any str,
+# including paths decoded with surrogate escapes, survives the round trip
+_ENCODING = "utf-8"
+_ERRORS = "surrogatepass"
+
+
+class CompactPlan:
+    """
+    Holds the same information as a Plan, in a form that uses a small
+    fraction of the memory for very large batches.
+
+    Each move is a handful of numbers in flat arrays. The directory part of
+    each path is stored once and referred to by index, and basenames are
+    encoded end to end in one bytearray. Moves are only turned back into
+    (src, dest) tuples as they're read from valid_moves.
+    """
+
+    def __init__(self):
+        self._dirs: list[str] = []
+        self._dir_ids: dict[str, int] = {}
+        self._names = bytearray()
+        # Per move: the directory ids of the source and target, and the end
+        # offsets in _names of the source and target basenames. Each move's
+        # basenames follow on from the previous move's.
+        self._src_dirs = array("I")
+        self._dest_dirs = array("I")
+        self._name_ends = array("Q")
+        self._target_hashes = array("q")
+        self._conflicted = bytearray()
+        self.conflicts: list[tuple[list[str], str]] = []
+        # Always empty, because only make_plan checks the file system
+        self.occupied: list[tuple[str, str, str]] = []
+        self.matched = 0
+        self.unmatched = 0
+        self.valid_moves = _ValidMoves(self)
+
+    @property
+    def has_conflicts(self):
+        return len(self.conflicts) > 0 or len(self.occupied) > 0
+
+    def _intern_dir(self, path: str) -> int:
+        dir_id = self._dir_ids.get(path)
+        if dir_id is None:
+            dir_id = len(self._dirs)
+            self._dirs.append(path)
+            self._dir_ids[path] = dir_id
+        return dir_id
+
+    def _add_path(self, path: str) -> int:
+        # Splits at the same place as os.path.split, but keeps the directory
+        # part exactly as given, separators and all, so the path can be put
+        # back together by concatenation
+        leaf = os.path.split(path)[1]
+        dir_id = self._intern_dir(path[: len(path) - len(leaf)])
+        self._names += leaf.encode(_ENCODING, _ERRORS)
+        self._name_ends.append(len(self._names))
+        return dir_id
+
+    def add(self, src_path: str, target_path: str):
+        self._src_dirs.append(self._add_path(src_path))
+        self._dest_dirs.append(self._add_path(target_path))
+        self._target_hashes.append(hash(os.path.split(target_path)))
+        self._conflicted.append(0)
+
+    def __len__(self):
+        return len(self._src_dirs)
+
+    def _path(self, dir_id: int, start: int, end: int) -> str:
+        leaf = str(memoryview(self._names)[start:end], _ENCODING, _ERRORS)
+        return self._dirs[dir_id] + leaf
+
+    def move(self, index: int) -> tuple[str, str]:
+        src_start = self._name_ends[2 * index - 1] if index > 0 else 0
+        src_end, dest_end = self._name_ends[2 * index : 2 * index + 2]
+        return (
+            self._path(self._src_dirs[index], src_start, src_end),
+            self._path(self._dest_dirs[index], src_end, dest_end),
+        )
+
+    def find_conflicts(self):
+        """
+        Finds moves that share a target, in the same sense as make_plan -
+        that is, having equal os.path.split results. Called once all moves
+        are added.
+        """
+        # Sorting by hash brings moves with the same target together without
+        # building a string per move. Only moves whose hashes are equal need
+        # their targets compared, and there are normally none.
+        hashes = self._target_hashes
+        order = sorted(range(len(hashes)), key=hashes.__getitem__)
+
+        group_start = 0
+        for position in range(1, len(order) + 1):
+            if (
+                position < len(order)
+                and hashes[order[position]] == hashes[order[group_start]]
+            ):
+                continue
+            if position - group_start > 1:
+                self._resolve_group(order[group_start:position])
+            group_start = position
+
+        # They're no longer needed, and the space can be handed back
+        self._target_hashes = array("q")
+
+    def _resolve_group(self, indices: list[int]):
+        by_target: dict[tuple[str, str], list[int]] = {}
+        for index in sorted(indices):
+            target_path = self.move(index)[1]
+            by_target.setdefault(os.path.split(target_path), []).append(index)
+
+        for same_target in by_target.values():
+            if len(same_target) > 1:
+                moves = [self.move(index) for index in same_target]
+                self.conflicts.append(([src for src, _ in moves], moves[0][1]))
+                for index in same_target:
+                    self._conflicted[index] = 1
+
+
+class _ValidMoves(Sequence[tuple[str, str]]):
+    def __init__(self, plan: CompactPlan):
+        self._plan = plan
+
+    def __len__(self):
+        return len(self._plan) - self._plan._conflicted.count(1)
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        conflicted = self._plan._conflicted
+        for index in range(len(self._plan)):
+            if not conflicted[index]:
+                yield self._plan.move(index)
+
+    def __getitem__(self, index):
+        # Positional access is only here to complete the Sequence interface,
+        # and is linear time
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        for position, move in enumerate(self):
+            if position == index:
+                return move
+        raise IndexError(index)
+
+
+def make_compact_plan(
+    map_path: Callable[[str], str | None], paths: Iterable[str]
+) -> CompactPlan:
+    """
+    Does the same as make_plan, but returns a CompactPlan. Valid moves are
+    listed in the order their sources were given.
+    """
+    plan = CompactPlan()
+
+    for src_path in paths:
+        target_path = map_path(src_path)
+        if target_path is None:
+            plan.unmatched += 1
+            continue
+        plan.matched += 1
+        if target_path != src_path:
+            plan.add(src_path, target_path)
+
+    plan.find_conflicts()
+    return plan
@@ -0,0 +1,235 @@
+import errno
+import os
+import shutil
+import stat
+import sys
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+# From linux/fs.h. Makes the target share the source's data blocks, on file
+# systems that support it, such as Btrfs and XFS.
+_FICLONE = 0x40049409
+
+# The most to ask copy_file_range or sendfile for at once. Both may copy less.
+_CHUNK_SIZE = 1 << 30
+
+_BUFFER_SIZE = 1 << 20
+
+# copy_file_range and sendfile fail with these when they can't be used for a
+# particular pair of files, rather than because something is wrong
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+def _reflink(src_fd: int, dest_fd: int) -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+
+    import fcntl
+
+    try:
+        fcntl.ioctl(dest_fd, _FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+def _copy_data(src_fd: int, dest_fd: int):
+    # Tries the cheapest way to copy first, and carries on from wherever the
+    # previous way stopped if it turns out not to work for these files
+    if _reflink(src_fd, dest_fd):
+        return
+
+    offset = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied := os.copy_file_range(src_fd, dest_fd, _CHUNK_SIZE):
+                offset += copied
+            return
+        except OSError as os_error:
+            if os_error.errno not in _UNSUPPORTED:
+                raise
+            os.lseek(src_fd, offset, os.SEEK_SET)
+            os.lseek(dest_fd, offset, os.SEEK_SET)
+
+    if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+        try:
+            while sent := os.sendfile(dest_fd, src_fd, offset, _CHUNK_SIZE):
+                offset += sent
+            return
+        except OSError as os_error:
+            if os_error.errno not in _UNSUPPORTED:
+                raise
+            os.lseek(src_fd, offset, os.SEEK_SET)
+            os.lseek(dest_fd, offset, os.SEEK_SET)
+
+    while buffer := os.read(src_fd, _BUFFER_SIZE):
+        view = memoryview(buffer)
+        while view:
+            view = view[os.write(dest_fd, view) :]
+
+
+def copy_file(src, dest):
+    """
+    Copies a regular file's data, permissions and timestamps to dest, which
+    must not exist. The data is copied in the kernel where possible, by
+    cloning it on file systems that support reflinks, or with
+    copy_file_range or sendfile otherwise.
+    """
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        mode = stat.S_IMODE(os.fstat(src_fd).st_mode)
+        dest_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+        try:
+            _copy_data(src_fd, dest_fd)
+        finally:
+            os.close(dest_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(src, dest, follow_symlinks=False)
+
+
+def _copy_entry(src: str, dest: str):
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dest)
+        shutil.copystat(src, dest, follow_symlinks=False)
+    else:
+        copy_file(src, dest)
+
+
+def copy_tree(src, dest, jobs: int = 1):
+    """
+    Copies the directory src to dest, which must not exist, copying up to
+    jobs files at once. Symlinks are copied as symlinks.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    src = os.fspath(src)
+    dest = os.fspath(dest)
+    directories = []
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        for dir_path, dir_names, file_names in os.walk(src):
+            if dir_path == src:
+                target_dir = dest
+            else:
+                target_dir = os.path.join(dest, os.path.relpath(dir_path, src))
+            os.mkdir(target_dir)
+            directories.append((dir_path, target_dir))
+
+            # os.walk doesn't descend into symlinks to directories, but
+            # lists them with the directories
+            for name in dir_names:
+                if os.path.islink(os.path.join(dir_path, name)):
+                    file_names.append(name)
+
+            for name in file_names:
+                futures.append(
+                    executor.submit(
+                        _copy_entry,
+                        os.path.join(dir_path, name),
+                        os.path.join(target_dir, name),
+                    )
+                )
+
+        for future in futures:
+            future.result()
+
+    # Copying into the directories changed their timestamps, so this is
+    # done last
+    for dir_path, target_dir in reversed(directories):
+        shutil.copystat(dir_path, target_dir)
+
+
+def move_across_devices(src, dest, jobs: int = 1):
+    """
+    Moves src to dest on another file system, by copying it and then
+    removing the original. dest must not exist. If the copy fails, whatever
+    was copied is removed and src is left as it was.
+    """
+    if os.path.lexists(dest):
+        # Checked here, so that the cleanup below can't remove a file that
+        # was already there
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dest)
+
+    is_dir = os.path.isdir(src) and not os.path.islink(src)
+    try:
+        if is_dir:
+            copy_tree(src, dest, jobs)
+        else:
+            _copy_entry(os.fspath(src), os.fspath(dest))
+    except BaseException:
+        if is_dir:
+            shutil.rmtree(dest, ignore_errors=True)
+        else:
+            try:
+                os.unlink(dest)
+            except OSError:
+                pass
+        raise
+
+    if is_dir:
+        shutil.rmtree(src)
+    else:
+        os.unlink(src)
+
+
+def tree_size(path) -> int:
+    """The number of bytes in the regular files at or beneath path."""
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        return st.st_size if stat.S_ISREG(st.st_mode) else 0
+
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for name in file_names:
+            st = os.lstat(os.path.join(dir_path, name))
+            if stat.S_ISREG(st.st_mode):
+                total += st.st_size
+    return total
+
+
+@dataclass(slots=True)
+class CrossDeviceSummary:
+    moves: int = 0
+    bytes: int = 0
+
+
+def summarize_cross_device(moves: Iterable[tuple[str, str]]) -> CrossDeviceSummary:
+    """
+    Counts the moves that cross from one file system to another, and so
+    will be done by copying, and how many bytes they'll copy. Devices are
+    compared by directory, so this takes one stat per distinct directory,
+    plus a stat per file copied.
+    """
+    devices: dict[str, int | None] = {}
+
+    def device_of(directory: str) -> int | None:
+        # The device of directory, or of its nearest existing ancestor if it
+        # hasn't been created yet
+        directory = directory or os.curdir
+        if directory not in devices:
+            try:
+                devices[directory] = os.stat(directory).st_dev
+            except FileNotFoundError:
+                parent = os.path.dirname(os.path.abspath(directory))
+                if parent == os.path.abspath(directory):
+                    devices[directory] = None
+                else:
+                    devices[directory] = device_of(parent)
+            except OSError:
+                devices[directory] = None
+        return devices[directory]
+
+    summary = CrossDeviceSummary()
+    for src, dest in moves:
+        src_dev = device_of(os.path.dirname(src))
+        dest_dev = device_of(os.path.dirname(dest))
+        if src_dev is None or dest_dev is None or src_dev == dest_dev:
+            continue
+        summary.moves += 1
+        try:
+            summary.bytes += tree_size(src)
+        except OSError:
+            pass
+    return summary
@@ -1,17 +1,183 @@
-import itertools
-from pathlib import Path
+import fnmatch
+import os
+import re
+import threading
+from collections.abc import Iterable, Iterator
+from typing import TYPE_CHECKING
 
-from .agents import Agent
+if TYPE_CHECKING:
+    from .agents import Agent
 
 
-def ensure_dir_for(target, agent: Agent):
+def self_and_ancestors(path: str):
+    # Yields path, then its parent, its parent's parent, and so on. Relative
+    # paths stop at their first component rather than yielding "" or ".".
+    while True:
+        yield path
+        parent = os.path.dirname(path)
+        if parent == path or not parent:
+            return
+        path = parent
+
+
+class DirectoryCache:
+    """
+    Remembers which directories are known to exist during a run, so each
+    distinct directory is checked with at most one stat call.
+
+    If a directory is known to exist, so are all its ancestors - the cache
+    relies on this, so entries must only be added through add().
+
+    Safe to use from multiple threads, as it is by HistoryAgent when moves
+    or a rollback are performed in parallel.
+    """
+
+    def __init__(self):
+        self._known: set[str] = set()
+        # Known directories by parent, so discard_tree only visits the
+        # directories it forgets, rather than every one that's known
+        self._children: dict[str, set[str]] = {}
+        self.stat_count = 0
+        # Held by ensure_dir_for while checking for and creating directories,
+        # so concurrent callers don't both try to create the same one
+        self.lock = threading.Lock()
+        # Guards _known, _children and stat_count. Only held briefly, never
+        # while calling out, so it can be taken while lock is held.
+        self._known_lock = threading.Lock()
+
+    def __contains__(self, path) -> bool:
+        path = os.fspath(path)
+        with self._known_lock:
+            return path in self._known
+
+    def exists(self, path) -> bool:
+        path = os.fspath(path)
+        with self._known_lock:
+            if path in self._known:
+                return True
+            self.stat_count += 1
+
+        if os.path.isdir(path):
+            self.add(path)
+            return True
+        return False
+
+    def add(self, path):
+        with self._known_lock:
+            for ancestor in self_and_ancestors(os.fspath(path)):
+                if ancestor in self._known:
+                    break
+                self._known.add(ancestor)
+                parent = os.path.dirname(ancestor)
+                if parent and parent != ancestor:
+                    self._children.setdefault(parent, set()).add(ancestor)
+
+    def discard_tree(self, path):
+        # Forget path and everything under it, because it has been removed
+        # or moved
+        path = os.fspath(path).rstrip(os.sep)
+        with self._known_lock:
+            if path not in self._known:
+                # Because the cache is closed under ancestors, nothing beneath
+                # path can be known either
+                return
+            parent = os.path.dirname(path)
+            siblings = self._children.get(parent)
+            if siblings is not None:
+                siblings.discard(path)
+                if not siblings:
+                    del self._children[parent]
+
+            to_forget = [path]
+            while to_forget:
+                forgotten = to_forget.pop()
+                self._known.discard(forgotten)
+                to_forget.extend(self._children.pop(forgotten, ()))
+
+
+def ensure_dir_for(target, agent: "Agent", dir_cache: DirectoryCache | None = None):
     # Basically mkdir -p, which Python provides, but we need to use
     # the Agent so it can record rollback history
-    to_make = list(
-        itertools.takewhile(
-            lambda a: not a.exists(),
-            Path(target).parents,
-        )
-    )
-    for ancestor in reversed(to_make):
-        agent.mkdir(ancestor)
+    if dir_cache is None:
+        dir_cache = DirectoryCache()
+
+    parent = os.path.dirname(os.fspath(target))
+    if not parent or parent in dir_cache:
+        return
+
+    with dir_cache.lock:
+        to_make = []
+        for ancestor in self_and_ancestors(parent):
+            if dir_cache.exists(ancestor):
+                break
+            to_make.append(ancestor)
+
+        for ancestor in reversed(to_make):
+            agent.mkdir(ancestor)
+            dir_cache.add(ancestor)
+
+
+def compile_globs(globs: Iterable[str]) -> re.Pattern | None:
+    # Combines shell-style globs into one pattern that matches a name if any
+    # of them do. Returns None if there are no globs.
+    translated = [fnmatch.translate(glob) for glob in globs]
+    if not translated:
+        return None
+    return re.compile("|".join(translated))
+
+
+def walk_bottom_up(
+    root: str,
+    include: re.Pattern | None = None,
+    exclude: re.Pattern | None = None,
+) -> Iterator[str]:
+    """
+    Yields the paths of everything beneath root, and root itself, with the
+    contents of each directory before the directory, so renaming a
+    directory never changes the path of anything still to be yielded.
+    Symbolic links are yielded but not followed.
+
+    Anything whose name matches exclude is skipped, along with its contents
+    if it's a directory. If include is specified, only paths whose names
+    match it are yielded, but all directories that aren't excluded are
+    still searched.
+    """
+
+    def is_yielded(name: str) -> bool:
+        return include is None or include.match(name) is not None
+
+    root_name = os.path.basename(os.path.normpath(root))
+    if exclude is not None and exclude.match(root_name):
+        return
+
+    if not os.path.isdir(root) or os.path.islink(root):
+        if is_yielded(root_name):
+            yield root
+        return
+
+    # Iterative rather than recursive, so depth isn't limited by the
+    # interpreter's recursion limit. Each stack entry holds an open scandir
+    # iterator, which is resumed when the directory beneath it is finished.
+    stack = [(root, os.scandir(root))]
+    try:
+        while stack:
+            dir_path, entries = stack[-1]
+            for entry in entries:
+                if exclude is not None and exclude.match(entry.name):
+                    continue
+                # DirEntry caches the file type from the directory listing,
+                # so this doesn't need a stat call on most file systems
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, os.scandir(entry.path)))
+                    break
+                if is_yielded(entry.name):
+                    yield entry.path
+            else:
+                entries.close()
+                stack.pop()
+                name = os.path.basename(dir_path) if stack else root_name
+                if name not in (os.curdir, os.pardir) and is_yielded(name):
+                    yield dir_path
+    finally:
+        for _, entries in stack:
+            entries.close()
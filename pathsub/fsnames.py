@@ -0,0 +1,157 @@
+import os
+import unicodedata
+from collections.abc import Callable
+from dataclasses import dataclass
+
+NameKey = Callable[[str], str]
+
+
+def exact_key(name: str) -> str:
+    return name
+
+
+def casefold_key(name: str) -> str:
+    return name.casefold()
+
+
+def nfc_key(name: str) -> str:
+    return unicodedata.normalize("NFC", name)
+
+
+def casefold_nfc_key(name: str) -> str:
+    return unicodedata.normalize("NFC", unicodedata.normalize("NFC", name).casefold())
+
+
+@dataclass(slots=True)
+class _Traits:
+    # None until a directory on the file system had an entry that could
+    # settle the question
+    ignores_case: bool | None = None
+    ignores_normalization: bool | None = None
+
+    def key(self) -> NameKey:
+        if self.ignores_case:
+            return casefold_nfc_key if self.ignores_normalization else casefold_key
+        return nfc_key if self.ignores_normalization else exact_key
+
+
+@dataclass(slots=True)
+class DirectoryListing:
+    # Identifies the directory however its path is spelled
+    identity: tuple
+    # Maps names to keys such that names with equal keys refer to the same
+    # file in this directory
+    key: NameKey
+    names: list[str]
+
+
+def _same_file(path: str, variant: str) -> bool | None:
+    # Whether variant names the same file as path, or None if that can't be
+    # told because path itself has gone
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        return None
+    try:
+        return os.path.samestat(stat, os.lstat(variant))
+    except FileNotFoundError:
+        return False
+    except OSError:
+        return None
+
+
+def _normalization_variant(name: str) -> str:
+    nfc = unicodedata.normalize("NFC", name)
+    return nfc if nfc != name else unicodedata.normalize("NFD", name)
+
+
+class FileSystemNames:
+    """
+    Finds out which file names each file system treats as the same - for
+    example, names that differ only in case on a case-insensitive file
+    system, or only in Unicode normalization on one that normalizes names.
+
+    Nothing is created to find this out. Instead, the entries that a
+    directory listing finds anyway are looked up under a different case or
+    normalization, which costs one lstat per question per file system, as
+    long as some directory on it has a suitable entry. Until one does,
+    names on that file system are compared exactly.
+    """
+
+    def __init__(self):
+        self._traits: dict[int, _Traits] = {}
+        self.scandir_count = 0
+
+    def list_dir(self, directory: str) -> DirectoryListing | None:
+        """
+        Lists directory, or returns None if it doesn't exist or can't be
+        read.
+        """
+        directory = directory or os.curdir
+        try:
+            dir_stat = os.stat(directory)
+            self.scandir_count += 1
+            with os.scandir(directory) as entries:
+                names = [entry.name for entry in entries]
+        except OSError:
+            return None
+
+        traits = self._traits.setdefault(dir_stat.st_dev, _Traits())
+        if traits.ignores_case is None or traits.ignores_normalization is None:
+            self._learn(traits, directory, names)
+
+        return DirectoryListing((dir_stat.st_dev, dir_stat.st_ino), traits.key(), names)
+
+    def key_for_missing(self, directory: str) -> NameKey:
+        """
+        Returns the key for names in a directory that doesn't exist yet,
+        from what's known about the file system of its nearest existing
+        ancestor.
+        """
+        path = os.path.abspath(directory)
+        while True:
+            try:
+                dev = os.stat(path).st_dev
+                break
+            except OSError:
+                parent = os.path.dirname(path)
+                if parent == path:
+                    return exact_key
+                path = parent
+        traits = self._traits.get(dev)
+        return traits.key() if traits is not None else exact_key
+
+    def _learn(self, traits: _Traits, directory: str, names: list[str]):
+        name_set = set(names)
+
+        if traits.ignores_case is None:
+            for name in names:
+                variant = name.swapcase()
+                if variant == name or variant.swapcase() != name:
+                    continue
+                if variant in name_set:
+                    # Two entries differing only in case can only coexist
+                    # where case matters
+                    traits.ignores_case = False
+                else:
+                    traits.ignores_case = _same_file(
+                        os.path.join(directory, name),
+                        os.path.join(directory, variant),
+                    )
+                if traits.ignores_case is not None:
+                    break
+
+        if traits.ignores_normalization is None:
+            for name in names:
+                variant = _normalization_variant(name)
+                if variant == name:
+                    continue
+                if variant in name_set:
+                    traits.ignores_normalization = False
+                else:
+                    traits.ignores_normalization = _same_file(
+                        os.path.join(directory, name),
+                        os.path.join(directory, variant),
+                    )
+                if traits.ignores_normalization is not None:
+                    break
@@ -0,0 +1,191 @@
+import os
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from .agents import Agent, Mkdir, Move, Operation, Rmdir
+
+# A journal is this header, followed by a sequence of records. Each record
+# is a one-byte type, then its fields, with the type and each field followed
+# by a NUL byte. NUL is the only byte that can't appear in a path, so paths
+# are written as-is, without any escaping.
+_HEADER = b"submv-journal-1\0"
+
+_MOVE = b"M"
+_MKDIR = b"D"
+_RMDIR = b"R"
+_COMMITTED = b"C"
+_ROLLED_BACK = b"B"
+
+_FIELD_COUNTS = {
+    _MOVE: 2,
+    _MKDIR: 1,
+    _RMDIR: 1,
+    _COMMITTED: 0,
+    _ROLLED_BACK: 0,
+}
+
+
+class JournalError(Exception):
+    pass
+
+
+def _encode_operation(op: Operation) -> bytes:
+    if isinstance(op, Move):
+        return b"M\0%s\0%s\0" % (os.fsencode(op.src), os.fsencode(op.dest))
+    if isinstance(op, Mkdir):
+        return b"D\0%s\0" % os.fsencode(op.path)
+    if isinstance(op, Rmdir):
+        return b"R\0%s\0" % os.fsencode(op.path)
+    raise TypeError(f"Can't journal {type(op).__name__}")
+
+
+class Journal:
+    """
+    An append-only record of operations, written before each operation is
+    performed, so they can be undone with submv --recover, or cli.recover,
+    if the process dies before it can roll back.
+
+    Every record is handed to the OS as soon as it's written, which
+    protects against the process being killed. Protecting against power
+    loss or a kernel crash needs an fsync, which is slow, so it's done once
+    every sync_interval records. Up to that many of the most recent records
+    could be lost in such an event.
+    """
+
+    def __init__(self, path, sync_interval: int = 1000):
+        if sync_interval < 1:
+            raise ValueError("sync_interval must be at least 1")
+
+        self._sync_interval = sync_interval
+        self._unsynced = 0
+        # Unbuffered, so each record is a single write() call. Exclusive, so
+        # we never append to the journal of a run that might need recovering.
+        self._file = open(path, "xb", buffering=0)
+        self._file.write(_HEADER)
+        self.sync()
+        _fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, op: Operation):
+        self._write(_encode_operation(op))
+
+    def mark_committed(self):
+        self._write(_COMMITTED + b"\0")
+        self.sync()
+
+    def mark_rolled_back(self):
+        self._write(_ROLLED_BACK + b"\0")
+        self.sync()
+
+    def sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._unsynced += 1
+        if self._unsynced >= self._sync_interval:
+            self.sync()
+
+
+def _fsync_dir(path: str):
+    # Makes sure a newly created file's directory entry is durable
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _iter_records(path, chunk_size: int = 1 << 16) -> Iterator[tuple[bytes, ...]]:
+    with open(path, "rb") as reader:
+        if reader.read(len(_HEADER)) != _HEADER:
+            raise JournalError(f"{path!r} is not a submv journal")
+
+        pending = b""
+        fields: list[bytes] = []
+        while chunk := reader.read(chunk_size):
+            pieces = (pending + chunk).split(b"\0")
+            pending = pieces.pop()
+            for piece in pieces:
+                fields.append(piece)
+                field_count = _FIELD_COUNTS.get(fields[0])
+                if field_count is None:
+                    raise JournalError(f"{path!r} is corrupt")
+                if len(fields) == field_count + 1:
+                    yield tuple(fields)
+                    fields = []
+        # Anything left over is a record that was only partly written when
+        # the process died. Its operation was never started, so it's ignored.
+
+
+@dataclass(slots=True)
+class JournalContents:
+    operations: list[Operation]
+    committed: bool = False
+    rolled_back: bool = False
+
+    @property
+    def finished(self):
+        return self.committed or self.rolled_back
+
+
+def read_journal(path) -> JournalContents:
+    contents = JournalContents([])
+    for record_type, *fields in _iter_records(path):
+        paths = [os.fsdecode(field) for field in fields]
+        if record_type == _MOVE:
+            contents.operations.append(Move(*paths))
+        elif record_type == _MKDIR:
+            contents.operations.append(Mkdir(*paths))
+        elif record_type == _RMDIR:
+            contents.operations.append(Rmdir(*paths))
+        elif record_type == _COMMITTED:
+            contents.committed = True
+        elif record_type == _ROLLED_BACK:
+            contents.rolled_back = True
+    return contents
+
+
+def mark_journal_rolled_back(path):
+    with open(path, "ab") as writer:
+        writer.write(_ROLLED_BACK + b"\0")
+        writer.flush()
+        os.fsync(writer.fileno())
+
+
+class RecoveryAgent(Agent):
+    """
+    Wraps another Agent, skipping any operation whose outcome is already in
+    place. A journal records each operation before it's performed, so when
+    recovering, the last operation may never have happened. Recovery may
+    also be resuming an earlier rollback that was interrupted.
+    """
+
+    def __init__(self, delegate: Agent):
+        self._delegate = delegate
+
+    def move(self, src, dest) -> None:
+        if not os.path.lexists(src) and os.path.lexists(dest):
+            return
+        self._delegate.move(src, dest)
+
+    def mkdir(self, path) -> None:
+        if os.path.isdir(path):
+            return
+        self._delegate.mkdir(path)
+
+    def rmdir(self, path) -> None:
+        if not os.path.lexists(path):
+            return
+        self._delegate.rmdir(path)
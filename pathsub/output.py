@@ -0,0 +1,127 @@
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from shlex import quote
+from typing import TextIO
+
+
+class BufferedWriter:
+    """
+    Collects lines of text and writes them to a stream in large chunks,
+    rather than making a write call per line, which is slow when the stream
+    is a pipe or a slow terminal. Safe to use from multiple threads.
+    """
+
+    def __init__(self, stream: TextIO, buffer_size: int = 1 << 16):
+        self._stream = stream
+        self._buffer_size = buffer_size
+        self._lines: list[str] = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    def write_line(self, line: str = ""):
+        with self._lock:
+            self._lines.append(line)
+            self._buffered += len(line) + 1
+            if self._buffered >= self._buffer_size:
+                self._write_buffered()
+
+    def flush(self):
+        with self._lock:
+            self._write_buffered()
+            self._stream.flush()
+
+    def _write_buffered(self):
+        if self._lines:
+            self._lines.append("")
+            self._stream.write("\n".join(self._lines))
+            self._lines.clear()
+            self._buffered = 0
+
+
+class Reporter(ABC):
+    """Reports the progress of a commit."""
+
+    @abstractmethod
+    def move(self, src: str, dest: str) -> None: ...
+
+    def close(self) -> None:
+        """Finishes any output. Can be called more than once."""
+
+
+class QuietReporter(Reporter):
+    def move(self, src: str, dest: str) -> None:
+        pass
+
+
+class VerboseReporter(Reporter):
+    """Writes each move as an mv command."""
+
+    def __init__(self, writer: BufferedWriter | None = None):
+        self._writer = writer or BufferedWriter(sys.stdout)
+
+    def move(self, src: str, dest: str) -> None:
+        self._writer.write_line(f"mv {quote(src)} {quote(dest)}")
+
+    def close(self) -> None:
+        self._writer.flush()
+
+
+class ProgressReporter(Reporter):
+    """
+    Shows a count of completed moves and the rate they're happening,
+    redrawn in place every interval seconds from the first move until
+    close() is called, so the rate keeps updating during a slow move.
+    """
+
+    def __init__(self, stream: TextIO | None = None, interval: float = 0.25):
+        self._stream = stream or sys.stderr
+        self._interval = interval
+        self._count = 0
+        # Set by the first move, so time spent before moving anything, such
+        # as scheduling, doesn't count against the rate
+        self._start = 0.0
+        self._drawn = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._timer: threading.Thread | None = None
+
+    def move(self, src: str, dest: str) -> None:
+        with self._lock:
+            self._count += 1
+            if self._timer is None:
+                self._start = time.monotonic()
+                self._stop.clear()
+                # A daemon, so a caller that never closes the reporter
+                # doesn't keep the process alive
+                self._timer = threading.Thread(target=self._redraw, daemon=True)
+                self._timer.start()
+
+    def close(self) -> None:
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            self._stop.set()
+            # Outside the lock, which the timer takes to draw
+            timer.join()
+
+        with self._lock:
+            if self._count > 0 or self._drawn:
+                self._draw(time.monotonic())
+                self._stream.write("\n")
+                self._stream.flush()
+                self._count = 0
+                self._drawn = False
+
+    def _redraw(self):
+        while not self._stop.wait(self._interval):
+            with self._lock:
+                self._draw(time.monotonic())
+
+    def _draw(self, now: float):
+        elapsed = now - self._start
+        rate = self._count / elapsed if elapsed > 0 else 0.0
+        self._stream.write(f"\r{self._count} moved ({rate:.0f}/s)")
+        self._stream.flush()
+        self._drawn = True
@@ -0,0 +1,93 @@
+import os
+from collections.abc import Iterable, Iterator
+from typing import BinaryIO
+
+# A JSON Lines plan starts with this header line, followed by one line per
+# move in the form {"src": ..., "dest": ...}. Paths that aren't valid in the
+# file system encoding are written with surrogate escapes, which json
+# preserves as \udcXX.
+#
+# A NUL plan is just the source and target of each move, each followed by a
+# NUL byte, as raw file system paths.
+PLAN_FORMATS = ("jsonl", "nul")
+
+_JSONL_HEADER = {"format": "submv-plan", "version": 1}
+
+
+class PlanFormatError(Exception):
+    pass
+
+
+def write_plan(moves: Iterable[tuple[str, str]], writer: BinaryIO, fmt: str = "jsonl"):
+    if fmt == "jsonl":
+        _write_jsonl(moves, writer)
+    elif fmt == "nul":
+        _write_nul(moves, writer)
+    else:
+        raise ValueError(f"Unknown plan format {fmt!r}")
+
+
+def read_plan(
+    reader: BinaryIO, fmt: str = "jsonl", chunk_size: int = 1 << 16
+) -> Iterator[tuple[str, str]]:
+    """
+    Yields the moves in a plan written by write_plan, one at a time, so the
+    whole plan needn't be held in memory.
+    """
+    if fmt == "jsonl":
+        return _read_jsonl(reader)
+    if fmt == "nul":
+        return _read_nul(reader, chunk_size)
+    raise ValueError(f"Unknown plan format {fmt!r}")
+
+
+def _write_jsonl(moves: Iterable[tuple[str, str]], writer: BinaryIO):
+    import json
+
+    encoder = json.JSONEncoder()
+    writer.write(encoder.encode(_JSONL_HEADER).encode("ascii") + b"\n")
+    for src, dest in moves:
+        line = encoder.encode({"src": src, "dest": dest})
+        writer.write(line.encode("ascii") + b"\n")
+
+
+def _read_jsonl(reader: BinaryIO) -> Iterator[tuple[str, str]]:
+    import json
+
+    header = reader.readline()
+    try:
+        if json.loads(header) != _JSONL_HEADER:
+            raise PlanFormatError("Not a submv plan, or an unsupported version")
+    except ValueError as value_error:
+        raise PlanFormatError("Not a submv plan") from value_error
+
+    for line_number, line in enumerate(reader, 2):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            yield record["src"], record["dest"]
+        except (ValueError, KeyError, TypeError) as error:
+            raise PlanFormatError(f"Invalid move on line {line_number}") from error
+
+
+def _write_nul(moves: Iterable[tuple[str, str]], writer: BinaryIO):
+    for src, dest in moves:
+        writer.write(b"%s\0%s\0" % (os.fsencode(src), os.fsencode(dest)))
+
+
+def _read_nul(reader: BinaryIO, chunk_size: int) -> Iterator[tuple[str, str]]:
+    pending = b""
+    src = None
+    while chunk := reader.read(chunk_size):
+        pieces = (pending + chunk).split(b"\0")
+        pending = pieces.pop()
+        for piece in pieces:
+            if src is None:
+                src = os.fsdecode(piece)
+            else:
+                yield src, os.fsdecode(piece)
+                src = None
+
+    if pending or src is not None:
+        raise PlanFormatError("Plan ends with an incomplete move")
@@ -0,0 +1,83 @@
+import os
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from .fsnames import FileSystemNames
+
+
+@dataclass(slots=True)
+class Problem:
+    path: str
+    reason: str
+
+
+def check_moves(
+    moves: Sequence[tuple[str, str]], fs_names: FileSystemNames | None = None
+) -> list[Problem]:
+    """
+    Looks for moves that are bound to fail, before any are made: sources
+    that don't exist, targets that already exist and aren't moved out of the
+    way, and directories that can't be written to. A path that is the target
+    of one move and the source of another, such as a temporary name used to
+    break a cycle, is taken to exist when it's needed.
+
+    Each directory containing a source or target is listed once, rather
+    than each path being stat'ed, and each directory's permissions are
+    checked once.
+    """
+    if fs_names is None:
+        fs_names = FileSystemNames()
+
+    sources = {src for src, _ in moves}
+    targets = {dest for _, dest in moves}
+
+    paths_by_dir: dict[str, list[str]] = {}
+    for path in sources | targets:
+        paths_by_dir.setdefault(os.path.dirname(path), []).append(path)
+
+    existing: set[str] = set()
+    listed_dirs: set[str] = set()
+    for directory, paths in paths_by_dir.items():
+        listing = fs_names.list_dir(directory)
+        if listing is None:
+            # Missing, or not readable, in which case moves might still work
+            for path in paths:
+                if os.path.lexists(path):
+                    existing.add(path)
+            continue
+        listed_dirs.add(directory)
+        keys = {listing.key(name) for name in listing.names}
+        for path in paths:
+            if listing.key(os.path.basename(path)) in keys:
+                existing.add(path)
+
+    problems = []
+    for src in sorted(sources - existing - targets):
+        problems.append(Problem(src, "doesn't exist"))
+    for dest in sorted((existing & targets) - sources):
+        problems.append(Problem(dest, "already exists"))
+
+    writable: dict[str, bool] = {}
+
+    def check_writable(directory: str):
+        # Checks the directory an entry will be added to or removed from. If
+        # it doesn't exist, it will be created in its nearest existing
+        # ancestor, unless a move creates it.
+        while directory not in listed_dirs and directory not in targets:
+            if os.path.isdir(directory or os.curdir):
+                break
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return
+            directory = parent
+
+        if directory in targets or directory in writable:
+            return
+        writable[directory] = os.access(directory or os.curdir, os.W_OK | os.X_OK)
+        if not writable[directory]:
+            problems.append(Problem(directory or os.curdir, "isn't writable"))
+
+    for directory in sorted(paths_by_dir):
+        check_writable(directory)
+
+    return problems
@@ -0,0 +1,244 @@
+import os
+import re
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+
+
+def make_pattern(expr: str, literal: bool, ignore_case: bool) -> re.Pattern:
+    pattern = re.escape(expr) if literal else expr
+    return re.compile(pattern, flags=re.IGNORECASE if ignore_case else 0)
+
+
+def resub_basename(pattern: re.Pattern, repl: str, subject: str) -> str:
+    parent, leaf = os.path.split(subject)
+    new_leaf = pattern.sub(repl, leaf)
+    return os.path.join(parent, new_leaf)
+
+
+def resub_path(pattern: re.Pattern, repl: str, subject: str) -> str:
+    return pattern.sub(repl, subject)
+
+
+@dataclass(slots=True)
+class Rule:
+    search: str
+    replace: str
+    literal: bool = False
+    ignore_case: bool = False
+    basename: bool = False
+
+
+class RulesError(Exception):
+    pass
+
+
+_FLAGS = {"l": "literal", "i": "ignore_case"}
+_SCOPES = {"path": False, "basename": True}
+
+
+def parse_rules(data) -> list[Rule]:
+    """
+    Makes Rules from decoded JSON, which must be a list of objects, each
+    with these keys:
+
+    search: The regular expression or literal text to match.
+    replace: The replacement.
+    flags: Optional. A string containing any of l, for literal matching,
+        and i, for case-insensitive matching.
+    scope: Optional. Either "path" (the default) to match the whole path,
+        or "basename" to match only the basename.
+    """
+    if not isinstance(data, list):
+        raise RulesError("Rules must be a list")
+
+    rules = []
+    for index, entry in enumerate(data, 1):
+        try:
+            rule = Rule(entry["search"], entry["replace"])
+            for flag in entry.get("flags", ""):
+                setattr(rule, _FLAGS[flag], True)
+            rule.basename = _SCOPES[entry.get("scope", "path")]
+        except (KeyError, TypeError, AttributeError) as error:
+            raise RulesError(f"Rule {index} is invalid") from error
+
+        if not isinstance(rule.search, str) or not isinstance(rule.replace, str):
+            raise RulesError(f"Rule {index} is invalid")
+        rules.append(rule)
+
+    return rules
+
+
+def load_rules(path) -> list[Rule]:
+    import json
+
+    with open(path, "rb") as reader:
+        try:
+            data = json.load(reader)
+        except ValueError as value_error:
+            raise RulesError(f"{path!r} is not valid JSON") from value_error
+    return parse_rules(data)
+
+
+# Maps a path or basename to its replacement, or to None if the search
+# didn't match, so callers can tell "no match" apart from "no change"
+# without comparing strings, and nothing is built for paths that don't match
+Substitution = Callable[[str], str | None]
+
+
+def make_regex_sub(pattern: re.Pattern, repl: str) -> Substitution:
+    """
+    Returns a function that does pattern.sub, but first checks for a match
+    with pattern.search, which is much cheaper than a sub that changes
+    nothing.
+    """
+
+    def sub(subject: str) -> str | None:
+        if pattern.search(subject) is None:
+            return None
+        return pattern.sub(repl, subject)
+
+    return sub
+
+
+def make_literal_sub(needle: str, repl: str, ignore_case: bool) -> Substitution:
+    """
+    Returns a function that replaces each occurrence of needle in a string
+    with repl, with the same result as re.sub with the escaped needle as the
+    pattern, but using str methods instead of the regex engine where
+    possible. Like make_regex_sub, the function returns None if needle
+    doesn't occur.
+    """
+    pattern = make_pattern(needle, True, ignore_case)
+    # repl is still a re template, so escapes like \n must be expanded the
+    # same way. Every match is the needle itself, so this is the
+    # replacement for every match, unless case is ignored and repl refers
+    # to the matched text, which could then be cased differently.
+    expansion = pattern.sub(repl, needle)
+
+    if not ignore_case or not needle:
+
+        def sub(subject: str) -> str | None:
+            if needle not in subject:
+                return None
+            return subject.replace(needle, expansion)
+
+        return sub
+
+    if not needle.isascii() or "\\" in repl:
+        return make_regex_sub(pattern, repl)
+
+    folded = needle.lower()
+    width = len(needle)
+    # ASCII characters other than letters only ever match themselves, so
+    # if the needle has some, the longest run of them is a cheap way to rule
+    # out most subjects without lowercasing them
+    anchor = max(re.split("[A-Za-z]+", needle), key=len)
+
+    regex_sub = make_regex_sub(pattern, repl)
+
+    def sub_ignore_case(subject: str) -> str | None:
+        if anchor not in subject:
+            return None
+
+        # Lowercasing only lines up character-for-character with the
+        # original, and only agrees with re's case folding, for ASCII.
+        # re.IGNORECASE also matches some non-ASCII characters to ASCII
+        # ones, such as the Kelvin sign to k.
+        if not subject.isascii():
+            return regex_sub(subject)
+
+        haystack = subject.lower()
+        start = haystack.find(folded)
+        if start < 0:
+            return None
+
+        pieces = []
+        end = 0
+        while start >= 0:
+            pieces.append(subject[end:start])
+            pieces.append(expansion)
+            end = start + width
+            start = haystack.find(folded, end)
+        pieces.append(subject[end:])
+        return "".join(pieces)
+
+    return sub_ignore_case
+
+
+def _on_basename(sub: Substitution) -> Substitution:
+    def apply(path: str) -> str | None:
+        parent, leaf = os.path.split(path)
+        new_leaf = sub(leaf)
+        if new_leaf is None:
+            return None
+        return os.path.join(parent, new_leaf)
+
+    return apply
+
+
+def _combine(patterns: list[re.Pattern]) -> Callable[[str], bool]:
+    # Returns a function that tells whether any of patterns would match a
+    # string. Patterns without groups are combined into one alternation so
+    # the string is only scanned once. Patterns with groups could have
+    # backreferences, which would refer to the wrong group once combined,
+    # so they're tried separately.
+    simple = [p for p in patterns if p.groups == 0]
+    separate = [p for p in patterns if p.groups > 0]
+
+    if len(simple) > 1:
+        alternatives = [
+            f"(?i:{p.pattern})" if p.flags & re.IGNORECASE else f"(?:{p.pattern})"
+            for p in simple
+        ]
+        try:
+            simple = [re.compile("|".join(alternatives))]
+        except re.error:
+            # For example, a pattern that sets global flags inline
+            pass
+
+    searches = [p.search for p in simple + separate]
+    return lambda subject: any(search(subject) for search in searches)
+
+
+def compile_rules(rules: Sequence[Rule]) -> Substitution:
+    """
+    Returns a function that applies each rule in turn to a path, each rule
+    to the result of the one before, so a path can be changed by several
+    rules and still be renamed only once. The function returns None if no
+    rule matches the path.
+    """
+    patterns = []
+    subs = []
+    for rule in rules:
+        pattern = make_pattern(rule.search, rule.literal, rule.ignore_case)
+        if rule.literal:
+            sub = make_literal_sub(rule.search, rule.replace, rule.ignore_case)
+        else:
+            sub = make_regex_sub(pattern, rule.replace)
+        patterns.append(pattern)
+        subs.append(_on_basename(sub) if rule.basename else sub)
+
+    if len(subs) == 1:
+        return subs[0]
+
+    # If no rule matches the original path, no rule can change it, so this
+    # skips the rules entirely for most paths that are left unchanged
+    path_matches = _combine(
+        [p for p, rule in zip(patterns, rules) if not rule.basename]
+    )
+    basename_matches = _combine(
+        [p for p, rule in zip(patterns, rules) if rule.basename]
+    )
+
+    def map_path(path: str) -> str | None:
+        if not path_matches(path) and not basename_matches(os.path.basename(path)):
+            return None
+        matched = False
+        for sub in subs:
+            new_path = sub(path)
+            if new_path is not None:
+                path = new_path
+                matched = True
+        return path if matched else None
+
+    return map_path
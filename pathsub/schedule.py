@@ -0,0 +1,145 @@
+import os
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from .fs import self_and_ancestors
+
+# Matches the part of a name added by generate_temp_name
+_TEMP_NAME_MARK = re.compile(r"__submv[A-Z2-7]{8}")
+
+
+def generate_temp_name(path: str):
+    # Imported here because most runs never need a temporary name
+    import base64
+    import random
+
+    stem, suffix = os.path.splitext(path)
+    some_bytes = random.randbytes(5)
+    some_text = base64.b32encode(some_bytes).decode("ascii")
+    return f"{stem}__submv{some_text}{suffix}"
+
+
+def is_temp_name(path: str) -> bool:
+    return _TEMP_NAME_MARK.search(os.path.basename(path)) is not None
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+@dataclass(slots=True)
+class Schedule:
+    moves: list[tuple[str, str]]
+    extra_renames: int
+
+
+def schedule_moves(moves: Iterable[tuple[str, str]]) -> Schedule:
+    """
+    Orders moves so that none of them targets a path that is the source of
+    a move that hasn't happened yet. Chains like a→b, b→c are performed
+    from the end (b→c, then a→b). Cycles like a→b, b→a need a temporary
+    name to break them, which costs one extra rename per cycle. Otherwise,
+    moves are kept in the order given.
+
+    Sources must be unique, as must targets, which is the case for a Plan's
+    valid_moves. ScheduleError is raised if they aren't.
+    """
+    dest_by_src: dict[str, str] = {}
+    targets: set[str] = set()
+    for src, dest in moves:
+        if src == dest:
+            continue
+        if src in dest_by_src:
+            raise ScheduleError(f"{src!r} is moved more than once")
+        if dest in targets:
+            raise ScheduleError(f"More than one path is moved to {dest!r}")
+        dest_by_src[src] = dest
+        targets.add(dest)
+
+    scheduled: set[str] = set()
+    schedule = Schedule([], 0)
+
+    def follow(src: str) -> list[tuple[str, str]]:
+        # Collects the moves that src's move depends on, stopping at the end
+        # of a chain or on returning to an already scheduled source
+        chain = []
+        while src in dest_by_src and src not in scheduled:
+            scheduled.add(src)
+            dest = dest_by_src[src]
+            chain.append((src, dest))
+            src = dest
+        return chain
+
+    # Each source is handled in input order, along with the moves it
+    # depends on, so moves keep their input order wherever they can - in
+    # particular, a directory's contents are still moved before it
+    for src in dest_by_src:
+        chain = follow(src)
+        if not chain:
+            continue
+        if chain[-1][1] != src:
+            schedule.moves.extend(reversed(chain))
+            continue
+
+        # The chain led back to src, so it's a cycle
+        (first_src, first_dest), rest = chain[0], chain[1:]
+        temp_path = generate_temp_name(first_src)
+        schedule.moves.append((first_src, temp_path))
+        schedule.moves.extend(reversed(rest))
+        schedule.moves.append((temp_path, first_dest))
+        schedule.extra_renames += 1
+
+    return schedule
+
+
+def partition_moves(moves: list[tuple[str, str]]) -> list[list[tuple[str, str]]]:
+    """
+    Splits scheduled moves into groups that share no source or target
+    directories, so different groups can safely run at the same time. Moves
+    keep their scheduled order within each group.
+
+    A move is also grouped with any move whose source or target is one of
+    its ancestors, so a directory is never moved while something is being
+    moved in or out of it.
+    """
+    endpoints = {path for move in moves for path in move}
+    union_find = _UnionFind()
+
+    for src, dest in moves:
+        keys = [src, dest]
+        for path in (src, dest):
+            parent = os.path.dirname(path)
+            keys.append(parent)
+            keys.extend(
+                ancestor
+                for ancestor in self_and_ancestors(parent)
+                if ancestor in endpoints
+            )
+        union_find.union_all(keys)
+
+    groups: dict[str, list[tuple[str, str]]] = {}
+    for move in moves:
+        groups.setdefault(union_find.find(move[0]), []).append(move)
+    return list(groups.values())
+
+
+class _UnionFind:
+    def __init__(self):
+        self._parents: dict[str, str] = {}
+
+    def find(self, key: str) -> str:
+        root = key
+        while (parent := self._parents.get(root, root)) != root:
+            root = parent
+        # Path compression
+        while key != root:
+            self._parents[key], key = root, self._parents[key]
+        return root
+
+    def union_all(self, keys: list[str]):
+        root = self.find(keys[0])
+        for key in keys[1:]:
+            other_root = self.find(key)
+            if other_root != root:
+                self._parents[other_root] = root
@@ -0,0 +1,160 @@
+import contextlib
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from typing import TypeVar
+
+from .agents import Agent
+from .schedule import is_temp_name
+
+# Called with "phase" or "operation", the phase or operation's name, and how
+# many seconds it took
+StatsHook = Callable[[str, str, float], None]
+
+T = TypeVar("T")
+
+
+@dataclass(slots=True)
+class LatencyHistogram:
+    """
+    Counts durations in buckets whose upper bounds are powers of two
+    microseconds, so that the buckets stay few however spread out the
+    durations are.
+    """
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    buckets: Counter = field(default_factory=Counter)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        micros = int(seconds * 1_000_000)
+        # The smallest power of two that is at least micros
+        self.buckets[1 << max(micros - 1, 0).bit_length()] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_seconds": self.total,
+            "max_seconds": self.max,
+            "histogram_us": {
+                str(bound): self.buckets[bound] for bound in sorted(self.buckets)
+            },
+        }
+
+
+class Stats:
+    """
+    Collects how long each phase of a run takes, how many of each kind of
+    operation it performs, and how long the operations take. Safe to use from
+    multiple threads.
+
+    Hooks added with add_hook are called as each phase or operation
+    finishes, from whichever thread performed it.
+    """
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self.counts: Counter = Counter()
+        self.latencies: dict[str, LatencyHistogram] = {}
+        self._hooks: list[StatsHook] = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: StatsHook):
+        self._hooks.append(hook)
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.add_time(name, seconds)
+            for hook in self._hooks:
+                hook("phase", name, seconds)
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counts[name] += n
+
+    def record_operation(self, name: str, seconds: float):
+        with self._lock:
+            self.counts[name] += 1
+            if name not in self.latencies:
+                self.latencies[name] = LatencyHistogram()
+            self.latencies[name].add(seconds)
+        for hook in self._hooks:
+            hook("operation", name, seconds)
+
+    def time_calls(self, name: str, func: Callable[..., T]) -> Callable[..., T]:
+        """
+        Wraps func so that the time spent in it is added to the phase called
+        name. For timing something that is called many times within another
+        phase, such as mapping each path while planning.
+        """
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add_time(name, time.perf_counter() - start)
+
+        return timed
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "phases": dict(self.phases),
+                "counts": dict(self.counts),
+                "latencies": {
+                    name: histogram.to_dict()
+                    for name, histogram in self.latencies.items()
+                },
+            }
+
+
+def phase(stats: Stats | None, name: str) -> contextlib.AbstractContextManager:
+    # Times a phase if there's anything to record it in
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.phase(name)
+
+
+class InstrumentedAgent(Agent):
+    """
+    Records the time each operation takes in stats, and passes it on to
+    delegate. Moves to or from a temporary name, which break cycles, are
+    counted separately from other moves.
+    """
+
+    def __init__(self, delegate: Agent, stats: Stats):
+        self._delegate = delegate
+        self._stats = stats
+
+    def move(self, src, dest):
+        name = "temp_move" if is_temp_name(src) or is_temp_name(dest) else "move"
+        self._timed(name, self._delegate.move, src, dest)
+
+    def mkdir(self, path):
+        self._timed("mkdir", self._delegate.mkdir, path)
+
+    def rmdir(self, path):
+        self._timed("rmdir", self._delegate.rmdir, path)
+
+    def _timed(self, name: str, func: Callable, *args):
+        start = time.perf_counter()
+        try:
+            func(*args)
+        finally:
+            self._stats.record_operation(name, time.perf_counter() - start)
@@ -0,0 +1,77 @@
+import os
+import time
+from dataclasses import dataclass
+
+from .journal import JournalContents, read_journal
+
+# Undo logs are journals, kept in the state directory under the run's ID
+_SUFFIX = ".journal"
+
+
+class UndoError(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class UndoLog:
+    run_id: str
+    path: str
+    contents: JournalContents
+
+
+def state_dir() -> str:
+    base = os.environ.get("XDG_STATE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".local", "state"
+    )
+    return os.path.join(base, "pathsub")
+
+
+def new_undo_log_path(directory: str) -> tuple[str, str]:
+    """
+    Returns an ID for a new run, and the path its undo log should be
+    written to. IDs sort in the order the runs were started.
+    """
+    os.makedirs(directory, exist_ok=True)
+    now = time.time()
+    micros = int(now % 1 * 1_000_000)
+    run_id = (
+        f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}"
+        f".{micros:06}-{os.urandom(3).hex()}"
+    )
+    return run_id, os.path.join(directory, run_id + _SUFFIX)
+
+
+def find_undo_log(directory: str, run_id: str | None = None) -> UndoLog:
+    """
+    Finds the undo log of the run with the given ID, or if run_id is None,
+    of the most recent run that can still be undone - that is, one that
+    was committed and hasn't been undone since.
+    """
+    if run_id is not None:
+        if not run_id or os.path.basename(run_id) != run_id:
+            raise UndoError(f"Invalid run ID {run_id!r}")
+        path = os.path.join(directory, run_id + _SUFFIX)
+        try:
+            contents = read_journal(path)
+        except FileNotFoundError:
+            raise UndoError(f"No undo log for run {run_id}") from None
+        if contents.rolled_back:
+            raise UndoError(f"Run {run_id} was already undone or rolled back")
+        if not contents.committed:
+            raise UndoError(
+                f"Run {run_id} didn't finish - use --recover {path} instead"
+            )
+        return UndoLog(run_id, path, contents)
+
+    try:
+        names = sorted(os.listdir(directory), reverse=True)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        if not name.endswith(_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        contents = read_journal(path)
+        if contents.committed and not contents.rolled_back:
+            return UndoLog(name[: -len(_SUFFIX)], path, contents)
+    raise UndoError("There are no runs to undo")
@@ -1,6 +1,21 @@
+import errno
 import os.path
-
-from pathsub.agents import Executive, HistoryAgent, Mkdir, Move, Rmdir, RollbackError
+import unittest
+from unittest import mock
+
+from pathsub import agents
+from pathsub.agents import (
+    DirFdExecutive,
+    Executive,
+    find_dependents,
+    HistoryAgent,
+    Mkdir,
+    Move,
+    RenameatExecutive,
+    Rmdir,
+    RollbackError,
+)
+from pathsub.fs import DirectoryCache
 from tests.utils_for_testing import FixtureDirTestCase, read_file, write_file
 
 TEST_CONTENT_1 = b"Test fixture 1 TTLOmpmgPPeblKWrXhvmn0Bz1wPf67ZUFTk-a1e5uN4"
@@ -46,6 +61,157 @@ class TestExecutive(FixtureDirTestCase):
         self.assertFalse(os.path.exists(the_dir))
 
 
+@unittest.skipIf(agents._load_renameat2() is None, "renameat2 not available")
+class TestRenameatExecutive(FixtureDirTestCase):
+    def test_move(self):
+        agent = RenameatExecutive()
+
+        start = os.path.join(self._fixture_dir.name, "start")
+        end = os.path.join(self._fixture_dir.name, "end")
+        write_file(start, TEST_CONTENT_1)
+
+        agent.move(start, end)
+
+        self.assertFalse(os.path.exists(start))
+        self.assertEqual(read_file(end), TEST_CONTENT_1)
+
+    def test_move_directory(self):
+        agent = RenameatExecutive()
+
+        start = os.path.join(self._fixture_dir.name, "start")
+        end = os.path.join(self._fixture_dir.name, "end")
+        os.mkdir(start)
+        write_file(os.path.join(start, "file"), TEST_CONTENT_1)
+
+        agent.move(start, end)
+
+        self.assertFalse(os.path.exists(start))
+        self.assertEqual(read_file(os.path.join(end, "file")), TEST_CONTENT_1)
+
+    def test_move_doesnt_overwrite(self):
+        agent = RenameatExecutive()
+
+        start = os.path.join(self._fixture_dir.name, "start")
+        end = os.path.join(self._fixture_dir.name, "end")
+        write_file(start, TEST_CONTENT_1)
+        write_file(end, TEST_CONTENT_2)
+
+        with self.assertRaises(FileExistsError) as cm:
+            agent.move(start, end)
+
+        self.assertEqual(cm.exception.filename, start)
+        self.assertEqual(cm.exception.filename2, end)
+        self.assertEqual(read_file(start), TEST_CONTENT_1)
+        self.assertEqual(read_file(end), TEST_CONTENT_2)
+
+    def test_move_falls_back_when_unsupported(self):
+        agent = RenameatExecutive()
+
+        start = os.path.join(self._fixture_dir.name, "start")
+        end = os.path.join(self._fixture_dir.name, "end")
+        write_file(start, TEST_CONTENT_1)
+
+        with mock.patch.object(agents, "renameat2_noreplace", return_value=False):
+            agent.move(start, end)
+
+        self.assertFalse(os.path.exists(start))
+        self.assertEqual(read_file(end), TEST_CONTENT_1)
+
+    def test_move_falls_back_across_devices(self):
+        agent = RenameatExecutive()
+
+        start = os.path.join(self._fixture_dir.name, "start")
+        end = os.path.join(self._fixture_dir.name, "end")
+        write_file(start, TEST_CONTENT_1)
+
+        exdev = OSError(errno.EXDEV, os.strerror(errno.EXDEV), start, None, end)
+        with mock.patch.object(agents, "renameat2_noreplace", side_effect=exdev):
+            agent.move(start, end)
+
+        self.assertFalse(os.path.exists(start))
+        self.assertEqual(read_file(end), TEST_CONTENT_1)
+
+
+class TestDirFdExecutive(FixtureDirTestCase):
+    def test_move(self):
+        start = os.path.join(self._fixture_dir.name, "start")
+        end = os.path.join(self._fixture_dir.name, "end")
+        write_file(start, TEST_CONTENT_1)
+
+        with DirFdExecutive() as agent:
+            agent.move(start, end)
+
+        self.assertFalse(os.path.exists(start))
+        self.assertEqual(read_file(end), TEST_CONTENT_1)
+
+    def test_move_doesnt_overwrite(self):
+        start = os.path.join(self._fixture_dir.name, "start")
+        end = os.path.join(self._fixture_dir.name, "end")
+        write_file(start, TEST_CONTENT_1)
+        write_file(end, TEST_CONTENT_2)
+
+        with DirFdExecutive() as agent:
+            with self.assertRaises(FileExistsError) as cm:
+                agent.move(start, end)
+
+        self.assertEqual(cm.exception.filename, start)
+        self.assertEqual(cm.exception.filename2, end)
+        self.assertEqual(read_file(start), TEST_CONTENT_1)
+        self.assertEqual(read_file(end), TEST_CONTENT_2)
+
+    def test_move_doesnt_overwrite_without_renameat2(self):
+        start = os.path.join(self._fixture_dir.name, "start")
+        end = os.path.join(self._fixture_dir.name, "end")
+        write_file(start, TEST_CONTENT_1)
+        write_file(end, TEST_CONTENT_2)
+
+        with mock.patch.object(agents, "renameat2_noreplace", return_value=False):
+            with DirFdExecutive() as agent:
+                self.assertRaises(FileExistsError, agent.move, start, end)
+
+        self.assertEqual(read_file(start), TEST_CONTENT_1)
+        self.assertEqual(read_file(end), TEST_CONTENT_2)
+
+    def test_mkdir_and_rmdir(self):
+        the_dir = os.path.join(self._fixture_dir.name, "foo", "bar")
+        os.mkdir(os.path.dirname(the_dir))
+
+        with DirFdExecutive() as agent:
+            agent.mkdir(the_dir)
+            self.assertTrue(os.path.isdir(the_dir))
+            agent.rmdir(the_dir)
+            self.assertFalse(os.path.exists(the_dir))
+
+    def test_open_fds_are_capped(self):
+        with DirFdExecutive(max_open_fds=2) as agent:
+            for name in ("a", "b", "c", "d"):
+                the_dir = os.path.join(self._fixture_dir.name, name)
+                os.mkdir(the_dir)
+                agent.mkdir(os.path.join(the_dir, "child"))
+                self.assertLessEqual(agent.open_fd_count, 2)
+
+        self.assertEqual(agent.open_fd_count, 0)
+
+    def test_directory_move_evicts_cached_descendants(self):
+        old_dir = os.path.join(self._fixture_dir.name, "old")
+        new_dir = os.path.join(self._fixture_dir.name, "new")
+        os.mkdir(old_dir)
+        write_file(os.path.join(old_dir, "file"), TEST_CONTENT_1)
+
+        with DirFdExecutive() as agent:
+            agent.move(os.path.join(old_dir, "file"), os.path.join(old_dir, "moved"))
+            agent.move(old_dir, new_dir)
+
+            # Recreate the old path; the agent must not reuse the descriptor
+            # it held for the directory that's now called `new`
+            os.mkdir(old_dir)
+            agent.mkdir(os.path.join(old_dir, "child"))
+
+        self.assertTrue(os.path.isdir(os.path.join(old_dir, "child")))
+        self.assertFalse(os.path.exists(os.path.join(new_dir, "child")))
+        self.assertEqual(read_file(os.path.join(new_dir, "moved")), TEST_CONTENT_1)
+
+
 class TestOperations(FixtureDirTestCase):
     def test_move_operation(self):
         agent = Executive()
@@ -242,3 +408,134 @@ class TestHistoryAgent(FixtureDirTestCase):
         self.assertIsInstance(move_int_to_start, Move)
         self.assertEqual(move_int_to_start.src, intermediate)
         self.assertEqual(move_int_to_start.dest, start)
+
+
+class TestFindDependents(unittest.TestCase):
+    def test_independent_moves(self):
+        ops = [Move("a/1", "a/2"), Move("a/3", "a/4"), Move("b/1", "c/1")]
+        self.assertEqual(find_dependents(ops), [[], [], []])
+
+    def test_chain(self):
+        ops = [Move("a", "b"), Move("b", "c")]
+        self.assertEqual(find_dependents(ops), [[1], []])
+
+    def test_move_into_new_dir_waits_for_mkdir(self):
+        ops = [Mkdir("d"), Mkdir("d/e"), Move("x", "d/e/x"), Move("y", "z")]
+        dependents = find_dependents(ops)
+        self.assertIn(1, dependents[0])
+        self.assertIn(2, dependents[0])
+        self.assertIn(2, dependents[1])
+        self.assertNotIn(3, dependents[0] + dependents[1] + dependents[2])
+
+    def test_rmdir_waits_for_moves_out(self):
+        ops = [Move("d/e/x", "x"), Move("d/y", "y"), Rmdir("d/e"), Rmdir("d")]
+        dependents = find_dependents(ops)
+        self.assertIn(2, dependents[0])
+        self.assertNotIn(2, dependents[1])
+        self.assertIn(3, dependents[1])
+        self.assertIn(3, dependents[2])
+
+    def test_directory_move_waits_for_descendants(self):
+        ops = [Move("a/b/c/1", "a/b/c/2"), Move("a", "z")]
+        self.assertEqual(find_dependents(ops), [[1], []])
+
+
+class TestConcurrentRollback(FixtureDirTestCase):
+    def test_full_rollback(self):
+        history = HistoryAgent(Executive())
+        sources = []
+        for dir_index in range(5):
+            os.mkdir(self.fixture_path(f"src{dir_index}"))
+            history.mkdir(self.fixture_path(f"dest{dir_index}"))
+            history.mkdir(self.fixture_path(f"dest{dir_index}", "sub"))
+            for file_index in range(5):
+                src = self.fixture_path(f"src{dir_index}", f"{file_index}")
+                write_file(src, src.encode())
+                sources.append(src)
+                history.move(
+                    src, self.fixture_path(f"dest{dir_index}", "sub", f"{file_index}")
+                )
+
+        errors = history.rollback(jobs=4)
+
+        self.assertEqual(errors, [])
+        for src in sources:
+            self.assertEqual(read_file(src), src.encode())
+        for dir_index in range(5):
+            self.assertFalse(os.path.exists(self.fixture_path(f"dest{dir_index}")))
+
+    def test_full_rollback_with_dir_cache(self):
+        # Each undo updates the shared cache from a pool thread. Undoing an
+        # rmdir adds to it while undoing a mkdir discards from it.
+        dir_cache = DirectoryCache()
+        history = HistoryAgent(Executive(), dir_cache)
+        # A large cache makes each discard take long enough to overlap others
+        for n in range(20000):
+            dir_cache.add(self.fixture_path("unrelated", f"{n}"))
+        for dir_index in range(40):
+            os.mkdir(self.fixture_path(f"old{dir_index}"))
+            history.rmdir(self.fixture_path(f"old{dir_index}"))
+            src = self.fixture_path(f"src{dir_index}")
+            write_file(src, b"")
+            history.mkdir(self.fixture_path(f"dest{dir_index}"))
+            history.mkdir(self.fixture_path(f"dest{dir_index}", "sub"))
+            history.move(src, self.fixture_path(f"dest{dir_index}", "sub", "f"))
+
+        errors = history.rollback(jobs=8)
+
+        self.assertEqual(errors, [])
+        for dir_index in range(40):
+            self.assertTrue(os.path.isfile(self.fixture_path(f"src{dir_index}")))
+            self.assertTrue(os.path.isdir(self.fixture_path(f"old{dir_index}")))
+            self.assertIn(self.fixture_path(f"old{dir_index}"), dir_cache)
+            self.assertFalse(os.path.exists(self.fixture_path(f"dest{dir_index}")))
+            self.assertNotIn(self.fixture_path(f"dest{dir_index}"), dir_cache)
+
+    def test_non_critically_failed_rollback(self):
+        history = HistoryAgent(Executive())
+        start = self.fixture_path("start")
+        container = self.fixture_path("container")
+        write_file(start, TEST_CONTENT_1)
+
+        history.mkdir(container)
+        history.move(start, os.path.join(container, "end"))
+        write_file(os.path.join(container, "blocker"), TEST_CONTENT_2)
+
+        errors = history.rollback(jobs=4)
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0][0], container)
+        self.assertEqual(read_file(start), TEST_CONTENT_1)
+
+    def test_failed_rollback(self):
+        history = HistoryAgent(Executive())
+        start = self.fixture_path("start")
+        intermediate = self.fixture_path("intermediate")
+        end = self.fixture_path("end")
+        other_start = self.fixture_path("other_start")
+        other_end = self.fixture_path("other_end")
+        write_file(start, TEST_CONTENT_1)
+        write_file(other_start, TEST_CONTENT_3)
+
+        history.move(start, intermediate)
+        history.move(other_start, other_end)
+        history.move(intermediate, end)
+
+        # block the rollback
+        write_file(intermediate, TEST_CONTENT_2)
+
+        with self.assertRaises(RollbackError) as cm:
+            history.rollback(jobs=4)
+
+        # The independent move was still undone
+        self.assertEqual(read_file(other_start), TEST_CONTENT_3)
+
+        self.assertEqual(
+            cm.exception.remaining_operations,
+            [Move(end, intermediate), Move(intermediate, start)],
+        )
+
+        # Clearing the blocker lets a retry finish the job
+        os.remove(intermediate)
+        self.assertEqual(history.rollback(jobs=4), [])
+        self.assertEqual(read_file(start), TEST_CONTENT_1)
@@ -0,0 +1,227 @@
+import asyncio
+import contextlib
+import io
+import os
+
+from pathsub.agents import Executive, Mkdir, Move
+from pathsub.aio import (
+    AsyncAgent,
+    AsyncExecutive,
+    AsyncHistoryAgent,
+    perform_moves_async,
+    plan_operations,
+)
+from pathsub.cli import CommitError
+from pathsub.fs import DirectoryCache
+from pathsub.output import QuietReporter
+from pathsub.schedule import schedule_moves
+from tests.utils_for_testing import FixtureDirTestCase, read_file, write_file
+
+
+class LatentAgent(AsyncAgent):
+    # Performs each operation for real once a delay has passed, like a
+    # network file system, and counts how many are waiting at once. mkdir is
+    # the slowest, so a move that doesn't wait for it fails.
+    def __init__(self, move_latency: float = 0.01, mkdir_latency: float = 0.03):
+        self.move_latency = move_latency
+        self.mkdir_latency = mkdir_latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._executive = Executive()
+
+    async def move(self, src, dest):
+        await self._perform(self.move_latency, self._executive.move, src, dest)
+
+    async def mkdir(self, path):
+        await self._perform(self.mkdir_latency, self._executive.mkdir, path)
+
+    async def rmdir(self, path):
+        await self._perform(self.move_latency, self._executive.rmdir, path)
+
+    async def _perform(self, latency: float, func, *args):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(latency)
+            func(*args)
+        finally:
+            self.in_flight -= 1
+
+
+class TestPerformMovesAsync(FixtureDirTestCase):
+    def test_moves_into_new_directories(self):
+        os.mkdir(self.fixture_path("src"))
+        moves = []
+        for n in range(40):
+            write_file(self.fixture_path("src", f"{n}"), str(n).encode())
+            moves.append(
+                (
+                    self.fixture_path("src", f"{n}"),
+                    self.fixture_path("dest", f"d{n % 4}", f"{n}"),
+                )
+            )
+        agent = LatentAgent()
+
+        asyncio.run(
+            perform_moves_async(
+                moves, agent, max_in_flight=16, reporter=QuietReporter()
+            )
+        )
+
+        for n in range(40):
+            self.assertEqual(
+                read_file(self.fixture_path("dest", f"d{n % 4}", f"{n}")),
+                str(n).encode(),
+            )
+        self.assertEqual(os.listdir(self.fixture_path("src")), [])
+        self.assertGreater(agent.max_in_flight, 1)
+        self.assertLessEqual(agent.max_in_flight, 16)
+
+    def test_chains_and_cycles(self):
+        for name in ("a", "b", "c", "x", "y"):
+            write_file(self.fixture_path(name), name.encode())
+        moves = [
+            (self.fixture_path("a"), self.fixture_path("b")),
+            (self.fixture_path("b"), self.fixture_path("c")),
+            (self.fixture_path("c"), self.fixture_path("d")),
+            (self.fixture_path("x"), self.fixture_path("y")),
+            (self.fixture_path("y"), self.fixture_path("x")),
+        ]
+
+        asyncio.run(
+            perform_moves_async(
+                schedule_moves(moves).moves, LatentAgent(), reporter=QuietReporter()
+            )
+        )
+
+        self.assertEqual(
+            sorted(os.listdir(self._fixture_dir.name)), ["b", "c", "d", "x", "y"]
+        )
+        for name, content in (
+            ("b", b"a"),
+            ("c", b"b"),
+            ("d", b"c"),
+            ("x", b"y"),
+            ("y", b"x"),
+        ):
+            self.assertEqual(read_file(self.fixture_path(name)), content)
+
+    def test_failure_is_rolled_back(self):
+        for name in [f"{n}" for n in range(10)] + ["extra", "taken"]:
+            write_file(self.fixture_path(name), b"")
+        moves = [
+            (self.fixture_path(f"{n}"), self.fixture_path("new", f"{n}"))
+            for n in range(10)
+        ]
+        moves.insert(5, (self.fixture_path("extra"), self.fixture_path("taken")))
+        dir_cache = DirectoryCache()
+        history = AsyncHistoryAgent(LatentAgent(), dir_cache)
+
+        async def perform_and_roll_back():
+            with self.assertRaises(CommitError) as raised:
+                await perform_moves_async(
+                    moves, history, dir_cache, max_in_flight=4, reporter=QuietReporter()
+                )
+            self.assertEqual(raised.exception.failed_move, moves[5])
+            return await history.rollback(max_in_flight=4)
+
+        self.assertEqual(asyncio.run(perform_and_roll_back()), [])
+        self.assertEqual(history.undo_count, 0)
+        self.assertEqual(
+            sorted(os.listdir(self._fixture_dir.name)),
+            sorted([f"{n}" for n in range(10)] + ["extra", "taken"]),
+        )
+
+    def test_default_reporter_is_flushed(self):
+        write_file(self.fixture_path("a"), b"a")
+        moves = [(self.fixture_path("a"), self.fixture_path("b"))]
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            asyncio.run(perform_moves_async(moves, LatentAgent()))
+
+        self.assertEqual(output.getvalue(), f"mv {moves[0][0]} {moves[0][1]}\n")
+
+    def test_async_executive(self):
+        write_file(self.fixture_path("a"), b"a")
+        with AsyncExecutive(Executive(), max_workers=4) as agent:
+            history = AsyncHistoryAgent(agent)
+
+            async def move_and_roll_back():
+                await perform_moves_async(
+                    [(self.fixture_path("a"), self.fixture_path("new", "b"))],
+                    history,
+                    reporter=QuietReporter(),
+                )
+                self.assertEqual(read_file(self.fixture_path("new", "b")), b"a")
+                await history.rollback()
+
+            asyncio.run(move_and_roll_back())
+
+        self.assertEqual(os.listdir(self._fixture_dir.name), ["a"])
+
+
+class TestPlanOperations(FixtureDirTestCase):
+    def test_makes_each_directory_once(self):
+        moves = [
+            (self.fixture_path("a"), self.fixture_path("new", "deeper", "a")),
+            (self.fixture_path("b"), self.fixture_path("new", "b")),
+            (self.fixture_path("c"), self.fixture_path("new", "deeper", "c")),
+            (self.fixture_path("d"), self.fixture_path("d2")),
+        ]
+
+        self.assertEqual(
+            plan_operations(moves, DirectoryCache()),
+            [
+                Mkdir(self.fixture_path("new")),
+                Mkdir(self.fixture_path("new", "deeper")),
+                Move(*moves[0]),
+                Move(*moves[1]),
+                Move(*moves[2]),
+                Move(*moves[3]),
+            ],
+        )
+
+    def test_remakes_directory_moved_away(self):
+        os.mkdir(self.fixture_path("d"))
+        moves = [
+            (self.fixture_path("d"), self.fixture_path("e")),
+            (self.fixture_path("f"), self.fixture_path("d", "f")),
+        ]
+
+        self.assertEqual(
+            plan_operations(moves, DirectoryCache()),
+            [Move(*moves[0]), Mkdir(self.fixture_path("d")), Move(*moves[1])],
+        )
+
+    def test_moved_directory_brings_subdirectories(self):
+        os.makedirs(self.fixture_path("a", "sub"))
+        moves = [
+            (self.fixture_path("a"), self.fixture_path("b")),
+            (self.fixture_path("g"), self.fixture_path("b", "sub", "g")),
+        ]
+
+        self.assertEqual(
+            plan_operations(moves, DirectoryCache()),
+            [Move(*moves[0]), Move(*moves[1])],
+        )
+
+    def test_moved_directory_keeps_earlier_changes(self):
+        os.makedirs(self.fixture_path("a", "sub"))
+        moves = [
+            (self.fixture_path("a", "sub"), self.fixture_path("a", "sub2")),
+            (self.fixture_path("a"), self.fixture_path("b")),
+            (self.fixture_path("g"), self.fixture_path("b", "sub2", "g")),
+            (self.fixture_path("h"), self.fixture_path("b", "sub", "h")),
+        ]
+
+        self.assertEqual(
+            plan_operations(moves, DirectoryCache()),
+            [
+                Move(*moves[0]),
+                Move(*moves[1]),
+                Move(*moves[2]),
+                Mkdir(self.fixture_path("b", "sub")),
+                Move(*moves[3]),
+            ],
+        )
@@ -0,0 +1,144 @@
+import os
+
+import pathsub
+from pathsub import CommitResult, rename_many, Rule
+from pathsub.fs import DirectoryCache
+from pathsub.journal import read_journal
+from tests.utils_for_testing import FixtureDirTestCase, read_file, write_file
+
+
+class TestRenameMany(FixtureDirTestCase):
+    def test_rule(self):
+        write_file(self.fixture_path("a1"), b"a")
+        write_file(self.fixture_path("b1"), b"b")
+        paths = [self.fixture_path("a1"), self.fixture_path("b1")]
+
+        result = rename_many(Rule("1", "2", literal=True, basename=True), paths)
+
+        self.assertTrue(result.ok)
+        self.assertEqual(result.status, CommitResult.SUCCESS)
+        self.assertEqual(result.plan.matched, 2)
+        self.assertEqual(read_file(self.fixture_path("a2")), b"a")
+        self.assertEqual(read_file(self.fixture_path("b2")), b"b")
+
+    def test_mapping_with_cycle(self):
+        write_file(self.fixture_path("a"), b"a")
+        write_file(self.fixture_path("b"), b"b")
+        mapping = {
+            self.fixture_path("a"): self.fixture_path("b"),
+            self.fixture_path("b"): self.fixture_path("a"),
+        }
+
+        result = rename_many(mapping)
+
+        self.assertEqual(result.status, CommitResult.SUCCESS)
+        self.assertEqual(len(result.moves), 3)
+        self.assertEqual(read_file(self.fixture_path("a")), b"b")
+        self.assertEqual(read_file(self.fixture_path("b")), b"a")
+
+    def test_parents_and_children(self):
+        for parent in ("x1", "x2"):
+            os.mkdir(self.fixture_path(parent))
+            write_file(self.fixture_path(parent, "xa"), parent.encode())
+        paths = [
+            self.fixture_path("x1", "xa"),
+            self.fixture_path("x1"),
+            self.fixture_path("x2", "xa"),
+            self.fixture_path("x2"),
+        ]
+
+        result = rename_many(Rule("x", "y", literal=True, basename=True), paths)
+
+        self.assertEqual(result.status, CommitResult.SUCCESS)
+        self.assertEqual(sorted(os.listdir(self._fixture_dir.name)), ["y1", "y2"])
+        self.assertEqual(read_file(self.fixture_path("y1", "ya")), b"x1")
+        self.assertEqual(read_file(self.fixture_path("y2", "ya")), b"x2")
+
+    def test_dry_run(self):
+        write_file(self.fixture_path("a1"), b"a")
+
+        result = rename_many(
+            lambda path: path[:-1] + "2", [self.fixture_path("a1")], dry_run=True
+        )
+
+        self.assertTrue(result.ok)
+        self.assertIsNone(result.status)
+        self.assertEqual(
+            result.moves, [(self.fixture_path("a1"), self.fixture_path("a2"))]
+        )
+        self.assertTrue(os.path.exists(self.fixture_path("a1")))
+
+    def test_conflicts(self):
+        paths = [self.fixture_path("a1"), self.fixture_path("a2")]
+
+        result = rename_many(lambda path: path[:-1] + "3", paths)
+
+        self.assertFalse(result.ok)
+        self.assertIsNone(result.status)
+        self.assertEqual(result.plan.conflicts, [(paths, self.fixture_path("a3"))])
+
+    def test_failure_is_rolled_back(self):
+        write_file(self.fixture_path("a"), b"a")
+        mapping = {
+            self.fixture_path("a"): self.fixture_path("new", "a"),
+            self.fixture_path("missing"): self.fixture_path("new", "missing"),
+        }
+        journal_path = self.fixture_path("journal")
+
+        result = rename_many(mapping, journal=journal_path)
+
+        self.assertFalse(result.ok)
+        self.assertEqual(result.status, CommitResult.FAILED_WITH_SUCCESSFUL_ROLLBACK)
+        self.assertIsInstance(result.error, FileNotFoundError)
+        self.assertEqual(
+            result.failed_move,
+            (self.fixture_path("missing"), self.fixture_path("new", "missing")),
+        )
+        self.assertEqual(read_file(self.fixture_path("a")), b"a")
+        self.assertFalse(os.path.exists(self.fixture_path("new")))
+        self.assertTrue(read_journal(journal_path).rolled_back)
+
+    def test_unusable_journal(self):
+        write_file(self.fixture_path("a"), b"a")
+        write_file(self.fixture_path("journal"), b"")
+
+        result = rename_many(
+            {self.fixture_path("a"): self.fixture_path("b")},
+            journal=self.fixture_path("journal"),
+        )
+
+        self.assertFalse(result.ok)
+        self.assertEqual(result.status, CommitResult.JOURNAL_FAILED)
+        self.assertIsInstance(result.error, FileExistsError)
+        self.assertEqual(read_file(self.fixture_path("a")), b"a")
+
+    def test_preflight(self):
+        result = rename_many(
+            {self.fixture_path("missing"): self.fixture_path("b")}, preflight=True
+        )
+        self.assertEqual(result.status, CommitResult.PREFLIGHT_FAILED)
+        self.assertEqual(len(result.problems), 1)
+
+    def test_reuses_dir_cache(self):
+        dir_cache = DirectoryCache()
+        for batch in range(3):
+            name = f"{batch}"
+            write_file(self.fixture_path(name), b"")
+            result = rename_many(
+                {self.fixture_path(name): self.fixture_path("new", name)},
+                dir_cache=dir_cache,
+            )
+            self.assertEqual(result.status, CommitResult.SUCCESS)
+
+        self.assertEqual(sorted(os.listdir(self.fixture_path("new"))), ["0", "1", "2"])
+        # Only the first batch had to look for the directory
+        self.assertEqual(dir_cache.stat_count, 2)
+
+    def test_rejects_unknown_mapping(self):
+        with self.assertRaises(TypeError):
+            rename_many("not rules", ["a"])
+        with self.assertRaises(TypeError):
+            rename_many(lambda path: None)
+
+    def test_version_is_exported(self):
+        self.assertEqual(pathsub.__version__, pathsub.cli.__version__)
@@ -1,14 +1,29 @@
+import contextlib
+import io
+import json
 import os.path
 import re
 import unittest
+from unittest import mock
 
+from pathsub.agents import Executive, Move
 from pathsub.cli import (
-    generate_temp_name,
-    make_pattern,
+    CliArgs,
+    commit,
+    CommitError,
+    CommitResult,
+    iter_input_paths,
+    main,
     make_plan,
-    resub_basename,
-    resub_path,
+    perform_moves,
+    Plan,
+    read_paths,
+    run,
 )
+from pathsub.journal import read_journal
+from pathsub.planio import read_plan
+from pathsub.rules import make_pattern, resub_basename, resub_path
+from tests.utils_for_testing import FixtureDirTestCase, read_file, write_file
 
 
 class TestMakePattern(unittest.TestCase):
@@ -77,38 +92,6 @@ class TestResubBasename(unittest.TestCase):
         self.assertEqual(got, expect)
 
 
-class TestGenerateTempName(unittest.TestCase):
-    def test_generate_temp_name_without_sep_without_dot(self):
-        subject = "foo"
-        got = generate_temp_name(subject)
-        self.assertRegex(got, r"^foo__submv\w+$")
-
-    def test_generate_temp_name_without_sep_with_dot(self):
-        subject = "foo.txt"
-        got = generate_temp_name(subject)
-        self.assertRegex(got, r"^foo__submv\w+\.txt$")
-
-    def test_generate_temp_name_without_sep_hidden(self):
-        subject = ".foo"
-        got = generate_temp_name(subject)
-        self.assertRegex(got, r"^\.foo__submv\w+$")
-
-    def test_generate_temp_name_with_sep_without_dot(self):
-        subject = os.path.join("foo", "bar")
-        got = generate_temp_name(subject)
-        self.assertRegex(got, rf"^foo{os.sep}bar__submv\w+$")
-
-    def test_generate_temp_name_with_sep_with_dot(self):
-        subject = os.path.join("foo", "bar.txt")
-        got = generate_temp_name(subject)
-        self.assertRegex(got, rf"^foo{os.sep}bar__submv\w+\.txt$")
-
-    def test_generate_temp_name_with_sep_hidden(self):
-        subject = os.path.join("foo", ".bar")
-        got = generate_temp_name(subject)
-        self.assertRegex(got, rf"^foo{os.sep}\.bar__submv\w+$")
-
-
 class TestResubPath(unittest.TestCase):
     def test_resub_basename_without_sep_match(self):
         pattern = re.compile("foo")
@@ -166,3 +149,561 @@ class TestMakePlan(unittest.TestCase):
         self.assertTrue(plan.has_conflicts)
         self.assertEqual(plan.valid_moves, [("c1", "c3")])
         self.assertEqual(plan.conflicts, [(["b1", "b2"], "b3")])
+
+    def test_counts_matches(self):
+        paths = ["a1", "b1", "c", "d"]
+
+        def map_path(x: str):
+            if "1" not in x:
+                return None
+            return x.replace("a", "b").replace("b1", "a1")
+
+        plan = make_plan(map_path, paths)
+
+        self.assertEqual(plan.valid_moves, [("b1", "a1")])
+        self.assertEqual(plan.matched, 2)
+        self.assertEqual(plan.unmatched, 2)
+
+    def test_keeps_input_order(self):
+        # As find -depth lists them, with each directory after its contents
+        paths = ["o1/oa", "o1", "o2/ob", "o2"]
+
+        def map_path(x: str):
+            parent, leaf = os.path.split(x)
+            return os.path.join(parent, leaf.replace("o", "0"))
+
+        plan = make_plan(map_path, paths)
+
+        self.assertEqual(
+            plan.valid_moves,
+            [("o1/oa", "o1/0a"), ("o1", "01"), ("o2/ob", "o2/0b"), ("o2", "02")],
+        )
+
+
+class TestReadPaths(unittest.TestCase):
+    def test_newline_delimited(self):
+        reader = io.BytesIO(b"a\nb c\n\nd")
+        self.assertEqual(list(read_paths(reader, False)), ["a", "b c", "d"])
+
+    def test_null_delimited(self):
+        reader = io.BytesIO(b"a\0b\nc\0d\0")
+        self.assertEqual(list(read_paths(reader, True)), ["a", "b\nc", "d"])
+
+    def test_paths_spanning_chunks(self):
+        names = [f"path{n}" for n in range(100)]
+        reader = io.BytesIO("\0".join(names).encode())
+        self.assertEqual(list(read_paths(reader, True, chunk_size=7)), names)
+
+    def test_undecodable_bytes_round_trip(self):
+        reader = io.BytesIO(b"caf\xe9\n")
+        (path,) = read_paths(reader, False)
+        self.assertEqual(os.fsencode(path), b"caf\xe9")
+
+    def test_is_lazy(self):
+        reader = io.BytesIO(b"a\n" * 1000)
+        paths = read_paths(reader, False, chunk_size=4)
+        self.assertEqual(next(paths), "a")
+        self.assertLess(reader.tell(), 100)
+
+
+def make_args(search: str, replace: str, paths: list[str], **kwargs) -> CliArgs:
+    options = dict(basename=True, literal=False, ignore_case=False, dry_run=False)
+    options.update(kwargs)
+    return CliArgs(search=search, replace=replace, paths=paths, **options)
+
+
+def run_quietly(args: CliArgs) -> int:
+    with contextlib.redirect_stdout(io.StringIO()):
+        with contextlib.redirect_stderr(io.StringIO()):
+            return run(args)
+
+
+class TestPerformMoves(FixtureDirTestCase):
+    def test_default_reporter_is_flushed(self):
+        write_file(self.fixture_path("a"), b"a")
+        moves = [
+            (self.fixture_path("a"), self.fixture_path("b")),
+            (self.fixture_path("missing"), self.fixture_path("c")),
+        ]
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            with self.assertRaises(CommitError):
+                perform_moves(moves, Executive())
+
+        self.assertEqual(output.getvalue(), f"mv {moves[0][0]} {moves[0][1]}\n")
+
+
+class TestRun(FixtureDirTestCase):
+    def test_run_renames(self):
+        write_file(self.fixture_path("a1"), b"a")
+        write_file(self.fixture_path("b1"), b"b")
+
+        status = run_quietly(
+            make_args("1", "2", [self.fixture_path("a1"), self.fixture_path("b1")])
+        )
+
+        self.assertEqual(status, 0)
+        self.assertEqual(read_file(self.fixture_path("a2")), b"a")
+        self.assertEqual(read_file(self.fixture_path("b2")), b"b")
+        self.assertFalse(os.path.exists(self.fixture_path("a1")))
+        self.assertFalse(os.path.exists(self.fixture_path("b1")))
+
+    def test_run_renames_contents_before_directories(self):
+        os.mkdir(self.fixture_path("o1"))
+        os.mkdir(self.fixture_path("o2"))
+        write_file(self.fixture_path("o1", "oa"), b"a")
+        write_file(self.fixture_path("o2", "ob"), b"b")
+        paths = [
+            self.fixture_path("o1", "oa"),
+            self.fixture_path("o1"),
+            self.fixture_path("o2", "ob"),
+            self.fixture_path("o2"),
+        ]
+
+        status = run_quietly(make_args("o", "0", paths))
+
+        self.assertEqual(status, 0)
+        self.assertEqual(read_file(self.fixture_path("01", "0a")), b"a")
+        self.assertEqual(read_file(self.fixture_path("02", "0b")), b"b")
+
+    def test_run_low_memory(self):
+        paths = [self.fixture_path(name) for name in ("a1", "b1", "c2")]
+        for path in paths:
+            write_file(path, path.encode())
+
+        status = run_quietly(
+            make_args("[ab]", "x", paths, low_memory=True, dry_run=True)
+        )
+        self.assertEqual(status, 1)
+
+        plan_path = self.fixture_path("plan.jsonl")
+        status = run_quietly(
+            make_args("1", "2", paths, low_memory=True, emit_plan=plan_path)
+        )
+        self.assertEqual(status, 0)
+        with open(plan_path, "rb") as reader:
+            self.assertEqual(
+                list(read_plan(reader, "jsonl")),
+                [
+                    (paths[0], self.fixture_path("a2")),
+                    (paths[1], self.fixture_path("b2")),
+                ],
+            )
+
+    def test_run_check_fs_rejects_existing_targets(self):
+        write_file(self.fixture_path("a1"), b"a1")
+        write_file(self.fixture_path("a2"), b"a2")
+
+        status = run_quietly(
+            make_args("1", "2", [self.fixture_path("a1")], check_fs=True)
+        )
+
+        self.assertEqual(status, 1)
+        self.assertEqual(read_file(self.fixture_path("a1")), b"a1")
+        self.assertEqual(read_file(self.fixture_path("a2")), b"a2")
+
+    def test_commit_preflight(self):
+        write_file(self.fixture_path("a"), b"a")
+        write_file(self.fixture_path("b"), b"b")
+        moves = [
+            (self.fixture_path("a"), self.fixture_path("a2")),
+            (self.fixture_path("missing"), self.fixture_path("c")),
+        ]
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            status = commit(moves, preflight=True)
+
+        self.assertEqual(status, CommitResult.PREFLIGHT_FAILED)
+        self.assertEqual(sorted(os.listdir(self._fixture_dir.name)), ["a", "b"])
+
+    def test_run_rejects_conflicts_before_moving(self):
+        paths = [self.fixture_path(name) for name in ("a1", "b1", "b2")]
+        for path in paths:
+            write_file(path, path.encode())
+
+        status = run_quietly(make_args("[12]", "3", paths))
+
+        self.assertEqual(status, 1)
+        for path in paths:
+            self.assertEqual(read_file(path), path.encode())
+        self.assertFalse(os.path.exists(self.fixture_path("a3")))
+        self.assertFalse(os.path.exists(self.fixture_path("b3")))
+
+    def test_extra_renames_are_summarized(self):
+        write_file(self.fixture_path("ab"), b"ab")
+        write_file(self.fixture_path("ba"), b"ba")
+        paths = [self.fixture_path("ab"), self.fixture_path("ba")]
+        message = "1 extra temporary rename(s) will be needed to break cycles."
+
+        def run_swap(**kwargs) -> tuple[str, str]:
+            stdout, stderr = io.StringIO(), io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                with contextlib.redirect_stderr(stderr):
+                    status = run(make_args(r"^(.)(.)$", r"\2\1", paths, **kwargs))
+            self.assertEqual(status, 0)
+            return stdout.getvalue(), stderr.getvalue()
+
+        stdout, _ = run_swap(dry_run=True)
+        self.assertIn(message, stdout)
+
+        _, stderr = run_swap()
+        self.assertIn(message, stderr)
+        self.assertEqual(read_file(self.fixture_path("ab")), b"ba")
+
+        _, stderr = run_swap(quiet=True)
+        self.assertNotIn(message, stderr)
+        self.assertEqual(read_file(self.fixture_path("ab")), b"ab")
+
+    def test_dry_run_makes_no_changes(self):
+        write_file(self.fixture_path("a1"), b"a")
+
+        status = run_quietly(
+            make_args("1", "2", [self.fixture_path("a1")], dry_run=True)
+        )
+
+        self.assertEqual(status, 0)
+        self.assertTrue(os.path.exists(self.fixture_path("a1")))
+        self.assertFalse(os.path.exists(self.fixture_path("a2")))
+
+    def test_commit_handles_chains_and_cycles(self):
+        for name in ("a", "b", "c", "x"):
+            write_file(self.fixture_path(name), name.encode())
+
+        plan = Plan(
+            valid_moves=[
+                (self.fixture_path("a"), self.fixture_path("b")),
+                (self.fixture_path("b"), self.fixture_path("a")),
+                (self.fixture_path("x"), self.fixture_path("c")),
+                (self.fixture_path("c"), self.fixture_path("y")),
+            ],
+            conflicts=[],
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            status = commit(plan.valid_moves)
+
+        self.assertEqual(status, CommitResult.SUCCESS)
+        self.assertEqual(read_file(self.fixture_path("a")), b"b")
+        self.assertEqual(read_file(self.fixture_path("b")), b"a")
+        self.assertEqual(read_file(self.fixture_path("c")), b"x")
+        self.assertEqual(read_file(self.fixture_path("y")), b"c")
+        self.assertEqual(
+            sorted(os.listdir(self._fixture_dir.name)), ["a", "b", "c", "y"]
+        )
+
+    def test_run_from_file(self):
+        write_file(self.fixture_path("a1"), b"a")
+        write_file(self.fixture_path("b1"), b"b")
+        list_path = self.fixture_path("list")
+        write_file(
+            list_path,
+            b"\0".join(os.fsencode(self.fixture_path(n)) for n in ("a1", "b1")),
+        )
+
+        args = make_args("1", "2", [], from_file=list_path, null=True)
+        self.assertEqual(
+            list(iter_input_paths(args)),
+            [self.fixture_path("a1"), self.fixture_path("b1")],
+        )
+
+        status = run_quietly(args)
+
+        self.assertEqual(status, 0)
+        self.assertEqual(read_file(self.fixture_path("a2")), b"a")
+        self.assertEqual(read_file(self.fixture_path("b2")), b"b")
+
+    def test_run_recursive(self):
+        os.makedirs(self.fixture_path("top1", "mid1"))
+        write_file(self.fixture_path("top1", "mid1", "leaf1"), b"leaf")
+        write_file(self.fixture_path("top1", "other1"), b"other")
+
+        status = run_quietly(
+            make_args(
+                "1",
+                "2",
+                [self.fixture_path("top1")],
+                recursive=True,
+                exclude=["other*"],
+            )
+        )
+
+        self.assertEqual(status, 0)
+        self.assertEqual(read_file(self.fixture_path("top2", "mid2", "leaf2")), b"leaf")
+        self.assertEqual(read_file(self.fixture_path("top2", "other1")), b"other")
+        self.assertFalse(os.path.exists(self.fixture_path("top1")))
+
+    def test_run_recursive_sibling_directories(self):
+        root = self.fixture_path("tree")
+        os.makedirs(os.path.join(root, "o1", "oo"))
+        os.mkdir(os.path.join(root, "o2"))
+        write_file(os.path.join(root, "o1", "oa"), b"a")
+        write_file(os.path.join(root, "o1", "oo", "ox"), b"x")
+        write_file(os.path.join(root, "o2", "ob"), b"b")
+
+        status = run_quietly(make_args("o", "0", [root], recursive=True))
+
+        self.assertEqual(status, 0)
+        self.assertEqual(read_file(os.path.join(root, "01", "0a")), b"a")
+        self.assertEqual(read_file(os.path.join(root, "01", "00", "0x")), b"x")
+        self.assertEqual(read_file(os.path.join(root, "02", "0b")), b"b")
+        self.assertEqual(sorted(os.listdir(root)), ["01", "02"])
+
+    def test_run_recursive_cycle_inside_renamed_directory(self):
+        # The same as submv -b -r '(\d)(\d)' '\2\1' d12
+        root = self.fixture_path("d12")
+        os.mkdir(root)
+        write_file(os.path.join(root, "f12"), b"12")
+        write_file(os.path.join(root, "f21"), b"21")
+
+        status = run_quietly(make_args(r"(\d)(\d)", r"\2\1", [root], recursive=True))
+
+        self.assertEqual(status, 0)
+        self.assertEqual(os.listdir(self._fixture_dir.name), ["d21"])
+        self.assertEqual(read_file(self.fixture_path("d21", "f21")), b"12")
+        self.assertEqual(read_file(self.fixture_path("d21", "f12")), b"21")
+
+    def test_run_with_unusable_journal(self):
+        write_file(self.fixture_path("a1"), b"a")
+        write_file(self.fixture_path("journal"), b"")
+
+        for journal_path in (
+            self.fixture_path("journal"),
+            self.fixture_path("missing", "journal"),
+        ):
+            status = run_quietly(
+                make_args("1", "2", [self.fixture_path("a1")], journal=journal_path)
+            )
+            self.assertEqual(status, CommitResult.JOURNAL_FAILED.value)
+
+        self.assertEqual(read_file(self.fixture_path("a1")), b"a")
+        self.assertEqual(read_file(self.fixture_path("journal")), b"")
+
+    def test_run_recursive_unreadable_directory(self):
+        root = self.fixture_path("tree")
+        for name in ("o1", "o2"):
+            os.makedirs(os.path.join(root, name))
+            write_file(os.path.join(root, name, "oa"), b"a")
+        unreadable = os.path.join(root, "o2")
+        real_scandir = os.scandir
+
+        def scandir(path):
+            if path == unreadable:
+                raise PermissionError(13, "Permission denied", path)
+            return real_scandir(path)
+
+        with mock.patch("pathsub.fs.os.scandir", scandir):
+            status = run_quietly(make_args("o", "0", [root], recursive=True))
+
+        self.assertEqual(status, 1)
+        self.assertEqual(sorted(os.listdir(root)), ["o1", "o2"])
+        self.assertEqual(os.listdir(os.path.join(root, "o1")), ["oa"])
+
+    def test_run_with_journal(self):
+        write_file(self.fixture_path("a1"), b"a")
+        journal_path = self.fixture_path("journal")
+
+        status = run_quietly(
+            make_args("1", "2", [self.fixture_path("a1")], journal=journal_path)
+        )
+
+        self.assertEqual(status, 0)
+        self.assertEqual(read_file(self.fixture_path("a2")), b"a")
+        contents = read_journal(journal_path)
+        self.assertTrue(contents.committed)
+        self.assertEqual(
+            contents.operations,
+            [Move(self.fixture_path("a1"), self.fixture_path("a2"))],
+        )
+
+    def test_run_with_stats(self):
+        for name in ("a1", "b1", "c1"):
+            write_file(self.fixture_path(name), b"")
+        paths = [self.fixture_path(name) for name in ("a1", "b1", "c1")]
+
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with contextlib.redirect_stderr(stderr):
+                status = run(
+                    make_args("(.)1", r"new/\g<1>2", paths, quiet=True, stats=True)
+                )
+
+        self.assertEqual(status, 0)
+        stats = json.loads(stderr.getvalue().splitlines()[-1])
+        self.assertEqual(stats["counts"]["move"], 3)
+        self.assertEqual(stats["counts"]["mkdir"], 1)
+        self.assertEqual(stats["counts"]["matched"], 3)
+        self.assertEqual(stats["latencies"]["move"]["count"], 3)
+        for name in ("total", "map_path", "make_plan", "perform_moves"):
+            self.assertIn(name, stats["phases"])
+
+    def test_save_undo_and_undo(self):
+        write_file(self.fixture_path("a1"), b"a")
+        write_file(self.fixture_path("b1"), b"b")
+        state_home = self.fixture_path("state")
+        paths = [self.fixture_path("a1"), self.fixture_path("b1")]
+
+        with mock.patch.dict(os.environ, {"XDG_STATE_HOME": state_home}):
+            status = run_quietly(make_args("1", "2", paths, save_undo=True))
+            self.assertEqual(status, 0)
+            status = run_quietly(
+                make_args(
+                    "(.)2", r"new/\g<1>", [self.fixture_path("a2")], save_undo=True
+                )
+            )
+            self.assertEqual(status, 0)
+            self.assertEqual(read_file(self.fixture_path("new", "a")), b"a")
+
+            # Undoes the second run, then the first
+            self.assertEqual(run_quietly(make_args(None, None, [], undo="")), 0)
+            self.assertEqual(read_file(self.fixture_path("a2")), b"a")
+            self.assertFalse(os.path.exists(self.fixture_path("new")))
+
+            self.assertEqual(run_quietly(make_args(None, None, [], undo="")), 0)
+            self.assertEqual(read_file(self.fixture_path("a1")), b"a")
+            self.assertEqual(read_file(self.fixture_path("b1")), b"b")
+
+            self.assertEqual(run_quietly(make_args(None, None, [], undo="")), 1)
+
+    def test_save_undo_discards_log_of_rolled_back_run(self):
+        write_file(self.fixture_path("a1"), b"a")
+        state_home = self.fixture_path("state")
+
+        with mock.patch.dict(os.environ, {"XDG_STATE_HOME": state_home}):
+            status = run_quietly(
+                make_args(
+                    "1",
+                    "2",
+                    [self.fixture_path("a1"), self.fixture_path("missing1")],
+                    save_undo=True,
+                )
+            )
+
+        self.assertEqual(status, CommitResult.FAILED_WITH_SUCCESSFUL_ROLLBACK.value)
+        self.assertEqual(read_file(self.fixture_path("a1")), b"a")
+        self.assertEqual(os.listdir(os.path.join(state_home, "pathsub")), [])
+
+    def test_commit_in_parallel(self):
+        moves = []
+        for dir_index in range(8):
+            dir_name = f"dir{dir_index}"
+            os.mkdir(self.fixture_path(dir_name))
+            for file_index in range(10):
+                src = self.fixture_path(dir_name, f"file{file_index}")
+                write_file(src, src.encode())
+                moves.append(
+                    (src, self.fixture_path(f"new{dir_name}", f"{file_index}"))
+                )
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            status = commit(moves, jobs=4)
+
+        self.assertEqual(status, CommitResult.SUCCESS)
+        for src, dest in moves:
+            self.assertFalse(os.path.exists(src))
+            self.assertEqual(read_file(dest), src.encode())
+
+    def test_commit_in_parallel_rolls_back_every_group(self):
+        moves = []
+        for dir_index in range(8):
+            dir_name = f"dir{dir_index}"
+            os.mkdir(self.fixture_path(dir_name))
+            for file_index in range(10):
+                src = self.fixture_path(dir_name, f"file{file_index}")
+                write_file(src, src.encode())
+                moves.append(
+                    (src, self.fixture_path(f"new{dir_name}", f"{file_index}"))
+                )
+
+        # Make one move in the middle fail
+        os.mkdir(self.fixture_path("newdir5"))
+        write_file(self.fixture_path("newdir5", "5"), b"blocker")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            with contextlib.redirect_stderr(io.StringIO()):
+                status = commit(moves, jobs=4)
+
+        self.assertEqual(status, CommitResult.FAILED_WITH_SUCCESSFUL_ROLLBACK)
+        for src, dest in moves:
+            self.assertEqual(read_file(src), src.encode())
+        self.assertEqual(read_file(self.fixture_path("newdir5", "5")), b"blocker")
+        for dir_index in range(8):
+            if dir_index != 5:
+                self.assertFalse(
+                    os.path.exists(self.fixture_path(f"newdir{dir_index}"))
+                )
+
+    def test_emit_and_apply_plan(self):
+        write_file(self.fixture_path("a1"), b"a")
+        write_file(self.fixture_path("b1"), b"b")
+        plan_path = self.fixture_path("plan")
+        paths = [self.fixture_path("a1"), self.fixture_path("b1")]
+
+        status = run_quietly(make_args("1", "2", paths, emit_plan=plan_path))
+
+        self.assertEqual(status, 0)
+        self.assertTrue(os.path.exists(self.fixture_path("a1")))
+        self.assertTrue(os.path.exists(plan_path))
+
+        status = run_quietly(make_args(None, None, [], apply_plan=plan_path))
+
+        self.assertEqual(status, 0)
+        self.assertEqual(read_file(self.fixture_path("a2")), b"a")
+        self.assertEqual(read_file(self.fixture_path("b2")), b"b")
+
+    def test_apply_invalid_plan_makes_no_changes(self):
+        write_file(self.fixture_path("a"), b"a")
+        write_file(self.fixture_path("b"), b"b")
+        moves = [
+            (self.fixture_path("a"), self.fixture_path("c")),
+            (self.fixture_path("b"), self.fixture_path("c")),
+        ]
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            status = commit(moves)
+
+        self.assertEqual(status, CommitResult.INVALID_PLAN)
+        self.assertEqual(sorted(os.listdir(self._fixture_dir.name)), ["a", "b"])
+
+    def write_rules(self, rules) -> str:
+        path = self.fixture_path("rules.json")
+        write_file(path, json.dumps(rules).encode("utf-8"))
+        return path
+
+    def test_renames_once(self):
+        rules_path = self.write_rules(
+            [
+                {"search": "a", "replace": "b", "scope": "basename"},
+                {"search": "b", "replace": "c", "scope": "basename"},
+            ]
+        )
+        write_file(self.fixture_path("a1"), b"a")
+
+        args = make_args(None, None, [self.fixture_path("a1")], rules=rules_path)
+        self.assertEqual(run_quietly(args), 0)
+
+        self.assertFalse(os.path.exists(self.fixture_path("a1")))
+        self.assertEqual(read_file(self.fixture_path("c1")), b"a")
+
+    def test_invalid_rules(self):
+        rules_path = self.write_rules([{"search": "("}])
+        write_file(self.fixture_path("a1"), b"a")
+
+        args = make_args(None, None, [self.fixture_path("a1")], rules=rules_path)
+        self.assertEqual(run_quietly(args), 1)
+        self.assertEqual(read_file(self.fixture_path("a1")), b"a")
+
+
+class TestMain(FixtureDirTestCase):
+    def test_shared_options_checked_with_apply_plan(self):
+        plan_path = self.fixture_path("plan.jsonl")
+        write_file(plan_path, b"")
+        journal_path = self.fixture_path("journal")
+        argv = ["submv", "--apply-plan", plan_path, "--journal", journal_path]
+
+        for extra in (["--journal-sync", "0"], ["--save-undo"]):
+            with mock.patch("sys.argv", argv + extra):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    with self.assertRaises(SystemExit) as raised:
+                        main()
+            self.assertEqual(raised.exception.code, 2)
+        self.assertFalse(os.path.exists(journal_path))
@@ -0,0 +1,55 @@
+import os.path
+import unittest
+
+from pathsub.cli import make_plan
+from pathsub.compactplan import make_compact_plan
+
+
+def sorted_conflicts(plan):
+    return sorted((sorted(srcs), dest) for srcs, dest in plan.conflicts)
+
+
+class TestMakeCompactPlan(unittest.TestCase):
+    def assert_same_as_make_plan(self, map_path, paths):
+        expected = make_plan(map_path, paths)
+        got = make_compact_plan(map_path, paths)
+
+        self.assertEqual(sorted(got.valid_moves), sorted(expected.valid_moves))
+        self.assertEqual(len(got.valid_moves), len(expected.valid_moves))
+        self.assertEqual(sorted_conflicts(got), sorted_conflicts(expected))
+        self.assertEqual(got.has_conflicts, expected.has_conflicts)
+        self.assertEqual(got.matched, expected.matched)
+        self.assertEqual(got.unmatched, expected.unmatched)
+
+    def test_without_conflicts(self):
+        paths = ["a", os.path.join("d", "b1"), os.path.join("d", "c1")]
+        self.assert_same_as_make_plan(
+            lambda x: x.replace("1", "2") if "1" in x else None, paths
+        )
+
+    def test_with_conflicts(self):
+        paths = ["a", "b1", "b2", "c1", "d/e1", "d/e2", "d//e3"]
+        self.assert_same_as_make_plan(
+            lambda x: x.replace("1", "3").replace("2", "3"), paths
+        )
+
+    def test_paths_round_trip(self):
+        paths = ["/abs/x", "rel/x", "x", "d//x", "d/\udcfféx", "d/"]
+        plan = make_compact_plan(lambda x: x.replace("x", "y"), paths)
+        self.assertEqual(
+            list(plan.valid_moves), [(p, p.replace("x", "y")) for p in paths[:-1]]
+        )
+
+    def test_many_moves(self):
+        paths = [f"dir{n % 7}/file{n}" for n in range(1000)]
+        self.assert_same_as_make_plan(
+            lambda x: x.replace("file", "f").replace("99", "9"), paths
+        )
+
+    def test_valid_moves_sequence(self):
+        plan = make_compact_plan(lambda x: x + "z", ["a", "b", "c"])
+        self.assertEqual(plan.valid_moves[1], ("b", "bz"))
+        self.assertEqual(plan.valid_moves[-1], ("c", "cz"))
+        self.assertEqual(plan.valid_moves[:2], [("a", "az"), ("b", "bz")])
+        with self.assertRaises(IndexError):
+            plan.valid_moves[3]
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+
+from pathsub.agents import Executive, RenameatExecutive
+from pathsub.copy import (
+    copy_file,
+    copy_tree,
+    move_across_devices,
+    summarize_cross_device,
+    tree_size,
+)
+from tests.utils_for_testing import FixtureDirTestCase, read_file, write_file
+
+
+def other_device_dir(path: str) -> str | None:
+    # A directory for temporary files on a different device from path, if
+    # there is one
+    for candidate in ("/dev/shm", tempfile.gettempdir()):
+        try:
+            if os.stat(candidate).st_dev != os.stat(path).st_dev:
+                return candidate
+        except OSError:
+            pass
+    return None
+
+
+class TestCopy(FixtureDirTestCase):
+    def test_copy_file(self):
+        data = os.urandom(3 << 20)
+        write_file(self.fixture_path("a"), data)
+        os.chmod(self.fixture_path("a"), 0o640)
+
+        copy_file(self.fixture_path("a"), self.fixture_path("b"))
+
+        self.assertEqual(read_file(self.fixture_path("b")), data)
+        self.assertEqual(os.stat(self.fixture_path("b")).st_mode & 0o777, 0o640)
+        self.assertEqual(
+            os.stat(self.fixture_path("b")).st_mtime_ns,
+            os.stat(self.fixture_path("a")).st_mtime_ns,
+        )
+
+    def test_copy_file_refuses_existing_target(self):
+        write_file(self.fixture_path("a"), b"a")
+        write_file(self.fixture_path("b"), b"b")
+
+        with self.assertRaises(FileExistsError):
+            copy_file(self.fixture_path("a"), self.fixture_path("b"))
+        self.assertEqual(read_file(self.fixture_path("b")), b"b")
+
+    def test_copy_tree(self):
+        os.makedirs(self.fixture_path("src", "sub", "deeper"))
+        for n in range(20):
+            write_file(self.fixture_path("src", "sub", f"{n}"), str(n).encode())
+        write_file(self.fixture_path("src", "sub", "deeper", "x"), b"x")
+        os.symlink("sub", self.fixture_path("src", "link"))
+
+        copy_tree(self.fixture_path("src"), self.fixture_path("dest"), jobs=4)
+
+        for n in range(20):
+            self.assertEqual(
+                read_file(self.fixture_path("dest", "sub", f"{n}")), str(n).encode()
+            )
+        self.assertEqual(
+            read_file(self.fixture_path("dest", "sub", "deeper", "x")), b"x"
+        )
+        self.assertEqual(os.readlink(self.fixture_path("dest", "link")), "sub")
+        self.assertEqual(tree_size(self.fixture_path("dest")), 31)
+
+    def test_move_across_devices(self):
+        os.mkdir(self.fixture_path("src"))
+        write_file(self.fixture_path("src", "a"), b"a")
+        write_file(self.fixture_path("b"), b"b")
+
+        move_across_devices(self.fixture_path("src"), self.fixture_path("dest"))
+        move_across_devices(self.fixture_path("b"), self.fixture_path("c"))
+
+        self.assertEqual(sorted(os.listdir(self._fixture_dir.name)), ["c", "dest"])
+        self.assertEqual(read_file(self.fixture_path("dest", "a")), b"a")
+        self.assertEqual(read_file(self.fixture_path("c")), b"b")
+
+    def test_move_across_devices_leaves_existing_target(self):
+        os.mkdir(self.fixture_path("src"))
+        os.mkdir(self.fixture_path("dest"))
+        write_file(self.fixture_path("dest", "keep"), b"")
+
+        with self.assertRaises(FileExistsError):
+            move_across_devices(self.fixture_path("src"), self.fixture_path("dest"))
+        self.assertEqual(os.listdir(self.fixture_path("dest")), ["keep"])
+        self.assertTrue(os.path.isdir(self.fixture_path("src")))
+
+    def test_summarize_same_device(self):
+        write_file(self.fixture_path("a"), b"aaa")
+        summary = summarize_cross_device(
+            [(self.fixture_path("a"), self.fixture_path("new", "a"))]
+        )
+        self.assertEqual(summary.moves, 0)
+
+    def test_summarize_cross_device(self):
+        other_dir = other_device_dir(self._fixture_dir.name)
+        if other_dir is None:
+            raise unittest.SkipTest("no directory on another device")
+
+        write_file(self.fixture_path("a"), b"aaa")
+        with tempfile.TemporaryDirectory(dir=other_dir) as dest_dir:
+            summary = summarize_cross_device(
+                [(self.fixture_path("a"), os.path.join(dest_dir, "a"))]
+            )
+        self.assertEqual(summary.moves, 1)
+        self.assertEqual(summary.bytes, 3)
+
+    def test_executive_moves_across_devices(self):
+        other_dir = other_device_dir(self._fixture_dir.name)
+        if other_dir is None:
+            raise unittest.SkipTest("no directory on another device")
+
+        os.mkdir(self.fixture_path("d"))
+        write_file(self.fixture_path("d", "a"), b"a")
+        write_file(self.fixture_path("b"), b"b")
+        with tempfile.TemporaryDirectory(dir=other_dir) as dest_dir:
+            for agent in (Executive(), RenameatExecutive(copy_jobs=2)):
+                with self.subTest(agent=type(agent).__name__):
+                    agent.move(self.fixture_path("d"), os.path.join(dest_dir, "d"))
+                    agent.move(self.fixture_path("b"), os.path.join(dest_dir, "b"))
+                    self.assertEqual(os.listdir(self._fixture_dir.name), [])
+                    self.assertEqual(read_file(os.path.join(dest_dir, "d", "a")), b"a")
+
+                    agent.move(os.path.join(dest_dir, "d"), self.fixture_path("d"))
+                    agent.move(os.path.join(dest_dir, "b"), self.fixture_path("b"))
+                    self.assertEqual(os.listdir(dest_dir), [])
@@ -1,8 +1,9 @@
 import os.path
+from concurrent.futures import ThreadPoolExecutor
 
-from pathsub.agents import Executive
-from pathsub.fs import ensure_dir_for
-from tests.utils_for_testing import FixtureDirTestCase
+from pathsub.agents import Executive, HistoryAgent
+from pathsub.fs import compile_globs, DirectoryCache, ensure_dir_for, walk_bottom_up
+from tests.utils_for_testing import FixtureDirTestCase, write_file
 
 
 class TestEnsureDirFor(FixtureDirTestCase):
@@ -35,3 +36,195 @@ class TestEnsureDirFor(FixtureDirTestCase):
         ensure_dir_for(leaf, agent)
 
         self.assertTrue(os.path.isdir(parent1))
+
+    def test_ensure_dir_for_stats_each_dir_once(self):
+        agent = Executive()
+        dir_cache = DirectoryCache()
+
+        existing = os.path.join(self._fixture_dir.name, "foo")
+        os.mkdir(existing)
+
+        for new_dir in ("a", "b", "c"):
+            for leaf in ("1.jpg", "2.jpg", "3.jpg"):
+                ensure_dir_for(os.path.join(existing, new_dir, leaf), agent, dir_cache)
+                ensure_dir_for(os.path.join(existing, leaf), agent, dir_cache)
+
+        for new_dir in ("a", "b", "c"):
+            self.assertTrue(os.path.isdir(os.path.join(existing, new_dir)))
+
+        # One for foo, and one for each of a, b, c before they were created.
+        # The fixture dir and its ancestors are implied by foo existing.
+        self.assertEqual(dir_cache.stat_count, 4)
+
+
+class TestDirectoryCache(FixtureDirTestCase):
+    def test_existing_dir_implies_ancestors(self):
+        dir_cache = DirectoryCache()
+        the_dir = os.path.join(self._fixture_dir.name, "foo", "bar")
+        os.makedirs(the_dir)
+
+        self.assertTrue(dir_cache.exists(the_dir))
+        self.assertTrue(dir_cache.exists(os.path.dirname(the_dir)))
+        self.assertTrue(dir_cache.exists(self._fixture_dir.name))
+        self.assertEqual(dir_cache.stat_count, 1)
+
+    def test_missing_dir_is_not_cached(self):
+        dir_cache = DirectoryCache()
+        the_dir = os.path.join(self._fixture_dir.name, "foo")
+
+        self.assertFalse(dir_cache.exists(the_dir))
+        os.mkdir(the_dir)
+        self.assertTrue(dir_cache.exists(the_dir))
+        self.assertEqual(dir_cache.stat_count, 2)
+
+    def test_discard_tree(self):
+        dir_cache = DirectoryCache()
+        parent = os.path.join(self._fixture_dir.name, "foo")
+        child = os.path.join(parent, "bar")
+        sibling = os.path.join(self._fixture_dir.name, "foobar")
+        dir_cache.add(child)
+        dir_cache.add(sibling)
+
+        dir_cache.discard_tree(parent)
+
+        self.assertNotIn(parent, dir_cache)
+        self.assertNotIn(child, dir_cache)
+        self.assertIn(sibling, dir_cache)
+        self.assertIn(self._fixture_dir.name, dir_cache)
+
+    def test_discard_tree_after_readding(self):
+        dir_cache = DirectoryCache()
+        parent = os.path.join(self._fixture_dir.name, "foo")
+        dir_cache.add(os.path.join(parent, "bar", "baz"))
+        dir_cache.discard_tree(os.path.join(parent, "bar"))
+        dir_cache.add(os.path.join(parent, "qux", "quux"))
+
+        dir_cache.discard_tree(parent)
+
+        self.assertNotIn(os.path.join(parent, "qux", "quux"), dir_cache)
+        self.assertNotIn(os.path.join(parent, "bar", "baz"), dir_cache)
+        self.assertIn(self._fixture_dir.name, dir_cache)
+
+        dir_cache.add(os.path.join(parent, "bar"))
+        self.assertIn(parent, dir_cache)
+        self.assertNotIn(os.path.join(parent, "bar", "baz"), dir_cache)
+
+    def test_shared_with_history_agent_rollback(self):
+        dir_cache = DirectoryCache()
+        history = HistoryAgent(Executive(), dir_cache)
+
+        parent = os.path.join(self._fixture_dir.name, "foo")
+        leaf = os.path.join(parent, "bar", "baz.jpg")
+
+        ensure_dir_for(leaf, history, dir_cache)
+        self.assertIn(os.path.dirname(leaf), dir_cache)
+
+        history.rollback()
+
+        self.assertFalse(os.path.exists(parent))
+        self.assertNotIn(parent, dir_cache)
+        self.assertNotIn(os.path.dirname(leaf), dir_cache)
+
+        # The cache must not claim the removed directories still exist
+        ensure_dir_for(leaf, history, dir_cache)
+        self.assertTrue(os.path.isdir(os.path.dirname(leaf)))
+
+    def test_concurrent_add_and_discard(self):
+        dir_cache = DirectoryCache()
+        root = self._fixture_dir.name
+        # Keeps the set large, so discard_tree takes long enough to overlap
+        for n in range(2000):
+            dir_cache.add(os.path.join(root, "static", f"{n}"))
+
+        def churn(thread_index: int):
+            parent = os.path.join(root, f"t{thread_index}")
+            for n in range(300):
+                dir_cache.add(os.path.join(parent, f"{n}"))
+                if n % 10 == 0:
+                    dir_cache.discard_tree(parent)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for future in [executor.submit(churn, index) for index in range(8)]:
+                future.result()
+
+        self.assertIn(os.path.join(root, "static", "1999"), dir_cache)
+
+
+class TestWalkBottomUp(FixtureDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = os.path.join(self._fixture_dir.name, "root")
+        for dir_parts in (("a", "b"), ("c",), ("skip", "d")):
+            os.makedirs(os.path.join(self.root, *dir_parts))
+        for file_parts in (
+            ("x.txt",),
+            ("a", "y.txt"),
+            ("a", "b", "z.jpg"),
+            ("skip", "d", "w.txt"),
+        ):
+            write_file(os.path.join(self.root, *file_parts), b"")
+        os.symlink("a", os.path.join(self.root, "link"))
+
+    def relative(self, paths):
+        return [os.path.relpath(path, self._fixture_dir.name) for path in paths]
+
+    def test_children_before_parents(self):
+        got = self.relative(walk_bottom_up(self.root))
+
+        expect = {
+            os.path.join("root", *parts)
+            for parts in (
+                (),
+                ("x.txt",),
+                ("link",),
+                ("a",),
+                ("a", "y.txt"),
+                ("a", "b"),
+                ("a", "b", "z.jpg"),
+                ("c",),
+                ("skip",),
+                ("skip", "d"),
+                ("skip", "d", "w.txt"),
+            )
+        }
+        self.assertEqual(set(got), expect)
+        self.assertEqual(len(got), len(expect))
+
+        for index, path in enumerate(got):
+            for later_path in got[index + 1 :]:
+                self.assertFalse(
+                    later_path.startswith(path + os.sep),
+                    f"{later_path} came after its ancestor {path}",
+                )
+
+    def test_doesnt_follow_symlinks(self):
+        got = self.relative(walk_bottom_up(self.root))
+        self.assertNotIn(os.path.join("root", "link", "y.txt"), got)
+
+    def test_include(self):
+        got = self.relative(walk_bottom_up(self.root, include=compile_globs(["*.txt"])))
+        self.assertEqual(
+            set(got),
+            {
+                os.path.join("root", "x.txt"),
+                os.path.join("root", "a", "y.txt"),
+                os.path.join("root", "skip", "d", "w.txt"),
+            },
+        )
+
+    def test_exclude_prunes_subtree(self):
+        got = self.relative(walk_bottom_up(self.root, exclude=compile_globs(["skip"])))
+        self.assertFalse(any("skip" in path for path in got))
+        self.assertIn(os.path.join("root", "a", "b", "z.jpg"), got)
+
+    def test_file_root(self):
+        path = os.path.join(self.root, "x.txt")
+        self.assertEqual(list(walk_bottom_up(path)), [path])
+
+    def test_compile_globs(self):
+        self.assertIsNone(compile_globs([]))
+        pattern = compile_globs(["*.jpg", "a?"])
+        self.assertIsNotNone(pattern.match("foo.jpg"))
+        self.assertIsNotNone(pattern.match("ab"))
+        self.assertIsNone(pattern.match("abc"))
+        self.assertIsNone(pattern.match("foo.jpg.txt"))
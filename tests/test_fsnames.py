@@ -0,0 +1,127 @@
+import os.path
+import unicodedata
+
+from pathsub.cli import make_plan
+from pathsub.fsnames import casefold_key, DirectoryListing, FileSystemNames
+from tests.utils_for_testing import FixtureDirTestCase, write_file
+
+
+class CaseInsensitiveNames(FileSystemNames):
+    # Pretends every directory is on a case-insensitive file system
+    def list_dir(self, directory: str) -> DirectoryListing | None:
+        listing = super().list_dir(directory)
+        if listing is not None:
+            listing.key = casefold_key
+        return listing
+
+
+class TestFileSystemNames(FixtureDirTestCase):
+    def test_learns_from_existing_names(self):
+        write_file(self.fixture_path("Name"), b"")
+        nfd = unicodedata.normalize("NFD", "é")
+        write_file(self.fixture_path(nfd), b"")
+
+        fs_names = FileSystemNames()
+        listing = fs_names.list_dir(self._fixture_dir.name)
+
+        self.assertEqual(sorted(listing.names), sorted(["Name", nfd]))
+        # The file system the tests run on is expected to be case- and
+        # normalization-sensitive, and if it weren't, the key would show it
+        if os.path.exists(self.fixture_path("NAME")):
+            self.assertEqual(listing.key("NAME"), listing.key("name"))
+        else:
+            self.assertNotEqual(listing.key("NAME"), listing.key("name"))
+        self.assertEqual(fs_names.scandir_count, 1)
+        # Nothing was created to find out
+        self.assertEqual(len(os.listdir(self._fixture_dir.name)), 2)
+
+    def test_missing_directory(self):
+        fs_names = FileSystemNames()
+        self.assertIsNone(fs_names.list_dir(self.fixture_path("missing")))
+        key = fs_names.key_for_missing(self.fixture_path("missing", "deeper"))
+        self.assertEqual(key("a"), "a")
+
+
+class TestMakePlanWithFileSystem(FixtureDirTestCase):
+    def test_existing_targets(self):
+        for name in ("a1", "b1", "b2", "c1", "c2", "c3"):
+            write_file(self.fixture_path(name), b"")
+        paths = [self.fixture_path(name) for name in ("a1", "b1", "c1", "c2")]
+
+        fs_names = FileSystemNames()
+        plan = make_plan(lambda p: p[:-1] + str(int(p[-1]) + 1), paths, fs_names)
+
+        # b2 exists and isn't moving, c2 is moving out of the way of c1, and
+        # c2's own target c3 is taken
+        self.assertEqual(
+            plan.valid_moves,
+            [
+                (self.fixture_path("a1"), self.fixture_path("a2")),
+                (self.fixture_path("c1"), self.fixture_path("c2")),
+            ],
+        )
+        self.assertEqual(
+            plan.occupied,
+            [
+                (
+                    self.fixture_path("b1"),
+                    self.fixture_path("b2"),
+                    self.fixture_path("b2"),
+                ),
+                (
+                    self.fixture_path("c2"),
+                    self.fixture_path("c3"),
+                    self.fixture_path("c3"),
+                ),
+            ],
+        )
+        self.assertTrue(plan.has_conflicts)
+        self.assertEqual(fs_names.scandir_count, 1)
+
+    def test_names_equal_under_key(self):
+        os.mkdir(self.fixture_path("d"))
+        for name in ("x", "y", "Keep"):
+            write_file(self.fixture_path("d", name), b"")
+
+        paths = [self.fixture_path("d", name) for name in ("x", "y", "Keep")]
+        targets = {"x": "New", "y": "NEW", "Keep": "keep"}
+        plan = make_plan(
+            lambda p: os.path.join(os.path.dirname(p), targets[os.path.basename(p)]),
+            paths,
+            CaseInsensitiveNames(),
+        )
+
+        # Keep -> keep is a change of case, so the existing file is the one
+        # being moved
+        self.assertEqual(
+            plan.valid_moves,
+            [(self.fixture_path("d", "Keep"), self.fixture_path("d", "keep"))],
+        )
+        self.assertEqual(
+            plan.conflicts,
+            [
+                (
+                    [self.fixture_path("d", "x"), self.fixture_path("d", "y")],
+                    self.fixture_path("d", "New"),
+                )
+            ],
+        )
+        self.assertEqual(plan.occupied, [])
+
+    def test_same_directory_spelled_differently(self):
+        os.mkdir(self.fixture_path("d"))
+        write_file(self.fixture_path("d", "a"), b"")
+        write_file(self.fixture_path("d", "b"), b"")
+
+        targets = {
+            "a": self.fixture_path("d", "c"),
+            "b": self.fixture_path("d", ".", "c"),
+        }
+        plan = make_plan(
+            lambda p: targets[os.path.basename(p)],
+            [self.fixture_path("d", "a"), self.fixture_path("d", "b")],
+            FileSystemNames(),
+        )
+
+        self.assertEqual(len(plan.conflicts), 1)
+        self.assertEqual(plan.valid_moves, [])
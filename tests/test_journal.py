@@ -0,0 +1,106 @@
+import contextlib
+import io
+import os.path
+
+from pathsub.agents import Executive, HistoryAgent, Mkdir, Move, Rmdir
+from pathsub.cli import recover
+from pathsub.journal import Journal, JournalError, read_journal
+from tests.utils_for_testing import FixtureDirTestCase, read_file, write_file
+
+
+class TestJournal(FixtureDirTestCase):
+    def test_round_trip(self):
+        journal_path = self.fixture_path("journal")
+        operations = [
+            Mkdir("some dir"),
+            Move("a\nb", "some dir/c\td"),
+            Rmdir("other"),
+            Move(os.fsdecode(b"caf\xe9"), "cafe"),
+        ]
+
+        with Journal(journal_path, sync_interval=2) as journal:
+            for op in operations:
+                journal.record(op)
+
+        contents = read_journal(journal_path)
+        self.assertEqual(contents.operations, operations)
+        self.assertFalse(contents.finished)
+
+    def test_markers(self):
+        committed_path = self.fixture_path("committed")
+        with Journal(committed_path) as journal:
+            journal.record(Move("a", "b"))
+            journal.mark_committed()
+
+        rolled_back_path = self.fixture_path("rolled_back")
+        with Journal(rolled_back_path) as journal:
+            journal.mark_rolled_back()
+
+        self.assertTrue(read_journal(committed_path).committed)
+        self.assertTrue(read_journal(rolled_back_path).rolled_back)
+
+    def test_partial_record_is_ignored(self):
+        journal_path = self.fixture_path("journal")
+        with Journal(journal_path) as journal:
+            journal.record(Move("a", "b"))
+            journal.record(Move("c", "d"))
+
+        with open(journal_path, "r+b") as f:
+            f.truncate(os.path.getsize(journal_path) - 1)
+
+        self.assertEqual(read_journal(journal_path).operations, [Move("a", "b")])
+
+    def test_refuses_existing_file(self):
+        journal_path = self.fixture_path("journal")
+        write_file(journal_path, b"precious")
+        self.assertRaises(FileExistsError, Journal, journal_path)
+        self.assertEqual(read_file(journal_path), b"precious")
+
+    def test_rejects_other_files(self):
+        journal_path = self.fixture_path("journal")
+        write_file(journal_path, b"not a journal")
+        self.assertRaises(JournalError, read_journal, journal_path)
+
+
+class TestRecover(FixtureDirTestCase):
+    def recover_quietly(self, journal_path) -> int:
+        with contextlib.redirect_stderr(io.StringIO()):
+            return recover(journal_path)
+
+    def test_recover_interrupted_run(self):
+        journal_path = self.fixture_path("journal")
+        write_file(self.fixture_path("a"), b"a")
+        write_file(self.fixture_path("b"), b"b")
+
+        journal = Journal(journal_path)
+        history = HistoryAgent(Executive(), journal=journal)
+        history.mkdir(self.fixture_path("dir"))
+        history.move(self.fixture_path("a"), self.fixture_path("dir", "a"))
+        history.move(self.fixture_path("b"), self.fixture_path("dir", "b"))
+        # The process dies after journaling this move but before making it
+        journal.record(Move(self.fixture_path("dir", "a"), self.fixture_path("c")))
+        journal.close()
+
+        self.assertEqual(self.recover_quietly(journal_path), 0)
+
+        self.assertEqual(
+            sorted(os.listdir(self._fixture_dir.name)), ["a", "b", "journal"]
+        )
+        self.assertEqual(read_file(self.fixture_path("a")), b"a")
+        self.assertEqual(read_file(self.fixture_path("b")), b"b")
+        self.assertTrue(read_journal(journal_path).rolled_back)
+
+        # A second recovery has nothing to do
+        self.assertEqual(self.recover_quietly(journal_path), 0)
+
+    def test_recover_finished_run_does_nothing(self):
+        journal_path = self.fixture_path("journal")
+        write_file(self.fixture_path("a"), b"a")
+
+        with Journal(journal_path) as journal:
+            history = HistoryAgent(Executive(), journal=journal)
+            history.move(self.fixture_path("a"), self.fixture_path("b"))
+            journal.mark_committed()
+
+        self.assertEqual(self.recover_quietly(journal_path), 0)
+        self.assertEqual(read_file(self.fixture_path("b")), b"a")
@@ -0,0 +1,120 @@
+import io
+import re
+import time
+import unittest
+
+from pathsub.output import BufferedWriter, ProgressReporter, VerboseReporter
+
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.write_count = 0
+
+    def write(self, s):
+        self.write_count += 1
+        return super().write(s)
+
+
+class TestBufferedWriter(unittest.TestCase):
+    def test_writes_in_chunks(self):
+        stream = CountingStream()
+        writer = BufferedWriter(stream, buffer_size=100)
+
+        for n in range(100):
+            writer.write_line(f"line {n:03}")
+        writer.flush()
+
+        self.assertEqual(
+            stream.getvalue(), "".join(f"line {n:03}\n" for n in range(100))
+        )
+        # 9 characters per line, so a write every 12 lines
+        self.assertLessEqual(stream.write_count, 9)
+
+    def test_nothing_written_until_buffer_full_or_flushed(self):
+        stream = CountingStream()
+        writer = BufferedWriter(stream)
+
+        writer.write_line("hello")
+        self.assertEqual(stream.getvalue(), "")
+
+        writer.flush()
+        self.assertEqual(stream.getvalue(), "hello\n")
+
+        writer.flush()
+        self.assertEqual(stream.write_count, 1)
+
+
+class TestVerboseReporter(unittest.TestCase):
+    def test_move(self):
+        stream = io.StringIO()
+        reporter = VerboseReporter(BufferedWriter(stream))
+
+        reporter.move("a b", "c")
+        reporter.close()
+
+        self.assertEqual(stream.getvalue(), "mv 'a b' c\n")
+
+
+class TestProgressReporter(unittest.TestCase):
+    def wait_for(self, stream: io.StringIO, text: str):
+        deadline = time.monotonic() + 5
+        while text not in stream.getvalue():
+            self.assertLess(time.monotonic(), deadline, f"{text!r} never drawn")
+            time.sleep(0.005)
+
+    def test_redraws_in_place(self):
+        stream = io.StringIO()
+        reporter = ProgressReporter(stream, interval=0.01)
+
+        reporter.move("a", "b")
+        self.wait_for(stream, "\r1 moved")
+        reporter.move("c", "d")
+        self.wait_for(stream, "\r2 moved")
+        reporter.close()
+
+        output = stream.getvalue()
+        self.assertTrue(output.startswith("\r1 moved"))
+        self.assertTrue(output.endswith("\n"))
+        self.assertEqual(output.count("\n"), 1)
+
+    def test_redraws_between_moves(self):
+        # A slow move, such as a large copy, mustn't freeze the display
+        stream = io.StringIO()
+        reporter = ProgressReporter(stream, interval=0.01)
+
+        reporter.move("a", "b")
+        self.wait_for(stream, "\r1 moved")
+        draws = stream.getvalue().count("\r")
+        deadline = time.monotonic() + 5
+        while stream.getvalue().count("\r") <= draws:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.005)
+        reporter.close()
+
+    def test_rate_starts_with_first_move(self):
+        stream = io.StringIO()
+        reporter = ProgressReporter(stream, interval=3600)
+
+        time.sleep(0.2)
+        reporter.move("a", "b")
+        reporter.close()
+
+        rate = int(re.search(r"\((\d+)/s\)", stream.getvalue()).group(1))
+        self.assertGreater(rate, 5)
+
+    def test_limits_redraws(self):
+        stream = CountingStream()
+        reporter = ProgressReporter(stream, interval=3600)
+
+        for _ in range(1000):
+            reporter.move("a", "b")
+        self.assertEqual(stream.write_count, 0)
+
+        reporter.close()
+        self.assertTrue(stream.getvalue().startswith("\r1000 moved"))
+
+    def test_nothing_moved(self):
+        stream = io.StringIO()
+        ProgressReporter(stream).close()
+        self.assertEqual(stream.getvalue(), "")
@@ -0,0 +1,54 @@
+import io
+import os
+import unittest
+
+from pathsub.planio import PlanFormatError, read_plan, write_plan
+
+MOVES = [
+    ("a", "b"),
+    ("dir/with space", "dir/with\nnewline"),
+    (os.fsdecode(b"caf\xe9"), "café"),
+]
+
+
+class TestPlanIO(unittest.TestCase):
+    def round_trip(self, fmt: str, chunk_size: int = 1 << 16):
+        buffer = io.BytesIO()
+        write_plan(MOVES, buffer, fmt)
+        buffer.seek(0)
+        return list(read_plan(buffer, fmt, chunk_size))
+
+    def test_jsonl_round_trip(self):
+        self.assertEqual(self.round_trip("jsonl"), MOVES)
+
+    def test_nul_round_trip(self):
+        self.assertEqual(self.round_trip("nul"), MOVES)
+        self.assertEqual(self.round_trip("nul", chunk_size=3), MOVES)
+
+    def test_jsonl_is_one_move_per_line(self):
+        buffer = io.BytesIO()
+        write_plan(MOVES, buffer, "jsonl")
+        self.assertEqual(buffer.getvalue().count(b"\n"), len(MOVES) + 1)
+
+    def test_read_is_lazy(self):
+        buffer = io.BytesIO()
+        write_plan(MOVES * 1000, buffer, "nul")
+        buffer.seek(0)
+        moves = read_plan(buffer, "nul", chunk_size=16)
+        self.assertEqual(next(moves), MOVES[0])
+        self.assertLess(buffer.tell(), 100)
+
+    def test_jsonl_rejects_other_files(self):
+        buffer = io.BytesIO(b'{"src": "a", "dest": "b"}\n')
+        self.assertRaises(PlanFormatError, list, read_plan(buffer, "jsonl"))
+
+    def test_jsonl_rejects_bad_lines(self):
+        buffer = io.BytesIO()
+        write_plan(MOVES, buffer, "jsonl")
+        buffer.write(b'{"src": "a"}\n')
+        buffer.seek(0)
+        self.assertRaises(PlanFormatError, list, read_plan(buffer, "jsonl"))
+
+    def test_nul_rejects_incomplete_move(self):
+        buffer = io.BytesIO(b"a\0b\0c\0")
+        self.assertRaises(PlanFormatError, list, read_plan(buffer, "nul"))
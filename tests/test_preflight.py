@@ -0,0 +1,67 @@
+import os
+import unittest
+
+from pathsub.fsnames import FileSystemNames
+from pathsub.preflight import check_moves, Problem
+from tests.utils_for_testing import FixtureDirTestCase, write_file
+
+
+class TestCheckMoves(FixtureDirTestCase):
+    def test_no_problems(self):
+        for name in ("a", "b", "c"):
+            write_file(self.fixture_path(name), b"")
+        # A cycle broken with a temporary name, plus a move into a new
+        # directory
+        temp = self.fixture_path("temp")
+        moves = [
+            (self.fixture_path("a"), temp),
+            (self.fixture_path("b"), self.fixture_path("a")),
+            (temp, self.fixture_path("b")),
+            (self.fixture_path("c"), self.fixture_path("new", "deeper", "c")),
+        ]
+
+        self.assertEqual(check_moves(moves), [])
+
+    def test_problems(self):
+        write_file(self.fixture_path("a"), b"")
+        write_file(self.fixture_path("b"), b"")
+        moves = [
+            (self.fixture_path("a"), self.fixture_path("b")),
+            (self.fixture_path("missing"), self.fixture_path("c")),
+        ]
+
+        self.assertEqual(
+            check_moves(moves),
+            [
+                Problem(self.fixture_path("missing"), "doesn't exist"),
+                Problem(self.fixture_path("b"), "already exists"),
+            ],
+        )
+
+    def test_lists_each_directory_once(self):
+        os.mkdir(self.fixture_path("d"))
+        moves = []
+        for n in range(10):
+            write_file(self.fixture_path("d", f"{n}"), b"")
+            moves.append((self.fixture_path("d", f"{n}"), self.fixture_path(f"{n}")))
+
+        fs_names = FileSystemNames()
+        self.assertEqual(check_moves(moves, fs_names), [])
+        self.assertEqual(fs_names.scandir_count, 2)
+
+    @unittest.skipIf(
+        not hasattr(os, "geteuid") or os.geteuid() == 0,
+        "root can write to read-only directories",
+    )
+    def test_unwritable_directory(self):
+        os.mkdir(self.fixture_path("d"))
+        write_file(self.fixture_path("d", "a"), b"")
+        os.chmod(self.fixture_path("d"), 0o555)
+        try:
+            problems = check_moves(
+                [(self.fixture_path("d", "a"), self.fixture_path("b"))]
+            )
+        finally:
+            os.chmod(self.fixture_path("d"), 0o755)
+
+        self.assertEqual(problems, [Problem(self.fixture_path("d"), "isn't writable")])
@@ -0,0 +1,133 @@
+import os.path
+import re
+import unittest
+
+from pathsub.rules import (
+    compile_rules,
+    load_rules,
+    make_literal_sub,
+    make_pattern,
+    parse_rules,
+    Rule,
+    RulesError,
+)
+from tests.utils_for_testing import FixtureDirTestCase, write_file
+
+
+class TestParseRules(unittest.TestCase):
+    def test_parse(self):
+        rules = parse_rules(
+            [
+                {"search": "a", "replace": "b"},
+                {"search": "c", "replace": "d", "flags": "il", "scope": "basename"},
+            ]
+        )
+        self.assertEqual(
+            rules,
+            [
+                Rule("a", "b"),
+                Rule("c", "d", literal=True, ignore_case=True, basename=True),
+            ],
+        )
+
+    def test_invalid(self):
+        for data in [
+            {"search": "a", "replace": "b"},
+            [{"search": "a"}],
+            [{"search": "a", "replace": 1}],
+            [{"search": "a", "replace": "b", "flags": "x"}],
+            [{"search": "a", "replace": "b", "scope": "dir"}],
+            ["a"],
+        ]:
+            with self.subTest(data=data), self.assertRaises(RulesError):
+                parse_rules(data)
+
+
+class TestMakeLiteralSub(unittest.TestCase):
+    def assert_same_as_regex(self, needle, repl, subjects):
+        for ignore_case in (False, True):
+            pattern = make_pattern(needle, True, ignore_case)
+            sub = make_literal_sub(needle, repl, ignore_case)
+            for subject in subjects:
+                with self.subTest(needle=needle, subject=subject, i=ignore_case):
+                    expected = pattern.sub(repl, subject)
+                    if pattern.search(subject) is None:
+                        self.assertIsNone(sub(subject))
+                    else:
+                        self.assertEqual(sub(subject), expected)
+
+    def test_same_as_regex(self):
+        subjects = [
+            "",
+            "nothing here",
+            "a.b/a.b.c",
+            "A.B/a.bA.B",
+            "aa.bb",
+            "a.b\u212a",
+            "\u0130a.b",
+        ]
+        self.assert_same_as_regex("a.b", "x", subjects)
+        self.assert_same_as_regex("a.b", "[\\g<0>]", subjects)
+        self.assert_same_as_regex("a.b", "\\t", subjects)
+        self.assert_same_as_regex("", "-", subjects)
+
+    def test_non_ascii(self):
+        subjects = ["K", "k", "\u212a", "Ökö", "ök"]
+        self.assert_same_as_regex("k", "x", subjects)
+        self.assert_same_as_regex("ö", "o", subjects)
+
+    def test_group_reference_rejected(self):
+        with self.assertRaises(re.error):
+            make_literal_sub("a", "\\1", False)
+
+
+class TestCompileRules(unittest.TestCase):
+    def test_single_rule(self):
+        map_path = compile_rules([Rule("(a)", r"\1\1")])
+        self.assertEqual(map_path("dir/abc"), "dir/aabc")
+
+    def test_rules_applied_in_order(self):
+        map_path = compile_rules(
+            [
+                Rule(" ", "_", literal=True),
+                Rule("_+", "-"),
+                Rule(r"\.JPEG$", ".jpg", ignore_case=True, basename=True),
+            ]
+        )
+        self.assertEqual(map_path("my dir/a  b.jpeg"), "my-dir/a-b.jpg")
+        self.assertIsNone(map_path("plain/name.txt"))
+
+    def test_later_rule_matches_earlier_output(self):
+        # Rule 2 doesn't match the input "ab", only rule 1's output "bb", so
+        # the alternation prefilter, which only sees the input, must still
+        # let rule 2 be tried on rule 1's output
+        map_path = compile_rules([Rule("a", "b"), Rule("bb", "X")])
+        self.assertEqual(map_path("ab"), "X")
+
+    def test_rules_with_groups_and_inline_flags(self):
+        map_path = compile_rules(
+            [
+                Rule(r"(\d+)-(\d+)", r"\2-\1"),
+                Rule("(?x) f o o", "bar"),
+                Rule("q", "Q", ignore_case=True),
+            ]
+        )
+        self.assertEqual(map_path("1-2"), "2-1")
+        self.assertEqual(map_path("foo"), "bar")
+        self.assertEqual(map_path("xQz"), "xQz")
+        self.assertIsNone(map_path("xyz"))
+        self.assertEqual(map_path("xqz"), "xQz")
+        self.assertIsNone(map_path("f o o"))
+
+    def test_basename_scope(self):
+        map_path = compile_rules([Rule("d", "x", basename=True), Rule("z", "y")])
+        self.assertEqual(map_path("d/d"), "d/x")
+        self.assertIsNone(map_path("d/a"))
+
+
+class TestLoadRules(FixtureDirTestCase):
+    def test_invalid_json(self):
+        path = os.path.join(self._fixture_dir.name, "rules.json")
+        write_file(path, b"[")
+        with self.assertRaises(RulesError):
+            load_rules(path)
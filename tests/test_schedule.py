@@ -0,0 +1,194 @@
+import os.path
+import unittest
+
+from pathsub.schedule import (
+    generate_temp_name,
+    is_temp_name,
+    partition_moves,
+    schedule_moves,
+    ScheduleError,
+)
+
+
+def simulate(initial: set[str], moves: list[tuple[str, str]]) -> dict[str, str]:
+    # Applies moves to an imaginary file system, failing as a no-clobber
+    # move would. Returns a mapping of final name to original name.
+    contents = {name: name for name in initial}
+    for src, dest in moves:
+        assert src in contents, f"{src} does not exist"
+        assert dest not in contents, f"{dest} already exists"
+        contents[dest] = contents.pop(src)
+    return contents
+
+
+class TestScheduleMoves(unittest.TestCase):
+    def test_independent_moves_keep_order(self):
+        moves = [("a", "x"), ("b", "y"), ("c", "z")]
+        schedule = schedule_moves(moves)
+        self.assertEqual(schedule.moves, moves)
+        self.assertEqual(schedule.extra_renames, 0)
+
+    def test_independent_moves_keep_order_around_chains(self):
+        moves = [("d/x", "d/y"), ("d", "e"), ("b", "c"), ("a", "b"), ("f/x", "f/y")]
+        schedule = schedule_moves(moves)
+        self.assertEqual(
+            schedule.moves,
+            [("d/x", "d/y"), ("d", "e"), ("b", "c"), ("a", "b"), ("f/x", "f/y")],
+        )
+
+    def test_chain(self):
+        moves = [("a", "b"), ("b", "c"), ("c", "d")]
+        schedule = schedule_moves(moves)
+        self.assertEqual(schedule.moves, [("c", "d"), ("b", "c"), ("a", "b")])
+        self.assertEqual(schedule.extra_renames, 0)
+
+    def test_chain_listed_out_of_order(self):
+        moves = [("b", "c"), ("x", "y"), ("a", "b")]
+        schedule = schedule_moves(moves)
+        self.assertEqual(schedule.extra_renames, 0)
+        self.assertEqual(
+            simulate({"a", "b", "x"}, schedule.moves),
+            {"b": "a", "c": "b", "y": "x"},
+        )
+
+    def test_swap(self):
+        moves = [("a", "b"), ("b", "a")]
+        schedule = schedule_moves(moves)
+        self.assertEqual(schedule.extra_renames, 1)
+        self.assertEqual(len(schedule.moves), 3)
+        self.assertEqual(simulate({"a", "b"}, schedule.moves), {"b": "a", "a": "b"})
+
+    def test_one_temp_name_per_cycle(self):
+        moves = [
+            ("a", "b"),
+            ("b", "c"),
+            ("c", "a"),
+            ("x", "y"),
+            ("y", "x"),
+            ("p", "q"),
+        ]
+        schedule = schedule_moves(moves)
+        self.assertEqual(schedule.extra_renames, 2)
+        self.assertEqual(len(schedule.moves), len(moves) + 2)
+        self.assertEqual(
+            simulate({"a", "b", "c", "x", "y", "p"}, schedule.moves),
+            {"b": "a", "c": "b", "a": "c", "y": "x", "x": "y", "q": "p"},
+        )
+
+    def test_cycle_inside_moved_directory(self):
+        # A directory's contents come before it, and must still be moved
+        # first when they form a cycle
+        moves = [("d12/f12", "d12/f21"), ("d12/f21", "d12/f12"), ("d12", "d21")]
+        schedule = schedule_moves(moves)
+        self.assertEqual(schedule.extra_renames, 1)
+        self.assertEqual(schedule.moves[-1], ("d12", "d21"))
+        self.assertEqual(
+            simulate({"d12/f12", "d12/f21"}, schedule.moves[:-1]),
+            {"d12/f21": "d12/f12", "d12/f12": "d12/f21"},
+        )
+
+    def test_temp_name_is_beside_source(self):
+        moves = [(os.path.join("d", "a"), "b"), ("b", os.path.join("d", "a"))]
+        schedule = schedule_moves(moves)
+        temp_src, temp_dest = schedule.moves[0]
+        self.assertEqual(os.path.dirname(temp_dest), os.path.dirname(temp_src))
+
+    def test_rejects_duplicate_sources(self):
+        self.assertRaises(ScheduleError, schedule_moves, [("a", "b"), ("a", "c")])
+
+    def test_rejects_duplicate_targets(self):
+        self.assertRaises(ScheduleError, schedule_moves, [("a", "c"), ("b", "c")])
+
+    def test_unchanged_paths_are_ignored(self):
+        schedule = schedule_moves([("a", "a")])
+        self.assertEqual(schedule.moves, [])
+        self.assertEqual(schedule.extra_renames, 0)
+
+
+def j(*parts: str) -> str:
+    return os.path.join(*parts)
+
+
+class TestPartitionMoves(unittest.TestCase):
+    def test_separate_directories(self):
+        moves = [
+            (j("a", "1"), j("a", "2")),
+            (j("b", "1"), j("b", "2")),
+            (j("a", "3"), j("a", "4")),
+        ]
+        groups = partition_moves(moves)
+        self.assertEqual(
+            groups,
+            [
+                [(j("a", "1"), j("a", "2")), (j("a", "3"), j("a", "4"))],
+                [(j("b", "1"), j("b", "2"))],
+            ],
+        )
+
+    def test_shared_target_directory(self):
+        moves = [
+            (j("a", "1"), j("c", "1")),
+            (j("b", "1"), j("c", "2")),
+            (j("d", "1"), j("d", "2")),
+        ]
+        groups = partition_moves(moves)
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(groups[0], moves[:2])
+
+    def test_chain_across_directories(self):
+        moves = [
+            (j("b", "1"), j("c", "1")),
+            (j("a", "1"), j("b", "1")),
+        ]
+        self.assertEqual(partition_moves(moves), [moves])
+
+    def test_directory_grouped_with_descendants(self):
+        moves = [
+            (j("a", "x", "y", "1"), j("a", "x", "y", "2")),
+            (j("a", "x"), j("a", "z")),
+            (j("b", "1"), j("b", "2")),
+        ]
+        groups = partition_moves(moves)
+        self.assertEqual(groups, [moves[:2], moves[2:]])
+
+    def test_preserves_order_within_group(self):
+        moves = [(j("a", str(n)), j("a", str(n + 1))) for n in range(10, 0, -1)]
+        self.assertEqual(partition_moves(moves), [moves])
+
+
+class TestGenerateTempName(unittest.TestCase):
+    def test_generate_temp_name_without_sep_without_dot(self):
+        subject = "foo"
+        got = generate_temp_name(subject)
+        self.assertRegex(got, r"^foo__submv\w+$")
+
+    def test_generate_temp_name_without_sep_with_dot(self):
+        subject = "foo.txt"
+        got = generate_temp_name(subject)
+        self.assertRegex(got, r"^foo__submv\w+\.txt$")
+
+    def test_generate_temp_name_without_sep_hidden(self):
+        subject = ".foo"
+        got = generate_temp_name(subject)
+        self.assertRegex(got, r"^\.foo__submv\w+$")
+
+    def test_generate_temp_name_with_sep_without_dot(self):
+        subject = os.path.join("foo", "bar")
+        got = generate_temp_name(subject)
+        self.assertRegex(got, rf"^foo{os.sep}bar__submv\w+$")
+
+    def test_generate_temp_name_with_sep_with_dot(self):
+        subject = os.path.join("foo", "bar.txt")
+        got = generate_temp_name(subject)
+        self.assertRegex(got, rf"^foo{os.sep}bar__submv\w+\.txt$")
+
+    def test_generate_temp_name_with_sep_hidden(self):
+        subject = os.path.join("foo", ".bar")
+        got = generate_temp_name(subject)
+        self.assertRegex(got, rf"^foo{os.sep}\.bar__submv\w+$")
+
+    def test_is_temp_name(self):
+        self.assertTrue(is_temp_name(generate_temp_name(os.path.join("foo", "bar"))))
+        self.assertTrue(is_temp_name(generate_temp_name(".bar.txt")))
+        self.assertFalse(is_temp_name("bar.txt"))
+        self.assertFalse(is_temp_name(os.path.join("foo__submvAAAAAAAA", "bar")))
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+_PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+# Only needed by some options, or when something goes wrong, so importing
+# the CLI shouldn't import them
+DEFERRED_MODULES = {
+    "argparse",
+    "base64",
+    "concurrent.futures",
+    "json",
+    "random",
+    "secrets",
+    "shutil",
+    "traceback",
+    "unicodedata",
+    "pathsub.compactplan",
+    "pathsub.copy",
+    "pathsub.fsnames",
+    "pathsub.journal",
+    "pathsub.preflight",
+    "pathsub.undo",
+}
+
+# Generous, so as not to fail on a slow or busy machine, but low enough to
+# catch something like a large library being imported by accident
+IMPORT_TIME_LIMIT_US = 500_000
+
+
+def import_times(module: str) -> dict[str, int]:
+    # Imports module in a fresh interpreter, and returns the cumulative time
+    # in microseconds that -X importtime reports for each module imported.
+    # A module can be listed again after its import, as a leaf taking no
+    # time, so only the first line for each is kept.
+    env = dict(os.environ, PYTHONPATH=str(_PROJECT_DIR))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times.setdefault(name.strip(), int(cumulative))
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    def test_cli_import_defers_modules(self):
+        imported = set(import_times("pathsub.cli"))
+        self.assertEqual(imported & DEFERRED_MODULES, set())
+
+    def test_package_import_is_light(self):
+        imported = set(import_times("pathsub"))
+        self.assertNotIn("pathsub.api", imported)
+        self.assertNotIn("pathsub.cli", imported)
+
+    def test_cli_import_time(self):
+        # The first import may compile the package, so the second is timed
+        import_times("pathsub.cli")
+        times = import_times("pathsub.cli")
+        self.assertLess(times["pathsub.cli"], IMPORT_TIME_LIMIT_US)
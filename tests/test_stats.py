@@ -0,0 +1,64 @@
+import os
+import unittest
+
+from pathsub.agents import Executive, HistoryAgent
+from pathsub.schedule import generate_temp_name
+from pathsub.stats import InstrumentedAgent, LatencyHistogram, Stats
+from tests.utils_for_testing import FixtureDirTestCase, write_file
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_buckets(self):
+        histogram = LatencyHistogram()
+        for seconds in (0.0, 0.000001, 0.000003, 0.000004, 0.000005, 0.25):
+            histogram.add(seconds)
+
+        self.assertEqual(histogram.count, 6)
+        self.assertEqual(histogram.max, 0.25)
+        self.assertEqual(
+            histogram.to_dict()["histogram_us"],
+            {"1": 2, "4": 2, "8": 1, "262144": 1},
+        )
+
+
+class TestStats(unittest.TestCase):
+    def test_phases_and_hooks(self):
+        stats = Stats()
+        events = []
+        stats.add_hook(lambda kind, name, seconds: events.append((kind, name)))
+
+        with stats.phase("plan"):
+            pass
+        with stats.phase("plan"):
+            pass
+        stats.record_operation("move", 0.001)
+        timed = stats.time_calls("map", str.upper)
+
+        self.assertEqual(timed("a"), "A")
+        self.assertEqual(
+            events, [("phase", "plan"), ("phase", "plan"), ("operation", "move")]
+        )
+        self.assertEqual(set(stats.to_dict()["phases"]), {"plan", "map"})
+        self.assertEqual(stats.to_dict()["counts"], {"move": 1})
+
+
+class TestInstrumentedAgent(FixtureDirTestCase):
+    def test_counts_operations(self):
+        write_file(self.fixture_path("a"), b"")
+        write_file(self.fixture_path("b"), b"")
+        temp = generate_temp_name(self.fixture_path("a"))
+        stats = Stats()
+        history = HistoryAgent(InstrumentedAgent(Executive(), stats))
+
+        history.mkdir(self.fixture_path("d"))
+        history.move(self.fixture_path("a"), temp)
+        history.move(self.fixture_path("b"), self.fixture_path("a"))
+        history.move(temp, self.fixture_path("b"))
+        history.rollback()
+
+        self.assertEqual(
+            stats.to_dict()["counts"],
+            {"mkdir": 1, "move": 2, "temp_move": 4, "rmdir": 1},
+        )
+        self.assertEqual(stats.latencies["temp_move"].count, 4)
+        self.assertFalse(os.path.exists(self.fixture_path("d")))
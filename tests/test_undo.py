@@ -0,0 +1,52 @@
+import os
+
+from pathsub.agents import Move
+from pathsub.journal import Journal
+from pathsub.undo import find_undo_log, new_undo_log_path, UndoError
+from tests.utils_for_testing import FixtureDirTestCase
+
+
+class TestFindUndoLog(FixtureDirTestCase):
+    def write_log(self, run_id: str, committed: bool, rolled_back: bool = False):
+        with Journal(self.fixture_path(f"{run_id}.journal")) as journal:
+            journal.record(Move(f"{run_id}-a", f"{run_id}-b"))
+            if committed:
+                journal.mark_committed()
+            if rolled_back:
+                journal.mark_rolled_back()
+
+    def test_latest(self):
+        self.write_log("20240101-000000-aaaaaa", committed=True)
+        self.write_log("20240102-000000-aaaaaa", committed=True)
+        self.write_log("20240103-000000-aaaaaa", committed=True, rolled_back=True)
+        self.write_log("20240104-000000-aaaaaa", committed=False)
+
+        undo_log = find_undo_log(self._fixture_dir.name)
+
+        self.assertEqual(undo_log.run_id, "20240102-000000-aaaaaa")
+        self.assertEqual(
+            undo_log.contents.operations,
+            [Move("20240102-000000-aaaaaa-a", "20240102-000000-aaaaaa-b")],
+        )
+
+    def test_by_id(self):
+        self.write_log("first", committed=True)
+        self.write_log("second", committed=True)
+        self.write_log("undone", committed=True, rolled_back=True)
+        self.write_log("interrupted", committed=False)
+
+        self.assertEqual(find_undo_log(self._fixture_dir.name, "first").run_id, "first")
+        for run_id in ("undone", "interrupted", "missing", "", "../first"):
+            with self.subTest(run_id=run_id):
+                with self.assertRaises(UndoError):
+                    find_undo_log(self._fixture_dir.name, run_id)
+
+    def test_nothing_to_undo(self):
+        with self.assertRaises(UndoError):
+            find_undo_log(self.fixture_path("missing"))
+
+    def test_new_run_ids_are_unique(self):
+        directory = self.fixture_path("state")
+        paths = {new_undo_log_path(directory)[1] for _ in range(100)}
+        self.assertEqual(len(paths), 100)
+        self.assertTrue(os.path.isdir(directory))
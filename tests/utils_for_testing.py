@@ -1,3 +1,4 @@
+import os
 import unittest
 from pathlib import Path
 from tempfile import TemporaryDirectory
@@ -32,6 +33,10 @@ class FixtureDirTestCase(unittest.TestCase):
         assert self._fixture_dir is None
         self._fixture_dir = make_temp_fixtures_dir()
 
+    def fixture_path(self, *parts: str) -> str:
+        assert self._fixture_dir is not None
+        return os.path.join(self._fixture_dir.name, *parts)
+
     def tearDown(self):
         assert self._fixture_dir is not None
         self._fixture_dir.cleanup()